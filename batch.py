@@ -0,0 +1,422 @@
+"""Fetch, warm or export the zmanim of many locations over a date range, from the command line
+
+    python batch.py fetch --cities all --start 2026-01-01 --end 2026-12-31
+    python batch.py warm --config config.yaml --zip-codes 11213 10001 --start 2026-01-01 --end 2026-12-31 --rate 5
+    python batch.py export --coordinates towns.csv --start 2026-01-01 --end 2026-03-31 --output zmanim.jsonl
+
+Commands:
+    fetch   get and parse every day (the whole ZmanimAPI path), nothing is written
+    warm    only get the chabad.org responses, to fill the cache of the chabadApi config section (e.g. a DiskCache)
+    export  write every day as a JSON line: {"location", "date", "holiday", "parsha", "zmanim": {name: time}},
+            with --utc also "utc": {name: UTC epoch seconds} (see zman_times.py)
+
+Locations:
+    --cities       Cities member names (e.g. JERUSALEM TEL_AVIV) or "all"
+    --coordinates  CSV file with lat, lon, time_zone and name columns, time_zone is a TimeZones member name
+                   (e.g. JERUSALEM) or an IANA name (e.g. America/New_York)
+    --zip-codes    US ZIP codes, resolved offline, or by chabad.org without a ZIP code index (see zip_codes.py),
+                   export --utc needs the index for their time zones
+
+The work is split to units of a location and up to ZmanimAPI.WINDOW_DAYS days, run by --workers threads.
+With --checkpoint, finished units are saved to a JSON file, running the same command again skips them
+(export appends to --output then). Failed units are reported and not saved, so a rerun retries them.
+The checkpoint also keeps the size of --output after the lines of its units, a rerun first cuts off the lines
+written after the last save, so an interrupted export is resumed without duplicate lines.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Optional, TextIO
+import yaml
+import zip_codes
+from chabad_org_wrapper import ChabadAPI, Location, ZmanimRequest
+from locations import Cities, Coordinates, TimeZones
+from rate_limiter import TokenBucket
+from resilience import LatencyTracker
+from zman_times import MISSING, ZmanTimes
+from zmanim_api import ZmanimAPI
+
+FETCH = "fetch"
+WARM = "warm"
+EXPORT = "export"
+
+
+class Unit:
+    """A location and a range of up to ZmanimAPI.WINDOW_DAYS days"""
+
+    def __init__(self, label: str, location: Location, start: date, end: date):
+        self.label = label
+        self.location = location
+        self.start = start
+        self.end = end
+
+    @property
+    def key(self) -> str:
+        return f"{self.label}|{self.start.isoformat()}|{self.end.isoformat()}"
+
+
+def load_locations(args: argparse.Namespace) -> list[tuple[str, Location]]:
+    """The (label, location) pairs of the command line, the label identifies the location in checkpoints and exports"""
+    locations = []
+    if args.cities:
+        names = (
+            [city.name for city in Cities] if args.cities == ["all"] else args.cities
+        )
+        for name in names:
+            if name not in Cities.__members__:
+                raise ValueError(f"Unknown city: {name}")
+            locations.append((f"city:{name}", Location.for_city(Cities[name].value)))
+
+    if args.coordinates:
+        with open(args.coordinates, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                zone = row["time_zone"].strip()
+                time_zone = (
+                    zip_codes.time_zone_from_iana(zone)
+                    if "/" in zone
+                    else TimeZones[zone].value
+                )
+                coordinates = Coordinates(
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    time_zone=time_zone,
+                    custom_name=row.get("name") or f"{row['lat']},{row['lon']}",
+                )
+                locations.append(
+                    (
+                        f"coords:{coordinates.lat},{coordinates.lon},{time_zone.name}",
+                        Location.for_coordinates(coordinates),
+                    )
+                )
+
+    for zip_code in args.zip_codes or []:
+        locations.append(
+            (
+                f"zip:{zip_codes.normalize_zip_code(zip_code):05d}",
+                zip_codes.to_location(zip_code),
+            )
+        )
+
+    return locations
+
+
+def make_units(
+    locations: list[tuple[str, Location]], start: date, end: date
+) -> list[Unit]:
+    units = []
+    for label, location in locations:
+        unit_start = start
+        while unit_start <= end:
+            unit_end = min(end, unit_start + timedelta(days=ZmanimAPI.WINDOW_DAYS - 1))
+            units.append(Unit(label, location, unit_start, unit_end))
+            unit_start = unit_end + timedelta(days=1)
+    return units
+
+
+class Checkpoint:
+    """The keys of the finished units and the size of the export output with their lines,
+    saved atomically (write and rename) at most every interval seconds
+    """
+
+    def __init__(self, path: Optional[str], job: dict, interval: float = 5.0):
+        self.path = path
+        self.job = job
+        self.interval = interval
+        self.done: set[str] = set()
+        self.output_size: Optional[int] = None
+        self._saved = time.monotonic()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("job") != job:
+                raise ValueError(
+                    f"The checkpoint {path} is of another job ({data.get('job')}), remove it or use another path"
+                )
+            self.done = set(data["done"])
+            self.output_size = data.get("output_size")
+
+    def add(
+        self,
+        key: str,
+        output: Optional[TextIO] = None,
+        lines: Optional[list[str]] = None,
+    ) -> None:
+        """Mark a unit finished, after writing its lines to output, so a saved checkpoint never misses the
+        unit of a line before output_size or has a unit whose lines are after it
+        """
+        with self._lock:
+            if output is not None:
+                if lines:
+                    output.write("\n".join(lines) + "\n")
+                    output.flush()
+                self.output_size = output.tell() if output.seekable() else None
+            self.done.add(key)
+            if time.monotonic() - self._saved >= self.interval:
+                self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "job": self.job,
+                    "done": sorted(self.done),
+                    "output_size": self.output_size,
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+        self._saved = time.monotonic()
+
+
+def run_unit(command: str, unit: Unit, utc: bool = False) -> tuple[int, list[str]]:
+    """Run a unit, returns the number of days and the export lines"""
+    if command == WARM:
+        request = ZmanimRequest.trusted(
+            location=unit.location, start_date=unit.start, end_date=unit.end
+        )
+        return len(ZmanimAPI.chabad_api.get_zmanim(request)["Days"]), []
+
+    zmanim_days = list(
+        ZmanimAPI.iter_zmanim(unit.location, unit.start, unit.end, prefetch=False)
+    )
+    if command != EXPORT:
+        return len(zmanim_days), []
+
+    times = ZmanTimes(zmanim_days, ZmanimAPI.time_zone(unit.location)) if utc else None
+    lines = []
+    for zmanim_day in zmanim_days:
+        line = {
+            "location": unit.label,
+            "date": zmanim_day.day.date.isoformat(),
+            "holiday": zmanim_day.day.holiday_name,
+            "parsha": zmanim_day.day.parsha,
+            "zmanim": {name: zman.time for name, zman in zmanim_day.zmanim.items()},
+        }
+        if times is not None:
+            i = (zmanim_day.day.date - times.start).days
+            line["utc"] = {
+                name: column[i]
+                for name, column in times.columns().items()
+                if column[i] != MISSING
+            }
+        lines.append(json.dumps(line, ensure_ascii=False))
+    return len(zmanim_days), lines
+
+
+def run(
+    command: str,
+    units: list[Unit],
+    workers: int,
+    checkpoint: Checkpoint,
+    output: Optional[TextIO] = None,
+    progress: bool = True,
+    utc: bool = False,
+) -> dict:
+    """Run the units not in the checkpoint, returns the summary counters and latencies"""
+    pending = [unit for unit in units if unit.key not in checkpoint.done]
+    latencies = LatencyTracker(window=len(pending) or 1)
+    summary = {
+        "units": len(units),
+        "skipped": len(units) - len(pending),
+        "done": 0,
+        "failed": 0,
+        "days": 0,
+    }
+
+    def timed(unit: Unit) -> int:
+        start = time.monotonic()
+        days, lines = run_unit(command, unit, utc)
+        # the lines are written with the checkpoint entry of the unit
+        checkpoint.add(unit.key, output, lines)
+        latencies.record(time.monotonic() - start)
+        return days
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="batch"
+        ) as executor:
+            futures = {executor.submit(timed, unit): unit for unit in pending}
+            for future in as_completed(futures):
+                unit = futures[future]
+                try:
+                    summary["days"] += future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"failed {unit.key}: {e!r}", file=sys.stderr)
+                    continue
+                summary["done"] += 1
+                if progress:
+                    finished = summary["done"] + summary["failed"]
+                    print(
+                        f"\r{finished}/{len(pending)} units",
+                        end="",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+    finally:
+        checkpoint.save()
+        if progress and pending:
+            print(file=sys.stderr)
+
+    summary["elapsed"] = time.monotonic() - started
+    summary["latency"] = {
+        name: latencies.percentile(p)
+        for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+    }
+    return summary
+
+
+def print_summary(summary: dict, api: ChabadAPI) -> None:
+    elapsed = summary["elapsed"]
+    print(
+        f"units: {summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped (checkpoint) "
+        f"of {summary['units']}",
+        file=sys.stderr,
+    )
+    print(
+        f"days: {summary['days']} in {elapsed:.2f}s, {summary['days'] / elapsed if elapsed else 0:.0f} days/s, "
+        f"{summary['done'] / elapsed if elapsed else 0:.1f} units/s",
+        file=sys.stderr,
+    )
+    if summary["latency"]["max"] is not None:
+        print(
+            "unit latency: "
+            + ", ".join(
+                f"{name} {seconds * 1000:.0f}ms"
+                for name, seconds in summary["latency"].items()
+            ),
+            file=sys.stderr,
+        )
+    print(f"chabad.org: {dict(api.stats)}", file=sys.stderr)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=(FETCH, WARM, EXPORT))
+    parser.add_argument("--cities", nargs="+", help='Cities member names, or "all"')
+    parser.add_argument(
+        "--coordinates", help="CSV file with lat, lon, time_zone and name columns"
+    )
+    parser.add_argument("--zip-codes", nargs="+", help="US ZIP codes")
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, required=True)
+    parser.add_argument(
+        "--workers", type=int, default=8, help="units run at once (default 8)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="chabad.org requests per second, shared by the workers",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        help="requests allowed at once above --rate (default --rate)",
+    )
+    parser.add_argument(
+        "--config",
+        help="config.yaml, its chabadApi section configures the client and its cache",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="JSON file of the finished units, to resume an interrupted run",
+    )
+    parser.add_argument("--output", help="export: JSON lines file, defaults to stdout")
+    parser.add_argument(
+        "--utc", action="store_true", help="export: add the zmanim as UTC epoch seconds"
+    )
+    parser.add_argument("--quiet", action="store_true", help="no progress line")
+    args = parser.parse_args(argv)
+
+    if args.end < args.start:
+        parser.error("--end must not be before --start")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        locations = load_locations(args)
+    except (ValueError, KeyError, OSError) as e:
+        parser.error(f"invalid locations: {e}")
+    if not locations:
+        parser.error("no locations, use --cities, --coordinates or --zip-codes")
+
+    api_config = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            api_config = (yaml.safe_load(f) or {}).get("chabadApi") or {}
+    api = ChabadAPI.from_config(api_config)
+    if args.rate:
+        api.rate_limiter = TokenBucket(
+            rate=args.rate, burst=args.burst or max(1, int(args.rate))
+        )
+    if args.command == WARM and api.cache is None and api.range_cache is None:
+        parser.error(
+            "warm needs a cache or rangeCache in the chabadApi section of --config"
+        )
+    ZmanimAPI.chabad_api = api
+
+    job = {
+        "command": args.command,
+        "start": args.start.isoformat(),
+        "end": args.end.isoformat(),
+        "utc": args.utc,
+    }
+    try:
+        checkpoint = Checkpoint(args.checkpoint, job)
+    except ValueError as e:
+        parser.error(str(e))
+
+    units = make_units(locations, args.start, args.end)
+    output = None
+    if args.command == EXPORT:
+        # resuming appends the units that were not exported yet, after the lines of the checkpoint's units
+        output = (
+            open(args.output, "a" if checkpoint.done else "w", encoding="utf-8")
+            if args.output
+            else sys.stdout
+        )
+        if (
+            output is not sys.stdout
+            and checkpoint.output_size is not None
+            and checkpoint.output_size < os.path.getsize(args.output)
+        ):
+            output.truncate(checkpoint.output_size)
+    try:
+        summary = run(
+            args.command,
+            units,
+            args.workers,
+            checkpoint,
+            output,
+            progress=not args.quiet,
+            utc=args.utc,
+        )
+    finally:
+        if output is not None and output is not sys.stdout:
+            output.close()
+
+    print_summary(summary, api)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,701 @@
+"""Benchmarks for the zmanim fetch and parse path
+
+The benchmarks use synthetic chabad.org responses, so no network access is needed.
+Run with `python benchmarks.py <name> [<name> ...]`, or without arguments to run all of them.
+"""
+
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+from chabad_org_wrapper import (
+    ChabadAPI,
+    Coordinates,
+    Location,
+    TimeZones,
+    ZmanimRequest,
+)
+from synthetic_api import SyntheticChabadAPI, make_response, make_time_group, shift_time
+
+
+class YomTovChabadAPI(SyntheticChabadAPI):
+    """Synthetic responses where every thursday is erev yom tov (so friday is a second day),
+    and the times depend on the location, so the results of different locations differ
+    """
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        response = super().get_zmanim(r)
+        minutes = int(r.location.coordinates.lat * 100) % 60
+        for day in response["Days"]:
+            if day["DayOfWeek"] == 4:
+                day["TimeGroups"].append(make_time_group("CandleLighting", "5:20 PM"))
+            for time_group in day["TimeGroups"]:
+                item = time_group["Items"][0]
+                item["Zman"] = shift_time(item["Zman"], minutes)
+        return response
+
+
+class SolarChabadAPI(SyntheticChabadAPI):
+    """Synthetic responses with the real sunrise and sunset of the location (from astral), so times change
+    smoothly with the location like chabad.org's
+    """
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        from zoneinfo import ZoneInfo
+        from astral import Observer
+        from astral.sun import sunrise, sunset
+
+        response = super().get_zmanim(r)
+        coordinates = r.location.coordinates
+        observer = Observer(coordinates.lat, coordinates.lon)
+        tzinfo = ZoneInfo(coordinates.time_zone.iana_name)
+        events = {"NetzHachamah": sunrise, "Shkiah": sunset}
+        for day in response["Days"]:
+            day_date = datetime.strptime(day["DisplayDate"], "%m/%d/%Y").date()
+            for time_group in day["TimeGroups"]:
+                event = events.get(time_group["ZmanType"])
+                if event:
+                    moment = event(observer, day_date, tzinfo)
+                    time_group["Items"][0]["Zman"] = moment.strftime(
+                        "%I:%M:%S %p"
+                    ).lstrip("0")
+        return response
+
+
+def make_coordinates(count: int) -> list[Coordinates]:
+    """Spread count locations over a grid covering Israel"""
+    return [
+        Coordinates(
+            lat=29.5 + (i % 100) * 0.04,
+            lon=34.3 + (i // 100) * 0.02,
+            time_zone=TimeZones.JERUSALEM.value,
+            custom_name=f"Location {i}",
+        )
+        for i in range(count)
+    ]
+
+
+def bench_pipeline(locations: int = 1000, days: int = 30) -> None:
+    """Throughput of pipeline.fetch_many_compact for growing process counts"""
+    from pipeline import fetch_many_compact
+
+    coordinates = make_coordinates(locations)
+    cores = os.cpu_count() or 1
+    process_counts = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+
+    baseline = None
+    for processes in process_counts:
+        start = time.perf_counter()
+        fetch_many_compact(
+            coordinates,
+            date(2023, 1, 1),
+            days,
+            processes=processes,
+            api_factory=SyntheticChabadAPI,
+        )
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"pipeline: {processes:>2} processes, {locations} locations x {days} days: "
+            f"{elapsed:.2f}s, {locations / elapsed:.0f} locations/s, speedup {baseline / elapsed:.2f}x"
+        )
+
+
+def bench_lazy_day(days: int = 180, repeat: int = 5) -> None:
+    """Parse a 180 day response eagerly and lazily, then read the important zmanim of every day"""
+    from response_schema import decode_response
+    from zmanim_api import ZmanimAPI
+
+    response = make_response(
+        date(2023, 1, 1), date(2023, 1, 1) + timedelta(days=days - 1)
+    )
+    for lazy in (False, True):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            zmanim_days = [
+                ZmanimAPI.format_day(day, lazy)
+                for day in decode_response(response).days
+            ]
+            for zmanim_day in zmanim_days:
+                zmanim_day.get_important_zmanim()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"lazy_day: lazy={lazy!s:<5} {days} days: {elapsed * 1000:.1f}ms")
+
+
+def bench_thread_safety(locations: int = 200, rounds: int = 5) -> None:
+    """Parse and enrich the same yom tov + shabbat of many locations from a growing number of threads,
+    every result must be the same as the single threaded one
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from zmanim_api import ZmanimAPI
+
+    def summary(zmanim_days) -> tuple:
+        return tuple(
+            tuple((zman.name, zman.time) for zman in zmanim_day.zmanim.values())
+            for zmanim_day in zmanim_days
+        )
+
+    def fetch(coordinates: Coordinates) -> tuple:
+        return summary(
+            ZmanimAPI.get_zmanim(date(2023, 1, 5), days=4, coordinates=coordinates)
+        )
+
+    previous_api = ZmanimAPI.chabad_api
+    ZmanimAPI.chabad_api = YomTovChabadAPI()
+    try:
+        coordinates = make_coordinates(locations)
+        expected = [fetch(c) for c in coordinates]
+        second_days = {day[0][-2] for day in expected}
+        assert (
+            len(second_days) > 1
+        ), "the locations should have different candle lighting times"
+
+        for threads in (1, 2, 4, 8, 16, 32):
+            mismatches = 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for _ in range(rounds):
+                    for result, wanted in zip(
+                        executor.map(fetch, coordinates), expected
+                    ):
+                        mismatches += result != wanted
+            elapsed = time.perf_counter() - start
+            print(
+                f"thread_safety: {threads:>2} threads, {locations * rounds} calls: {elapsed:.2f}s, "
+                f"{locations * rounds / elapsed:.0f} calls/s, {mismatches} wrong results"
+            )
+    finally:
+        ZmanimAPI.chabad_api = previous_api
+
+
+def bench_sparse_grid(
+    locations: int = 2000, days: int = 7, max_error: float = 5
+) -> None:
+    """Zmanim of many locations in a region, one request per location vs interpolated from a sparse lattice"""
+    from sparse_grid import SparseGrid, bounds_of
+    from zmanim_api import ZmanimAPI, parse_zman_time
+
+    def seconds(time_str: str) -> float:
+        t = parse_zman_time(time_str)
+        return t.hour * 3600 + t.minute * 60 + t.second
+
+    previous_api = ZmanimAPI.chabad_api
+    ZmanimAPI.chabad_api = SolarChabadAPI()
+    try:
+        coordinates = make_coordinates(locations)
+
+        start = time.perf_counter()
+        direct = [
+            ZmanimAPI.get_zmanim(date(2023, 6, 1), days, coordinates=c)
+            for c in coordinates
+        ]
+        direct_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        grid = SparseGrid.from_max_error(max_error, bounds_of(coordinates))
+        interpolated = grid.fetch(coordinates, date(2023, 6, 1), days)
+        sparse_elapsed = time.perf_counter() - start
+
+        worst = max(
+            abs(seconds(a.zmanim[name].time) - seconds(b.zmanim[name].time))
+            for exact_days, estimated_days in zip(direct, interpolated)
+            for a, b in zip(exact_days, estimated_days)
+            for name in ("NetzHachamah", "Shkiah")
+        )
+        print(
+            f"sparse_grid: {locations} locations x {days} days, direct: {locations} requests {direct_elapsed:.2f}s, "
+            f"sparse: {grid.stats['anchors']} requests {sparse_elapsed:.2f}s (step {grid.lat_step}), "
+            f"max difference {worst:.1f}s (bound {max_error}s)"
+        )
+    finally:
+        ZmanimAPI.chabad_api = previous_api
+
+
+class SlowChabadAPI(ChabadAPI):
+    """Synthetic responses behind a fake http layer, every request takes latency seconds and fails while down is set"""
+
+    def __init__(self, latency: float = 0.05, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.down = False
+
+    def _get(self, url: str, params: dict) -> dict:
+        time.sleep(self.latency)
+        if self.down:
+            raise Exception("Failed to fetch zmanim")
+        if params["tdate"]:
+            start_date = end_date = datetime.strptime(
+                params["tdate"], "%m/%d/%Y"
+            ).date()
+        else:
+            start_date = datetime.strptime(params["startdate"], "%m/%d/%Y").date()
+            end_date = datetime.strptime(params["enddate"], "%m/%d/%Y").date()
+        return make_response(start_date, end_date)
+
+
+def bench_stale_while_revalidate(
+    locations: int = 20, seconds: float = 4.0, ttl: float = 1.0, latency: float = 0.05
+) -> None:
+    """Caller latency of a few locations requested in a loop while their cache entries keep expiring,
+    with an upstream outage in the middle third, with and without stale-while-revalidate
+    """
+    from cache import ResponseCache
+    from resilience import LatencyTracker, StaleWhileRevalidate
+
+    requests = [
+        ZmanimRequest.trusted(
+            location=Location.for_coordinates(c),
+            start_date=date(2023, 1, 1),
+            end_date=date(2023, 1, 7),
+        )
+        for c in make_coordinates(locations)
+    ]
+
+    for revalidation in (None, StaleWhileRevalidate(max_stale=60, concurrency=2)):
+        api = SlowChabadAPI(
+            latency, cache=ResponseCache(ttl=ttl), revalidation=revalidation
+        )
+        for r in requests:
+            api.get_zmanim(r)
+
+        callers = LatencyTracker(window=1000000)
+        start = time.monotonic()
+        while time.monotonic() - start < seconds:
+            api.down = seconds / 3 <= time.monotonic() - start < 2 * seconds / 3
+            for r in requests:
+                call_start = time.monotonic()
+                api.get_zmanim(r)
+                callers.record(time.monotonic() - call_start)
+
+        name = "stale-while-revalidate" if revalidation else "refresh on expiry"
+        print(
+            f"stale_while_revalidate: {name}: {len(callers)} calls, caller p50 {callers.percentile(50) * 1000:.2f}ms "
+            f"p99 {callers.percentile(99) * 1000:.2f}ms max {callers.percentile(100) * 1000:.2f}ms, "
+            f"upstream requests {api.stats['requests']}, stale served {api.stats['stale_served']}"
+        )
+        if revalidation:
+            print(f"stale_while_revalidate: refreshes {revalidation.metrics()}")
+
+
+def bench_compressed_cache(locations: int = 100, repeat: int = 20) -> None:
+    """Size and decode time of cached responses as raw JSON and compressed with and without a trained dictionary"""
+    import json
+    import tempfile
+    import cache
+
+    api = SolarChabadAPI()
+    coordinates = make_coordinates(locations)
+    codecs = [cache.DiskCache.ZLIB] + (
+        [cache.DiskCache.ZSTD] if cache.zstandard else []
+    )
+
+    directory = tempfile.TemporaryDirectory()
+    for days in (1, 7, 180):
+        values = [
+            [
+                "he",
+                api.get_zmanim(
+                    ZmanimRequest.trusted(
+                        location=Location.for_coordinates(c),
+                        start_date=date(2023, 1, 1),
+                        end_date=date(2023, 1, 1) + timedelta(days=days - 1),
+                    )
+                    if days > 1
+                    else ZmanimRequest.trusted(
+                        location=Location.for_coordinates(c), date=date(2023, 1, 1)
+                    )
+                ),
+            ]
+            for c in coordinates
+        ]
+        raw = [
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+            for value in values
+        ]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for data in raw:
+                json.loads(data)
+        raw_decode = (time.perf_counter() - start) / repeat / len(raw)
+        raw_size = sum(map(len, raw))
+        print(
+            f"compressed_cache: {days:>3} days, raw JSON: {raw_size / len(raw):.0f} bytes/entry, decode {raw_decode * 1e6:.1f}us"
+        )
+
+        for codec in codecs:
+            for trained in (False, True):
+                disk_cache = cache.DiskCache(
+                    os.path.join(directory.name, f"{codec}-{days}-{trained}.sqlite"),
+                    codec=codec,
+                    train_samples=None,
+                )
+                if trained:
+                    # trained on other locations than the ones measured
+                    disk_cache.train(values[: len(values) // 2])
+                measured = values[len(values) // 2 :]
+                encoded = [disk_cache._encode(value) for value in measured]
+                size = sum(len(data) for _, data in encoded)
+                measured_raw = sum(map(len, raw[len(values) // 2 :]))
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    for version, data in encoded:
+                        disk_cache._decode(version, data)
+                decode = (time.perf_counter() - start) / repeat / len(encoded)
+                print(
+                    f"compressed_cache: {days:>3} days, {codec}{' + dictionary' if trained else ''}: "
+                    f"{size / len(encoded):.0f} bytes/entry, ratio {measured_raw / size:.1f}x, decode {decode * 1e6:.1f}us"
+                )
+    directory.cleanup()
+
+
+def bench_decode(days: int = 180, repeat: int = 20) -> None:
+    """Decode a 180 day response from JSON bytes: parsing, schema checks, and building the ZmanimDays"""
+    import json
+    import requests
+    from response_schema import SchemaError, decode_response, load_response
+    from zmanim_api import ZmanimAPI
+
+    response = make_response(
+        date(2023, 1, 1), date(2023, 1, 1) + timedelta(days=days - 1)
+    )
+    raw = json.dumps(response).encode()
+
+    def measure(function) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    parse = measure(lambda: json.loads(raw))
+    decode = measure(lambda: decode_response(raw))
+    # what ChabadAPI._get does with the http body, before and after
+    http_response = requests.models.Response()
+    http_response.status_code = 200
+    http_response._content = raw
+    from_text = measure(http_response.json)
+    from_bytes = measure(lambda: load_response(http_response.content))
+    eager = measure(
+        lambda: [ZmanimAPI.format_day(day) for day in decode_response(raw).days]
+    )
+    lazy = measure(
+        lambda: [ZmanimAPI.format_day(day, True) for day in decode_response(raw).days]
+    )
+    print(
+        f"decode: {days} days ({len(raw)} bytes): json.loads {parse:.1f}ms, decode_response {decode:.1f}ms, "
+        f"ZmanimDays eager {eager:.1f}ms, lazy {lazy:.1f}ms"
+    )
+    print(
+        f"decode: http body: response.json() {from_text:.1f}ms, load_response(content) {from_bytes:.1f}ms"
+    )
+
+    response["Days"][days // 2]["TimeGroups"][3]["Items"] = []
+    try:
+        decode_response(json.dumps(response))
+    except SchemaError as e:
+        print(f"decode: schema drift is reported as: {e}")
+
+
+def bench_cache_backends(
+    locations: int = 200, days: int = 7, round_trip: float = 0.0005, repeat: int = 5
+) -> None:
+    """Two nodes sharing a cache: node 1 fetches every location, node 2 should find them all.
+    Compares one lookup per location with a batched get_many, for every backend (best of repeat runs).
+    On loopback a redis round trip costs less than decoding the entry, so redis is also measured with
+    round_trip seconds added to every round trip, like a cache on another host
+    """
+    import pickle
+    import tempfile
+    from cache import DiskCache, ResponseCache
+    from redis_cache import LocalRedisServer, RedisCache, RedisConnection
+    from zmanim_api import ZmanimAPI
+
+    class RemoteConnection(RedisConnection):
+        def execute(self, *args):
+            time.sleep(round_trip)
+            return super().execute(*args)
+
+        def pipeline(self, commands):
+            time.sleep(round_trip)
+            return super().pipeline(commands)
+
+    class RemoteRedisCache(RedisCache):
+        def _connection(self):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = RemoteConnection(
+                    self.host, self.port, self.db, self.timeout
+                )
+            return conn
+
+    def best(function) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    server = LocalRedisServer()
+    server.start()
+    directory = tempfile.TemporaryDirectory()
+    disk_path = os.path.join(directory.name, "cache.sqlite")
+    requests = [
+        ZmanimRequest.trusted(
+            location=Location.for_coordinates(c),
+            start_date=date(2023, 1, 1),
+            end_date=date(2023, 1, 1) + timedelta(days=days - 1),
+        )
+        for c in make_coordinates(locations)
+    ]
+    try:
+        for name, make_cache in (
+            ("memory", lambda: shared_memory),
+            ("disk", lambda: DiskCache(disk_path, train_samples=None)),
+            ("redis", lambda: RedisCache(server.url)),
+            (
+                f"redis +{round_trip * 1000:g}ms",
+                lambda: RemoteRedisCache(server.url, prefix="remote:"),
+            ),
+        ):
+            shared_memory = (
+                ResponseCache()
+            )  # a single process, both "nodes" use the same object
+            first, second = SlowChabadAPI(0.0, cache=make_cache()), SlowChabadAPI(
+                0.0, cache=make_cache()
+            )
+            first.get_zmanim_many(requests)
+
+            one_by_one = best(lambda: [second.get_zmanim(r) for r in requests])
+            batched = best(lambda: second.get_zmanim_many(requests))
+            print(
+                f"cache_backends: {name:<14} node 1 requests {first.stats['requests']}, node 2 requests "
+                f"{second.stats['requests']}, {locations} lookups: one by one {one_by_one * 1000:.1f}ms, "
+                f"get_many {batched * 1000:.1f}ms"
+            )
+
+        # a value under the prefix that isn't a cache entry is a miss, not an error
+        redis_cache = RedisCache(server.url)
+        redis_cache._call(
+            lambda conn: conn.execute(
+                "SET", redis_cache.prefix + "foreign", b"not an entry"
+            ),
+            None,
+        )
+        found = redis_cache.get_many(["foreign", first.cache_key(requests[0])])
+        print(
+            f"cache_backends: a foreign value is a miss: {redis_cache.get('foreign') is None and 'foreign' not in found}, "
+            f"corrupt {redis_cache.stats['corrupt']}"
+        )
+
+        # what a node would store per location, the parsed days pickled vs the cached JSON
+        ZmanimAPI.chabad_api = SlowChabadAPI(0.0)
+        zmanim_days = ZmanimAPI.get_zmanim(
+            date(2023, 1, 1), days, coordinates=make_coordinates(1)[0]
+        )
+        response = SlowChabadAPI(0.0).get_zmanim(requests[0])
+        encoded = RedisCache(server.url).encode(["he", response])
+        pickled = pickle.dumps(zmanim_days)
+        start = time.perf_counter()
+        for _ in range(1000):
+            RedisCache(server.url).decode(encoded)
+        decode = (time.perf_counter() - start) / 1000
+        start = time.perf_counter()
+        for _ in range(1000):
+            pickle.loads(pickled)
+        unpickle = (time.perf_counter() - start) / 1000
+        print(
+            f"cache_backends: {days} days entry: {len(encoded)} bytes, decoded in {decode * 1e6:.0f}us, "
+            f"pickled ZmanimDays {len(pickled)} bytes, unpickled in {unpickle * 1e6:.0f}us"
+        )
+    finally:
+        ZmanimAPI.chabad_api = ChabadAPI()
+        server.stop()
+        directory.cleanup()
+
+
+def bench_day_index(days: int = 178, repeat: int = 20) -> None:
+    """Classify an enriched range (erev shabbat days have shabbat's ShabbatEndTime) and query it with masks"""
+    from day_index import DayFlag, DayIndex
+    from locations import Cities
+    from zmanim_api import ZmanimAPI
+
+    ZmanimAPI.chabad_api = SyntheticChabadAPI()
+    first = date(2023, 1, 1)
+    # iter_zmanim enriches every erev shabbat of the range, get_zmanim only the first day
+    zmanim_days = list(
+        ZmanimAPI.iter_zmanim(
+            Location.for_city(Cities.JERUSALEM.value),
+            first,
+            first + timedelta(days=days - 1),
+        )
+    )
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index = DayIndex(zmanim_days)
+    build = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        erev_before_shabbat = index.before(index.mask(DayFlag.SHABBAT)) & index.mask(
+            DayFlag.EREV
+        )
+    query = (time.perf_counter() - start) / repeat
+
+    # synthetic fridays have a candle lighting and saturdays a shabbat end time
+    wrong = sum(day.weekday() != 5 for day in index.dates(index.mask(DayFlag.SHABBAT)))
+    wrong += sum(day.weekday() != 4 for day in index.dates(index.mask(DayFlag.EREV)))
+    wrong += len(index.dates(index.mask(DayFlag.EREV | DayFlag.SHABBAT)))
+    fridays = sum((first + timedelta(days=i)).weekday() == 4 for i in range(days - 1))
+    wrong += fridays - len(index.dates(erev_before_shabbat))
+    print(
+        f"day_index: {days} days, built in {build * 1000:.2f}ms, erev before shabbat query {query * 1e6:.0f}us, "
+        f"{wrong} wrong flags"
+    )
+
+
+def bench_zman_times(locations: int = 50, days: int = 178) -> None:
+    """Convert the zmanim of many locations to UTC epoch seconds, per value with zoneinfo vs ZmanTimes"""
+    from zoneinfo import ZoneInfo
+    from zman_times import DURATIONS, convert_locations
+    from zmanim_api import ZmanimAPI, ZmanimTypes, parse_zman_time
+
+    ZmanimAPI.chabad_api = SyntheticChabadAPI()
+    time_zones = [TimeZones.JERUSALEM.value, TimeZones.DETROIT.value]
+    ranges = {}
+    for i, coordinates in enumerate(make_coordinates(locations)):
+        zmanim_days = list(
+            ZmanimAPI.iter_zmanim(
+                Location.for_coordinates(coordinates),
+                date(2023, 1, 1),
+                date(2023, 1, 1) + timedelta(days=days - 1),
+            )
+        )
+        ranges[str(i)] = (zmanim_days, time_zones[i % 2])
+
+    start = time.perf_counter()
+    values = 0
+    for zmanim_days, time_zone in ranges.values():
+        zone = ZoneInfo(time_zone.iana_name)
+        for zmanim_day in zmanim_days:
+            for name, zman in zmanim_day.zmanim.items():
+                if name not in DURATIONS:
+                    datetime.combine(
+                        zmanim_day.day.date, parse_zman_time(zman.time), zone
+                    ).timestamp()
+                    values += 1
+    per_value = time.perf_counter() - start
+
+    start = time.perf_counter()
+    converted = convert_locations(ranges)
+    batched = time.perf_counter() - start
+
+    # the ShabbatEndTime an erev shabbat got from shabbat must be the same instant as shabbat's own
+    wrong = 0
+    for label, (zmanim_days, _) in ranges.items():
+        times = converted[label]
+        for zmanim_day in zmanim_days[:-1]:
+            if zmanim_day.is_erev_shabbat():
+                day = zmanim_day.day.date
+                end_time = ZmanimTypes.ShabbatEndTime.name
+                if times.at(end_time, day) != times.at(
+                    end_time, day + timedelta(days=1)
+                ):
+                    wrong += 1
+    friday = converted["0"].utc(ZmanimTypes.ShabbatEndTime.name, date(2023, 1, 6))
+    expected = datetime(
+        2023, 1, 7, 18, 24, tzinfo=ZoneInfo(TimeZones.JERUSALEM.value.iana_name)
+    )
+    if friday != expected:
+        wrong += 1
+    print(
+        f"zman_times: {values} times of {locations} locations x {days} days: per value {per_value * 1000:.1f}ms, "
+        f"ZmanTimes {batched * 1000:.1f}ms ({per_value / batched:.1f}x), {wrong} wrong shabbat end times"
+    )
+    ZmanimAPI.chabad_api = ChabadAPI()
+
+
+def bench_incremental_refresh(locations: int = 20, days: int = 365) -> None:
+    """Refresh a year of many locations: a full parse and enrichment vs RangeRefresher with a single changed day"""
+    from refresh import RangeRefresher
+    from zmanim_api import ZmanimAPI
+
+    # the responses are built once, so the timings don't include making the synthetic data
+    class StoredChabadAPI(SyntheticChabadAPI):
+        def __init__(self, correct: bool = False):
+            super().__init__()
+            self.correct = correct
+            self.responses = {}
+
+        def get_zmanim(self, r: ZmanimRequest) -> dict:
+            key = (r.start_date, r.end_date)
+            if key not in self.responses:
+                response = super().get_zmanim(r)
+                for day in response["Days"]:
+                    if self.correct and day["DisplayDate"] == "01/07/2023":
+                        # an upstream correction of the first shabbat's end time
+                        day["TimeGroups"][-1]["Items"][0]["Zman"] = "6:25 PM"
+                self.responses[key] = response
+            return self.responses[key]
+
+    ZmanimAPI.chabad_api = StoredChabadAPI()
+    start_date = date(2023, 1, 1)
+    end_date = start_date + timedelta(days=days - 1)
+    targets = [Location.for_coordinates(c) for c in make_coordinates(locations)]
+    refreshers = [
+        RangeRefresher(location, start_date, end_date) for location in targets
+    ]
+    for refresher in refreshers:
+        refresher.refresh()
+
+    ZmanimAPI.chabad_api = StoredChabadAPI(correct=True)
+    for location, refresher in zip(
+        targets, refreshers
+    ):  # build the responses of both paths
+        for _ in ZmanimAPI.iter_zmanim(location, start_date, end_date, prefetch=False):
+            pass
+        refresher._fetch()
+    start = time.perf_counter()
+    for location in targets:
+        for _ in ZmanimAPI.iter_zmanim(location, start_date, end_date, prefetch=False):
+            pass
+    full = time.perf_counter() - start
+
+    changes = 0
+    start = time.perf_counter()
+    for refresher in refreshers:
+        changes += len(refresher.refresh())
+    incremental = time.perf_counter() - start
+    print(
+        f"incremental_refresh: {locations} locations x {days} days: full parse {full * 1000:.0f}ms, "
+        f"incremental {incremental * 1000:.0f}ms ({full / incremental:.1f}x), {changes} changes reported"
+    )
+    ZmanimAPI.chabad_api = ChabadAPI()
+
+
+BENCHMARKS = {
+    "pipeline": bench_pipeline,
+    "lazy_day": bench_lazy_day,
+    "thread_safety": bench_thread_safety,
+    "sparse_grid": bench_sparse_grid,
+    "stale_while_revalidate": bench_stale_while_revalidate,
+    "compressed_cache": bench_compressed_cache,
+    "decode": bench_decode,
+    "cache_backends": bench_cache_backends,
+    "day_index": bench_day_index,
+    "zman_times": bench_zman_times,
+    "incremental_refresh": bench_incremental_refresh,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("names", nargs="*", help=f"any of: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
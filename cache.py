@@ -0,0 +1,613 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib with a preset dictionary is used instead
+    zstandard = None
+
+
+class CacheBackend:
+    """The interface of the response caches used by ChabadAPI, see ResponseCache, DiskCache and redis_cache.RedisCache
+
+    Values are responses (JSON like dicts and lists). Entries older than ttl are not returned by get,
+    unless allow_expired is set (used to serve something when chabad.org is down).
+    """
+
+    ttl: float
+    stats: Counter
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Any]:
+        raise NotImplementedError
+
+    def entry(self, key: str) -> Optional[tuple[float, Any]]:
+        """Get (age in seconds, value) of an entry, fresh or expired, without counting a hit or a miss"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Get the fresh values of many keys at once, missing and expired keys are left out"""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, values: dict[str, Any]) -> None:
+        for key, value in values.items():
+            self.set(key, value)
+
+
+def create_cache(config: dict) -> CacheBackend:
+    """Create a cache from the chabadApi.cache config section: a url for a redis server, a path for a DiskCache,
+    otherwise an in memory ResponseCache. The other keys are the arguments of the cache class.
+    """
+    config = dict(config)
+    if "url" in config:
+        from redis_cache import RedisCache
+
+        return RedisCache(**config)
+    if "path" in config:
+        return DiskCache(**config)
+    return ResponseCache(**config)
+
+
+class ResponseCache(CacheBackend):
+    """In memory LRU cache of chabad.org responses
+
+    Entries older than ttl are not returned by get, unless allow_expired is set
+    (used to serve something when chabad.org is down).
+
+    Args:
+        ttl (float): Seconds an entry is fresh. Defaults to 24 hours.
+        max_entries (int): Least recently used entries are dropped above this size. Defaults to 10000.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = Counter()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (
+                not allow_expired and time.monotonic() - entry[0] > self.ttl
+            ):
+                if not allow_expired:
+                    self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if not allow_expired:
+                self.stats["hits"] += 1
+            return entry[1]
+
+    def entry(self, key: str) -> Optional[tuple[float, Any]]:
+        """Get (age in seconds, value) of an entry, fresh or expired, without counting a hit or a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return time.monotonic() - entry[0], entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+
+class DiskCache(CacheBackend):
+    """Persistent cache of chabad.org responses in a sqlite file, shared by all the processes that use the file
+
+    Entries are stored as compressed JSON. The responses repeat the same keys, zman types, titles and footnotes
+    on every day, so a dictionary trained on sample entries lets even a single day compress well.
+    The dictionaries are versioned and kept in the same file, every entry records the dictionary it was
+    compressed with, so entries written before a new dictionary was trained can still be read.
+    Until train_samples entries were written they are compressed without a dictionary, then one is trained
+    from them automatically (see train).
+
+    zstd is used when the optional zstandard package is installed, otherwise zlib with a preset dictionary.
+    Failures of the automatic training are counted in stats["train_errors"], it is retried after more entries.
+
+    Values must be JSON serializable, tuples are returned as lists.
+
+    Args:
+        path (Optional[str]): The sqlite file. Defaults to a file in the temp dir.
+        ttl (float): Seconds an entry is fresh. Defaults to 24 hours.
+        codec (Optional[str]): "zstd" or "zlib". Defaults to zstd if available.
+        level (int): Compression level. Defaults to 9.
+        dictionary_size (int): Size in bytes of trained dictionaries (zlib uses at most 32KB). Defaults to 16KB.
+        train_samples (Optional[int]): Entries written before a dictionary is trained automatically. Defaults to 64,
+            None to only train explicitly.
+    """
+
+    ZSTD = "zstd"
+    ZLIB = "zlib"
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: float = 24 * 60 * 60,
+        codec: Optional[str] = None,
+        level: int = 9,
+        dictionary_size: int = 16 * 1024,
+        train_samples: Optional[int] = 64,
+    ):
+        codec = codec or (self.ZSTD if zstandard is not None else self.ZLIB)
+        if codec not in (self.ZSTD, self.ZLIB):
+            raise ValueError(f"codec must be '{self.ZSTD}' or '{self.ZLIB}'")
+        if codec == self.ZSTD and zstandard is None:
+            raise ValueError("The zstd codec needs the zstandard package")
+
+        self.path = path or os.path.join(tempfile.gettempdir(), "chabad_cache.sqlite")
+        self.ttl = ttl
+        self.codec = codec
+        self.level = level
+        self.dictionary_size = dictionary_size
+        self.train_samples = train_samples
+        self.stats = Counter()
+        self._dictionaries: dict[int, tuple[str, bytes]] = {0: (codec, b"")}
+        self._version: Optional[
+            int
+        ] = None  # the dictionary new entries are compressed with
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, added REAL, codec TEXT, dictionary INTEGER, data BLOB)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dictionaries "
+                "(version INTEGER PRIMARY KEY, codec TEXT, created REAL, data BLOB)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def version(self) -> int:
+        """The version of the dictionary new entries are compressed with, 0 for no dictionary"""
+        with self._lock:
+            if self._version is None:
+                row = (
+                    self._connection()
+                    .execute(
+                        "SELECT MAX(version) FROM dictionaries WHERE codec = ?",
+                        (self.codec,),
+                    )
+                    .fetchone()
+                )
+                self._version = row[0] or 0
+            return self._version
+
+    def _dictionary(self, version: int) -> tuple[str, bytes]:
+        with self._lock:
+            dictionary = self._dictionaries.get(version)
+        if dictionary is None:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT codec, data FROM dictionaries WHERE version = ?", (version,)
+                )
+                .fetchone()
+            )
+            if row is None:
+                raise KeyError(f"Missing cache dictionary version {version}")
+            dictionary = (row[0], bytes(row[1]))
+            with self._lock:
+                self._dictionaries[version] = dictionary
+        return dictionary
+
+    def _codecs(self, version: int):
+        """The (compress, decompress) functions of a dictionary, per thread since zstd contexts aren't thread safe"""
+        codecs = getattr(self._local, "codecs", None)
+        if codecs is None:
+            codecs = self._local.codecs = {}
+        if version not in codecs:
+            codec, data = self._dictionary(version)
+            if codec == self.ZSTD:
+                if zstandard is None:
+                    raise ValueError("The zstd codec needs the zstandard package")
+                kwargs = (
+                    {"dict_data": zstandard.ZstdCompressionDict(data)} if data else {}
+                )
+                compressor = zstandard.ZstdCompressor(level=self.level, **kwargs)
+                decompressor = zstandard.ZstdDecompressor(**kwargs)
+                codecs[version] = (compressor.compress, decompressor.decompress)
+            else:
+                codecs[version] = _zlib_codec(self.level, data)
+        return codecs[version]
+
+    def _encode(self, value: Any) -> tuple[int, bytes]:
+        version = self.version
+        compress, _ = self._codecs(version)
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        data = compress(raw)
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["stored_bytes"] += len(data)
+        return version, data
+
+    def _decode(self, version: int, data: bytes) -> Any:
+        _, decompress = self._codecs(version)
+        return json.loads(decompress(data))
+
+    def _read(self, key: str) -> Optional[tuple[float, Any]]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT added, codec, dictionary, data FROM entries WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        added, codec, version, data = row
+        try:
+            return time.time() - added, self._decode(version, data)
+        except Exception:
+            # e.g. written with zstd by a process that had zstandard installed
+            self.stats["undecodable"] += 1
+            return None
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Any]:
+        entry = self._read(key)
+        if entry is None or (not allow_expired and entry[0] > self.ttl):
+            if not allow_expired:
+                self.stats["misses"] += 1
+            return None
+
+        if not allow_expired:
+            self.stats["hits"] += 1
+        return entry[1]
+
+    def entry(self, key: str) -> Optional[tuple[float, Any]]:
+        """Get (age in seconds, value) of an entry, fresh or expired, without counting a hit or a miss"""
+        return self._read(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Get the fresh values of many keys, with a query per 500 keys"""
+        values = {}
+        conn = self._connection()
+        oldest = time.time() - self.ttl
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            rows = conn.execute(
+                f"SELECT key, dictionary, data FROM entries WHERE added >= ? AND key IN ({','.join('?' * len(chunk))})",
+                (oldest, *chunk),
+            ).fetchall()
+            for key, version, data in rows:
+                try:
+                    values[key] = self._decode(version, data)
+                except Exception:
+                    self.stats["undecodable"] += 1
+        self.stats["hits"] += len(values)
+        self.stats["misses"] += len(keys) - len(values)
+        return values
+
+    def set_many(self, values: dict[str, Any]) -> None:
+        """Set many entries in a single transaction"""
+        now = time.time()
+        rows = [
+            (key, now, self.codec, *self._encode(value))
+            for key, value in values.items()
+        ]
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, added, codec, dictionary, data) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def set(self, key: str, value: Any) -> None:
+        version, data = self._encode(value)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO entries (key, added, codec, dictionary, data) VALUES (?, ?, ?, ?, ?)",
+            (key, time.time(), self.codec, version, data),
+        )
+        if version == 0 and self.train_samples:
+            with self._lock:
+                self.stats["without_dictionary"] += 1
+                due = self.stats["without_dictionary"] % self.train_samples == 0
+            if due:
+                try:
+                    self.train(self._sample_values(self.train_samples))
+                except Exception:
+                    # e.g. zstd can't train on too few or too small samples, keep writing without a dictionary
+                    self.stats["train_errors"] += 1
+
+    def _sample_values(self, count: int) -> list[Any]:
+        """The values of the most recent response entries, other entries (like the language overlays) are skipped"""
+        samples = []
+        rows = self._connection().execute(
+            "SELECT dictionary, data FROM entries ORDER BY added DESC"
+        )
+        for version, data in rows:
+            try:
+                value = self._decode(version, data)
+            except Exception:
+                continue
+            if _days(value):
+                samples.append(value)
+                if len(samples) == count:
+                    break
+        return samples
+
+    def train(self, samples: list[Any]) -> int:
+        """Train a dictionary on sample values (e.g. chabad.org responses) and compress new entries with it.
+        Returns the new dictionary version.
+        """
+        if not samples:
+            raise ValueError("A dictionary needs at least one sample")
+        texts = [
+            json.dumps(sample, ensure_ascii=False, separators=(",", ":")).encode()
+            for sample in samples
+        ]
+        if self.codec == self.ZSTD:
+            # zstd trains best on many small samples, split responses to their days
+            parts = [
+                json.dumps(day, ensure_ascii=False, separators=(",", ":")).encode()
+                for sample in samples
+                for day in _days(sample)
+            ]
+            data = zstandard.train_dictionary(
+                self.dictionary_size, parts or texts
+            ).as_bytes()
+        else:
+            data = _zlib_dictionary(texts, min(self.dictionary_size, 32 * 1024))
+
+        conn = self._connection()
+        with self._lock:
+            cursor = conn.execute(
+                "INSERT INTO dictionaries (codec, created, data) VALUES (?, ?, ?)",
+                (self.codec, time.time(), data),
+            )
+            self._version = cursor.lastrowid
+            self._dictionaries[self._version] = (self.codec, data)
+            self.stats["dictionaries_trained"] += 1
+            return self._version
+
+    def recompress(self) -> int:
+        """Rewrite the entries compressed with older dictionaries using the current one, returns their number"""
+        version = self.version
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT key, added, dictionary, data FROM entries WHERE dictionary != ? OR codec != ?",
+            (version, self.codec),
+        ).fetchall()
+        for key, added, old_version, data in rows:
+            _, data = self._encode(self._decode(old_version, data))
+            conn.execute(
+                "UPDATE entries SET codec = ?, dictionary = ?, data = ? WHERE key = ? AND added = ?",
+                (self.codec, version, data, key, added),
+            )
+        return len(rows)
+
+    def purge(self, max_age: float) -> int:
+        """Delete the entries older than max_age seconds, returns their number"""
+        cursor = self._connection().execute(
+            "DELETE FROM entries WHERE added < ?", (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+
+def _days(value: Any) -> list:
+    """The days of a response or of a (language, response) entry, for splitting training samples"""
+    if (
+        isinstance(value, (list, tuple))
+        and len(value) == 2
+        and isinstance(value[1], dict)
+    ):
+        value = value[1]
+    if isinstance(value, dict) and isinstance(value.get("Days"), list):
+        return value["Days"]
+    return []
+
+
+def _zlib_codec(level: int, dictionary: bytes):
+    """(compress, decompress) of raw deflate streams with a preset dictionary"""
+
+    def compress(data: bytes) -> bytes:
+        compressor = (
+            zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+            if dictionary
+            else zlib.compressobj(level, zlib.DEFLATED, -15)
+        )
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(data: bytes) -> bytes:
+        decompressor = (
+            zlib.decompressobj(-15, zdict=dictionary)
+            if dictionary
+            else zlib.decompressobj(-15)
+        )
+        return decompressor.decompress(data) + decompressor.flush()
+
+    return compress, decompress
+
+
+def _zlib_dictionary(texts: list[bytes], size: int) -> bytes:
+    """Build a zlib preset dictionary from the fragments between numbers that appear in most samples.
+    Dates and times vary, the keys, zman types, titles and footnotes around them repeat.
+    zlib prefers matches close to the data, so the most common fragments are placed last.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(set(re.split(rb"\d+", text)))
+
+    fragments = []
+    used = 0
+    for fragment, count in counts.most_common():
+        if count < 2 or len(fragment) < 4:
+            continue
+        if used + len(fragment) > size:
+            break
+        fragments.append(fragment)
+        used += len(fragment)
+    return b"".join(reversed(fragments))
+
+
+class RangeCache:
+    """In memory cache of single days per location, for answering date ranges from previously fetched ranges
+
+    The days of each location are kept with the sorted, non-overlapping date intervals they cover
+    (adjacent and overlapping intervals are merged when days are added). A lookup returns the cached days
+    of a range and the gaps that are missing or expired, so only the gaps have to be fetched.
+
+    Args:
+        ttl (float): Seconds a day is fresh. Defaults to 24 hours.
+        max_days (int): Days of the least recently used locations are dropped above this number. Defaults to 1000000.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, max_days: int = 1000000):
+        self.ttl = ttl
+        self.max_days = max_days
+        self.stats = Counter()
+        # location key -> (interval starts, interval ends, {ordinal: (time added, value)})
+        self._locations: OrderedDict[
+            str, tuple[list[int], list[int], dict]
+        ] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def intervals(self, key: str) -> list[tuple[int, int]]:
+        """The (first, last) ordinals covered for the location"""
+        with self._lock:
+            starts, ends, _ = self._locations.get(key, ([], [], {}))
+            return list(zip(starts, ends))
+
+    def lookup(
+        self, key: str, first: int, last: int
+    ) -> tuple[dict[int, Any], list[tuple[int, int]]]:
+        """Get the fresh cached days in [first, last] (ordinal -> value) and the (first, last) gaps without them"""
+        now = time.monotonic()
+        found: dict[int, Any] = {}
+        gaps: list[tuple[int, int]] = []
+        with self._lock:
+            entry = self._locations.get(key)
+            if entry is not None:
+                self._locations.move_to_end(key)
+                starts, ends, days = entry
+                i = bisect_left(ends, first)
+                while i < len(starts) and starts[i] <= last:
+                    for ordinal in range(max(starts[i], first), min(ends[i], last) + 1):
+                        added, value = days[ordinal]
+                        if now - added <= self.ttl:
+                            found[ordinal] = value
+                    i += 1
+
+        gap_start = None
+        for ordinal in range(first, last + 1):
+            if ordinal in found:
+                if gap_start is not None:
+                    gaps.append((gap_start, ordinal - 1))
+                    gap_start = None
+            elif gap_start is None:
+                gap_start = ordinal
+        if gap_start is not None:
+            gaps.append((gap_start, last))
+
+        self.stats["hit_days"] += len(found)
+        self.stats["missed_days"] += last - first + 1 - len(found)
+        return found, gaps
+
+    def entries(self, key: str, first: int, last: int) -> dict[int, tuple[float, Any]]:
+        """Get (age in seconds, value) of the cached days in [first, last], fresh or expired, without counting them"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            entry = self._locations.get(key)
+            if entry is None:
+                return found
+            starts, ends, days = entry
+            i = bisect_left(ends, first)
+            while i < len(starts) and starts[i] <= last:
+                for ordinal in range(max(starts[i], first), min(ends[i], last) + 1):
+                    added, value = days[ordinal]
+                    found[ordinal] = (now - added, value)
+                i += 1
+        return found
+
+    def add(self, key: str, values: dict[int, Any]) -> None:
+        """Add days (ordinal -> value), replacing the cached ones. Days missing between them stay gaps."""
+        if not values:
+            return
+        now = time.monotonic()
+        with self._lock:
+            starts, ends, days = self._locations.setdefault(key, ([], [], {}))
+            self._locations.move_to_end(key)
+            for ordinal, value in values.items():
+                if ordinal not in days:
+                    self._size += 1
+                days[ordinal] = (now, value)
+
+            for first, last in _runs(sorted(values)):
+                # merge with every interval that overlaps or touches [first, last]
+                i = bisect_left(ends, first - 1)
+                j = bisect_right(starts, last + 1)
+                if i < j:
+                    first = min(first, starts[i])
+                    last = max(last, ends[j - 1])
+                starts[i:j] = [first]
+                ends[i:j] = [last]
+
+            while self._size > self.max_days and len(self._locations) > 1:
+                _, (_, _, evicted) = self._locations.popitem(last=False)
+                self._size -= len(evicted)
+                self.stats["evicted_days"] += len(evicted)
+
+
+def _runs(ordinals: list[int]) -> list[tuple[int, int]]:
+    """The (first, last) runs of consecutive ordinals in a sorted list"""
+    runs = []
+    for ordinal in ordinals:
+        if runs and runs[-1][1] == ordinal - 1:
+            runs[-1] = (runs[-1][0], ordinal)
+        else:
+            runs.append((ordinal, ordinal))
+    return runs
@@ -1,8 +1,23 @@
 import requests
-from typing import Optional
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Optional
 from pydantic import BaseModel, Field, root_validator
 from locations import *
 from datetime import date, timedelta
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgingPolicy,
+    StaleWhileRevalidate,
+)
+from rate_limiter import RateLimitExceeded, TokenBucket
+from cache import CacheBackend, RangeCache, create_cache
+from coordinate_grid import CoordinateGrid
+from response_schema import load_response
+import zip_codes
 
 
 class ZmanimRequest(BaseModel):
@@ -37,6 +52,63 @@ class ZmanimRequest(BaseModel):
         values["end_date"] = values["end_date"].strftime("%m/%d/%Y")
         return values
 
+    @classmethod
+    def trusted(
+        cls,
+        location: Location,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        date: Optional[date] = None,
+        language: str = "he",
+    ) -> "ZmanimRequest":
+        """Create a request without running the validators, for internally generated requests only.
+        The caller is responsible for the same rules date_validator checks.
+        """
+        return cls.construct(
+            date=format_date(date) if date else None,
+            start_date=format_date(start_date) if start_date else None,
+            end_date=format_date(end_date) if end_date else None,
+            location=location,
+            language=language,
+        )
+
+
+def apply_overlay(response: dict, overlay: dict) -> dict:
+    """Get a copy of the response with the titles, HolidayName and Parsha of the overlay.
+    overlay maps DisplayDate to (HolidayName, Parsha, {ZmanType: Title}), see ChabadAPI._overlay
+    """
+    days = []
+    for day in response["Days"]:
+        holiday_name, parsha, titles = overlay[day["DisplayDate"]]
+        days.append(
+            {
+                **day,
+                "HolidayName": holiday_name,
+                "Parsha": parsha,
+                "TimeGroups": [
+                    {
+                        **time_group,
+                        "Title": titles.get(
+                            time_group["ZmanType"], time_group["Title"]
+                        ),
+                    }
+                    for time_group in day["TimeGroups"]
+                ],
+            }
+        )
+    return {**response, "Days": days}
+
+
+def format_date(d: date) -> str:
+    """Same as d.strftime("%m/%d/%Y"), without the strftime overhead"""
+    return f"{d.month:02d}/{d.day:02d}/{d.year}"
+
+
+def parse_date(s: str) -> date:
+    """Parse a "%m/%d/%Y" date (request dates and DisplayDate), without the strptime overhead"""
+    month, day, year = s.split("/")
+    return date(int(year), int(month), int(day))
+
 
 class ChabadAPI:
     BASE_URL = "chabad.org/webservices/zmanim/zmanim/Get_Zmanim"
@@ -44,8 +116,96 @@ class ChabadAPI:
         accept="application/json",
     )
 
-    def __init__(self):
-        pass
+    # days of language fields fetched at once when a cached response is requested in another language
+    OVERLAY_DAYS = 180
+
+    # location part of the query parameters, per chabad.org location id
+    _city_params: dict[int, dict] = {}
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        hedging: Optional[HedgingPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        fallback: Optional[Callable[[ZmanimRequest], dict]] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        cache: Optional[CacheBackend] = None,
+        coordinate_grid: Optional[CoordinateGrid] = None,
+        range_cache: Optional[RangeCache] = None,
+        revalidation: Optional[StaleWhileRevalidate] = None,
+    ):
+        """
+        Args:
+            timeout (Optional[float]): Timeout in seconds for each http request. Defaults to no timeout,
+                or the hedging timeout with hedging.
+            hedging (Optional[HedgingPolicy]): Send a duplicate request when the first one is slow. Defaults to no hedging.
+            circuit_breaker (Optional[CircuitBreaker]): Stop calling chabad.org while it keeps failing. Defaults to None.
+            fallback (Optional[Callable[[ZmanimRequest], dict]]): Called instead of chabad.org when the request fails
+                or the circuit is open, must return a response in the same format. Defaults to None (errors are raised).
+            rate_limiter (Optional[TokenBucket]): Limits the outbound request rate, can be shared between processes. Defaults to None.
+            cache (Optional[CacheBackend]): Cache of the responses, expired entries are still served when chabad.org fails.
+                A ResponseCache (in memory), a DiskCache (shared by the processes of the host) or a RedisCache
+                (shared by the hosts). Defaults to None.
+                The times are cached once for both languages, the titles, HolidayName and Parsha of each language are kept
+                as a per day overlay, see _in_language.
+            coordinate_grid (Optional[CoordinateGrid]): Snap coordinates to this grid, so nearby locations share requests
+                and cache entries. Defaults to None (coordinates are used as is).
+            range_cache (Optional[RangeCache]): Cache of single days, a request is answered from the cached days
+                and only the missing days are fetched. Defaults to None.
+            revalidation (Optional[StaleWhileRevalidate]): Serve recently expired cache entries immediately and refresh
+                them in the background, needs a cache or a range cache (whose expired days are served the same way).
+                Defaults to None (expired entries are fetched before returning).
+        """
+        if hedging is not None and hedging.other_host and cache is None:
+            # the titles of the request's language are kept in the cache, see _translate
+            raise ValueError("Hedging to the other language host needs a cache")
+        if revalidation is not None and cache is None and range_cache is None:
+            raise ValueError("Stale-while-revalidate needs a cache or a range cache")
+
+        if hedging is not None and timeout is None:
+            timeout = hedging.timeout
+        self.timeout = timeout
+        self.hedging = hedging
+        self.circuit_breaker = circuit_breaker
+        self.fallback = fallback
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.coordinate_grid = coordinate_grid
+        self.range_cache = range_cache
+        self.revalidation = revalidation
+        self.stats = Counter()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._abandoned = 0  # losing hedged requests that are still running
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ChabadAPI":
+        """Create a client from the chabadApi section of config.yaml"""
+        hedging = config.get("hedging")
+        circuit_breaker = config.get("circuitBreaker")
+        rate_limit = config.get("rateLimit")
+        cache = config.get("cache")
+        max_error = config.get("coordinatesMaxError")
+        range_cache = config.get("rangeCache")
+        revalidation = config.get("staleWhileRevalidate")
+        return cls(
+            timeout=config.get("timeout"),
+            hedging=HedgingPolicy(**hedging) if hedging else None,
+            circuit_breaker=CircuitBreaker(**circuit_breaker)
+            if circuit_breaker
+            else None,
+            rate_limiter=TokenBucket(**rate_limit) if rate_limit else None,
+            cache=create_cache(cache) if cache else None,
+            coordinate_grid=CoordinateGrid.from_max_error(max_error)
+            if max_error
+            else None,
+            range_cache=RangeCache(**range_cache) if range_cache else None,
+            revalidation=StaleWhileRevalidate(**revalidation) if revalidation else None,
+        )
+
+    @classmethod
+    def get_url(cls, language: str) -> str:
+        return f"https://www.{language + '.' if language != 'en' else ''}{cls.BASE_URL}"
 
     def get_zmanim(self, r: ZmanimRequest) -> dict:
         """Get the zmanim for the given location and date
@@ -70,34 +230,469 @@ class ChabadAPI:
                 zmanim = ChabadAPI().get_zmanim(request)
 
             # Of course, you can mix and match the two
-            # Maybe some day Ill add an option to get via us zip code
+
+            # US ZIP codes are resolved to coordinates offline, or by chabad.org without a ZIP code index, see zip_codes.py
+            >>> request = ZmanimRequest(date=date(2021, 1, 3), location=Location(zip_code="11213"))
 
         Args:
             r (ZmanimRequest): The request object containing the location and date information
         """
 
-        url = f"https://www.{r.language + '.' if r.language != 'en' else ''}{self.BASE_URL}"
+        r = self._resolve_zip_code(r)
+
+        if self.range_cache is not None:
+            return self._get_range(r)
+
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key(r))
+            if cached is None and self.revalidation is not None:
+                cached = self._stale(r)
+            if cached is not None:
+                response = self._in_language(r, *cached)
+                if response is not None:
+                    return response
+
+        return self._fetch(r)
+
+    def get_zmanim_many(
+        self, requests: list[ZmanimRequest], threads: int = 8
+    ) -> list[dict]:
+        """Get the responses of many requests (e.g. of many locations), in the order of requests.
+        The cached responses are looked up at once (a single round trip with a RedisCache),
+        the others go through get_zmanim on a pool of threads.
+        """
+        requests = [self._resolve_zip_code(r) for r in requests]
+        responses: list[Optional[dict]] = [None] * len(requests)
+        if self.cache is not None and self.range_cache is None:
+            keys = [self.cache_key(r) for r in requests]
+            cached = self.cache.get_many(list(dict.fromkeys(keys)))
+            for i, (r, key) in enumerate(zip(requests, keys)):
+                if key in cached:
+                    responses[i] = self._in_language(r, *cached[key])
+
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            with ThreadPoolExecutor(min(threads, len(missing))) as executor:
+                for i, response in zip(
+                    missing,
+                    executor.map(lambda i: self.get_zmanim(requests[i]), missing),
+                ):
+                    responses[i] = response
+        return responses
+
+    @staticmethod
+    def _resolve_zip_code(r: ZmanimRequest) -> ZmanimRequest:
+        if r.location.type != LocationType.ZIP_CODE:
+            return r
+        return r.copy(update={"location": zip_codes.to_location(r.location.zip_code)})
+
+    def _stale(self, r: ZmanimRequest) -> Optional[tuple[str, dict]]:
+        """Get a cache entry that expired less than max_stale ago, and refresh it in the background"""
+        key = self.cache_key(r)
+        entry = self.cache.entry(key)
+        if entry is None or entry[0] - self.cache.ttl > self.revalidation.max_stale:
+            return None
+
+        self.stats["stale_served"] += 1
+        self.revalidation.refresh(key, lambda: self._fetch(r, fall_back=False))
+        return entry[1]
+
+    def _get_range(self, r: ZmanimRequest) -> dict:
+        """Answer the request from the range cache, fetching only the days that are not cached"""
+        if r.date:
+            first = last = parse_date(r.date).toordinal()
+        else:
+            first, last = (
+                parse_date(r.start_date).toordinal(),
+                parse_date(r.end_date).toordinal(),
+            )
+
+        key = self.range_key(r)
+        days, gaps = self.range_cache.lookup(key, first, last)
+        if not gaps:
+            self.stats["range_hits"] += 1
+        elif self.revalidation is not None:
+            gaps = self._stale_gaps(r, key, days, gaps)
+
+        for gap_first, gap_last in gaps:
+            self.stats["range_gaps"] += 1
+            for gap_request in self._gap_requests(r, gap_first, gap_last):
+                # the response is added to the range cache by _fetch, unless it is a fallback
+                for day in self._fetch(gap_request)["Days"]:
+                    days.setdefault(
+                        parse_date(day["DisplayDate"]).toordinal(), (r.language, day)
+                    )
+
+        response = {"Days": [days[ordinal][1] for ordinal in sorted(days)]}
+        if all(days[ordinal][0] == r.language for ordinal in days):
+            return response
+
+        # some days were fetched in the other language
+        response = (
+            self._in_language(r, None, response) if self.cache is not None else None
+        )
+        return response if response is not None else self._fetch(r)
+
+    @staticmethod
+    def _gap_requests(r: ZmanimRequest, first: int, last: int) -> list[ZmanimRequest]:
+        """The requests of the days [first, last] (ordinals) of the request's location, a request covers at most 181 days"""
+        gap_requests = []
+        for chunk_first in range(first, last + 1, 181):
+            chunk_last = min(chunk_first + 180, last)
+            if chunk_first == chunk_last:
+                gap_requests.append(
+                    ZmanimRequest.trusted(
+                        location=r.location,
+                        date=date.fromordinal(chunk_first),
+                        language=r.language,
+                    )
+                )
+            else:
+                gap_requests.append(
+                    ZmanimRequest.trusted(
+                        location=r.location,
+                        start_date=date.fromordinal(chunk_first),
+                        end_date=date.fromordinal(chunk_last),
+                        language=r.language,
+                    )
+                )
+        return gap_requests
+
+    def _stale_gaps(
+        self, r: ZmanimRequest, key: str, days: dict, gaps: list[tuple[int, int]]
+    ) -> list[tuple[int, int]]:
+        """Serve the gaps whose days all expired less than max_stale ago (added to days) and refresh them in the
+        background, like _stale for the response cache. Returns the gaps that still have to be fetched.
+        """
+        remaining = []
+        for gap_first, gap_last in gaps:
+            entries = self.range_cache.entries(key, gap_first, gap_last)
+            if len(entries) < gap_last - gap_first + 1 or any(
+                age - self.range_cache.ttl > self.revalidation.max_stale
+                for age, _ in entries.values()
+            ):
+                remaining.append((gap_first, gap_last))
+                continue
+
+            self.stats["stale_served"] += 1
+            for ordinal, (_, value) in entries.items():
+                days[ordinal] = value
+            gap_requests = self._gap_requests(r, gap_first, gap_last)
+            self.revalidation.refresh(
+                f"{key}|{gap_first}|{gap_last}",
+                lambda: [
+                    self._fetch(gap_request, fall_back=False)
+                    for gap_request in gap_requests
+                ],
+            )
+        return remaining
+
+    def range_key(self, r: ZmanimRequest) -> str:
+        """Days are shared by both languages when the title overlays can be kept in the response cache"""
+        if self.cache is None:
+            return f"{r.language}|{self.location_key(r)}"
+        return self.location_key(r)
+
+    def _fetch(
+        self, r: ZmanimRequest, fall_back: bool = True, same_host: bool = False
+    ) -> dict:
+        """Get the response from chabad.org and cache it, on failure serve the fallback (or raise without fall_back).
+        With same_host, hedges go to the host of the request's language only.
+        """
+        params = self.build_params(r)
+
+        if self.circuit_breaker and not self.circuit_breaker.allow_request():
+            self.stats["short_circuited"] += 1
+            error = CircuitOpenError("chabad.org is unhealthy")
+            if not fall_back:
+                raise error
+            return self._fall_back(r, error)
 
-        # Create the parameters for the request
-        params = {
-            "locationtype": r.location.type,
+        if self.rate_limiter:
+            try:
+                self.stats["rate_limit_wait"] += self.rate_limiter.acquire()
+            except RateLimitExceeded as e:
+                self.stats["rate_limited"] += 1
+                if self.circuit_breaker:
+                    self.circuit_breaker.release()
+                if not fall_back:
+                    raise
+                return self._fall_back(r, e)
+
+        self.stats["requests"] += 1
+        language = r.language
+        try:
+            if self.hedging:
+                language, response = self._hedged_get(r.language, params, same_host)
+            else:
+                response = self._get(self.get_url(r.language), params)
+        except Exception as e:
+            self.stats["failures"] += 1
+            if self.circuit_breaker:
+                self.circuit_breaker.record_failure()
+            if not fall_back:
+                raise
+            return self._fall_back(r, e)
+
+        if self.circuit_breaker:
+            self.circuit_breaker.record_success()
+
+        if self.range_cache is not None:
+            self.range_cache.add(
+                self.range_key(r),
+                {
+                    parse_date(day["DisplayDate"]).toordinal(): (language, day)
+                    for day in response["Days"]
+                },
+            )
+
+        if self.cache is not None:
+            self.cache.set(self.cache_key(r), (language, response))
+            self._store_overlay(r, language, response)
+            if language != r.language:
+                # a hedge to the other language host won
+                try:
+                    return self._translate(r, language, response)
+                except Exception as e:
+                    if not fall_back:
+                        raise
+                    return self._fall_back(r, e)
+
+        return response
+
+    def _in_language(
+        self, r: ZmanimRequest, language: str, response: dict
+    ) -> Optional[dict]:
+        """Get a cached response in the request's language, see _translate. None if the titles of the request's
+        language are not cached and couldn't be fetched.
+        """
+        try:
+            return self._translate(r, language, response)
+        except Exception:
+            return None
+
+    def _translate(self, r: ZmanimRequest, language: str, response: dict) -> dict:
+        """Get a response in the request's language.
+        The times are the same in both languages, only the titles, HolidayName and Parsha are taken from the
+        overlay of the request's language. Raises if they are not cached and couldn't be fetched.
+        """
+        if language == r.language:
+            return response
+
+        overlay = self._overlay(r, r.language, response)
+        if overlay is None:
+            # fetch the language fields of a long window at once, later requests in this language are then served
+            # from the cache. Only from the request's language host, so the answer is never in the other language
+            self.stats["overlay_fetches"] += 1
+            first_day = parse_date(response["Days"][0]["DisplayDate"])
+            self._fetch(
+                ZmanimRequest.trusted(
+                    location=r.location,
+                    start_date=first_day,
+                    end_date=first_day + timedelta(days=self.OVERLAY_DAYS),
+                    language=r.language,
+                ),
+                fall_back=False,
+                same_host=True,
+            )
+            overlay = self._overlay(r, r.language, response)
+            if overlay is None:
+                raise LookupError(
+                    f"The {r.language} titles of the response are not cached"
+                )
+
+        self.stats["overlays_applied"] += 1
+        return apply_overlay(response, overlay)
+
+    def _overlay(
+        self,
+        r: ZmanimRequest,
+        language: str,
+        response: dict,
+        allow_expired: bool = False,
+    ) -> Optional[dict]:
+        """Get the cached language fields of every day of the response, by DisplayDate (see apply_overlay).
+        None if a day is not cached (or expired, unless allow_expired is set).
+        """
+        dates = [day["DisplayDate"] for day in response["Days"]]
+        keys = [self.overlay_key(r, language, display_date) for display_date in dates]
+        if allow_expired:
+            values = {key: self.cache.get(key, allow_expired=True) for key in keys}
+        else:
+            values = self.cache.get_many(keys)
+        if any(values.get(key) is None for key in keys):
+            return None
+        return {display_date: values[key] for display_date, key in zip(dates, keys)}
+
+    def _store_overlay(self, r: ZmanimRequest, language: str, response: dict) -> None:
+        """Cache the language fields of every day of the response, an entry (with its own ttl) per day"""
+        self.cache.set_many(
+            {
+                self.overlay_key(r, language, day["DisplayDate"]): (
+                    day["HolidayName"],
+                    day["Parsha"],
+                    {
+                        time_group["ZmanType"]: time_group["Title"]
+                        for time_group in day["TimeGroups"]
+                    },
+                )
+                for day in response["Days"]
+            }
+        )
+
+    def build_params(self, r: ZmanimRequest) -> dict:
+        """Create the query parameters for the request, the location part is memoized for cities"""
+        if r.location.type == LocationType.CITY:
+            location_params = self._city_params.get(r.location.city.location_id)
+            if location_params is None:
+                location_params = {
+                    "locationtype": LocationType.CITY.value,
+                    "locationid": r.location.city.location_id,
+                }
+                self._city_params[r.location.city.location_id] = location_params
+        elif r.location.type == LocationType.ZIP_CODE:
+            # there is no ZIP code index, chabad.org resolves the ZIP code
+            location_params = {
+                "locationtype": LocationType.ZIP_CODE.value,
+                "locationid": r.location.zip_code,
+            }
+        else:
+            coordinates = r.location.coordinates
+            if self.coordinate_grid:
+                coordinates = self.coordinate_grid.canonicalize(coordinates)
+            location_params = {
+                "locationtype": r.location.type.value,
+                "coords": coordinates.http_format,
+                "n": coordinates.custom_name,
+                "tzname": coordinates.time_zone.name,
+            }
+
+        return {
+            **location_params,
             "tdate": r.date,
             "startdate": r.start_date,
             "enddate": r.end_date,
         }
 
+    def location_key(self, r: ZmanimRequest) -> str:
         if r.location.type == LocationType.CITY:
-            params["locationid"] = r.location.city.location_id
+            return f"city:{r.location.city.location_id}"
+        if r.location.type == LocationType.ZIP_CODE:
+            return f"zip:{r.location.zip_code}"
+        if self.coordinate_grid:
+            return f"coords:{self.coordinate_grid.cache_key(r.location.coordinates)}"
+        coordinates = r.location.coordinates
+        return (
+            f"coords:{coordinates.lat},{coordinates.lon},{coordinates.time_zone.name}"
+        )
 
-        coords_params = {}
-        if r.location.type == LocationType.COORDINATES:
-            params["coords"] = r.location.coordinates.http_format
-            params["n"] = r.location.coordinates.custom_name
-            params["tzname"] = r.location.coordinates.time_zone.name
+    def cache_key(self, r: ZmanimRequest) -> str:
+        """The cache key of the request's times, the location name and the language are not part of it"""
+        return f"{self.location_key(r)}|{r.date or ''}|{r.start_date or ''}|{r.end_date or ''}"
 
-        response = requests.get(url, params=params, headers=self.HEADERS)
+    def overlay_key(self, r: ZmanimRequest, language: str, display_date: str) -> str:
+        """The cache key of the language fields of a day of the request's location"""
+        return f"{language}|{self.location_key(r)}|overlay|{display_date}"
 
-        if response.status_code == 200:
-            return response.json()
-        else:
+    def _get(self, url: str, params: dict) -> dict:
+        start = time.monotonic()
+        response = requests.get(
+            url, params=params, headers=self.HEADERS, timeout=self.timeout
+        )
+
+        if response.status_code != 200:
             raise Exception("Failed to fetch zmanim")
+
+        if self.hedging:
+            self.hedging.latencies.record(time.monotonic() - start)
+
+        # the body is parsed as bytes, an error page served with a 200 raises a SchemaError (a failed request)
+        return load_response(response.content)
+
+    def _hedged_get(
+        self, language: str, params: dict, same_host: bool = False
+    ) -> tuple[str, dict]:
+        """Send the request, and if no answer arrived within the hedge delay (or it failed), send a duplicate one.
+        The first successful response wins, the slower request is cancelled if it didn't start yet, otherwise it is
+        left to finish in the background (within the timeout), and no hedge is sent while max_abandoned of them run.
+        Returns the language of the host that answered, a hedge sent to the other language host returns
+        titles in the other language (unless same_host is set).
+        """
+        executor = self._get_executor()
+        primary = executor.submit(self._get, self.get_url(language), params)
+
+        done, _ = wait([primary], timeout=self.hedging.delay())
+        if done and primary.exception() is None:
+            return language, primary.result()
+
+        hedge_language = language
+        if self.hedging.other_host and not same_host:
+            hedge_language = "en" if language == "he" else "he"
+
+        if self._abandoned >= self.hedging.max_abandoned:
+            self.stats["hedges_skipped"] += 1
+            return language, primary.result()
+
+        # hedges never wait for the rate limiter, if there is no spare token just wait for the first request
+        if self.rate_limiter and not self.rate_limiter.try_acquire():
+            self.stats["hedges_skipped"] += 1
+            return language, primary.result()
+
+        self.stats["hedged"] += 1
+        hedge = executor.submit(self._get, self.get_url(hedge_language), params)
+
+        error = None
+        for future in as_completed([primary, hedge]):
+            if future.exception() is None:
+                self._abandon(primary if future is hedge else hedge)
+                if future is hedge:
+                    self.stats["hedge_wins"] += 1
+                    return hedge_language, future.result()
+                return language, future.result()
+            error = future.exception()
+
+        raise error
+
+    def _abandon(self, future: Future) -> None:
+        """Cancel a losing request, or count it as abandoned until it finishes"""
+        if future.cancel():
+            self.stats["hedges_cancelled"] += 1
+            return
+        with self._executor_lock:
+            self._abandoned += 1
+        future.add_done_callback(self._abandoned_done)
+
+    def _abandoned_done(self, future: Future) -> None:
+        with self._executor_lock:
+            self._abandoned -= 1
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix="chabad-api"
+                )
+            return self._executor
+
+    def _fall_back(self, r: ZmanimRequest, error: Exception) -> dict:
+        if self.cache is not None:
+            entry = self.cache.entry(self.cache_key(r))
+            if entry is not None and (
+                self.revalidation is None
+                or self.revalidation.servable(entry[0] - self.cache.ttl)
+            ):
+                language, response = entry[1]
+                if language == r.language:
+                    self.stats["expired_cache_served"] += 1
+                    return response
+                # the cached response is in the other language, serve it only with the titles of the request's language
+                overlay = self._overlay(r, r.language, response, allow_expired=True)
+                if overlay is not None:
+                    self.stats["expired_cache_served"] += 1
+                    return apply_overlay(response, overlay)
+
+        if self.fallback is None:
+            raise error
+
+        self.stats["fallbacks"] += 1
+        return self.fallback(r)
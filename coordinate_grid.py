@@ -0,0 +1,186 @@
+"""Snap coordinates to a grid, so nearby locations share the same request and cache entry
+
+Error bound:
+    Zmanim that depend on the sun crossing a given altitude (sunrise, sunset, alos, tzeis...) are shifted by
+    exactly 240 seconds per degree of longitude (the sun moves 15 degrees an hour).
+    The shift per degree of latitude comes from the hour angle, cos(H) = (sin(h) - sin(lat)sin(d)) / (cos(lat)cos(d)),
+    and grows with latitude, the sun's declination d and the depression of the altitude h.
+    latitude_sensitivity finds the worst case over the whole year numerically (e.g. ~170 s/deg for sunrise below
+    35 degrees, ~700 s/deg below 60 degrees).
+
+    A point moves at most half a step on each axis, so the error of a grid is at most
+    lat_sensitivity * lat_step / 2 + 240 * lon_step / 2.
+    from_max_error splits the allowed error equally between the two axes.
+    The bound is checked against astral's solar calculation with `python coordinate_grid.py`.
+"""
+
+import random
+from collections import Counter
+from datetime import date, timedelta, timezone
+from math import acos, cos, degrees, radians, sin
+from typing import Optional
+from locations import Coordinates
+
+SECONDS_PER_LON_DEGREE = 240
+MAX_DECLINATION = 23.44
+SUNRISE_ALTITUDE = -0.833
+
+
+def _hour_angle(lat: float, declination: float, altitude: float) -> Optional[float]:
+    cos_h = (sin(radians(altitude)) - sin(radians(lat)) * sin(radians(declination))) / (
+        cos(radians(lat)) * cos(radians(declination))
+    )
+    if abs(cos_h) >= 1:
+        return None  # the sun doesn't cross this altitude on that day
+    return degrees(acos(cos_h))
+
+
+def latitude_sensitivity(
+    max_latitude: float = 60, altitude: float = SUNRISE_ALTITUDE
+) -> float:
+    """Worst case shift (seconds per degree of latitude) of the time the sun crosses altitude,
+    for every latitude up to max_latitude (north or south) and every day of the year
+    """
+    worst = 0.0
+    eps = 0.01
+    for lat_index in range(int(max_latitude * 2) + 1):
+        lat = lat_index / 2
+        for decl_index in range(
+            -int(MAX_DECLINATION * 2), int(MAX_DECLINATION * 2) + 1
+        ):
+            declination = decl_index / 2
+            above = _hour_angle(lat + eps, declination, altitude)
+            below = _hour_angle(lat - eps, declination, altitude)
+            if above is None or below is None:
+                continue
+            worst = max(worst, abs(above - below) / (2 * eps) * SECONDS_PER_LON_DEGREE)
+    return worst
+
+
+class CoordinateGrid:
+    """Quantize coordinates to a fixed lat/lon grid
+
+    Example:
+        >>> grid = CoordinateGrid.from_max_error(30)  # zmanim within 30 seconds
+        >>> grid.canonicalize(Coordinates(lat=32.08088, lon=34.78057, time_zone=TimeZones.JERUSALEM.value))
+
+    Args:
+        lat_step (float): Grid size in degrees of latitude.
+        lon_step (float): Grid size in degrees of longitude.
+    """
+
+    # enough decimals to print any grid point without float noise
+    DECIMALS = 6
+
+    def __init__(self, lat_step: float, lon_step: float):
+        if lat_step <= 0 or lon_step <= 0:
+            raise ValueError("Grid steps must be positive")
+
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.stats = Counter()
+
+    @classmethod
+    def from_max_error(
+        cls,
+        seconds: float,
+        max_latitude: float = 60,
+        altitude: float = SUNRISE_ALTITUDE,
+    ) -> "CoordinateGrid":
+        """Create the coarsest grid that keeps the zmanim within seconds of the exact location
+
+        Args:
+            seconds (float): The maximum error, in seconds.
+            max_latitude (float): The bound holds for locations up to this latitude. Defaults to 60.
+            altitude (float): Sun altitude of the most sensitive zman you use. Defaults to sunrise/sunset (-0.833),
+                use e.g. -16.1 for alos hashachar.
+        """
+        return cls(
+            lat_step=seconds / latitude_sensitivity(max_latitude, altitude),
+            lon_step=seconds / SECONDS_PER_LON_DEGREE,
+        )
+
+    def max_error(
+        self, max_latitude: float = 60, altitude: float = SUNRISE_ALTITUDE
+    ) -> float:
+        """The error bound of this grid in seconds, see the module docstring"""
+        return (
+            latitude_sensitivity(max_latitude, altitude) * self.lat_step / 2
+            + SECONDS_PER_LON_DEGREE * self.lon_step / 2
+        )
+
+    def snap(self, lat: float, lon: float) -> tuple[float, float]:
+        return (
+            round(round(lat / self.lat_step) * self.lat_step, self.DECIMALS),
+            round(round(lon / self.lon_step) * self.lon_step, self.DECIMALS),
+        )
+
+    def canonicalize(self, coordinates: Coordinates) -> Coordinates:
+        """Get the coordinates of the grid point nearest to coordinates"""
+        lat, lon = self.snap(coordinates.lat, coordinates.lon)
+        self.stats["canonicalized"] += 1
+        if (lat, lon) != (coordinates.lat, coordinates.lon):
+            self.stats["moved"] += 1
+        return Coordinates(
+            lat=lat,
+            lon=lon,
+            time_zone=coordinates.time_zone,
+            custom_name=coordinates.custom_name,
+        )
+
+    def cache_key(self, coordinates: Coordinates) -> str:
+        lat, lon = self.snap(coordinates.lat, coordinates.lon)
+        return f"{lat},{lon},{coordinates.time_zone.name}"
+
+
+def max_error_against_astral(
+    grid: CoordinateGrid,
+    max_latitude: float = 60,
+    altitude: float = SUNRISE_ALTITUDE,
+    points: int = 200,
+    seed: int = 0,
+) -> float:
+    """Measure the largest difference (in seconds) between the zmanim of random points and their grid points,
+    using astral's solar calculation, over a whole year
+    """
+    from astral import Observer
+    from astral.sun import dawn, dusk, sunrise, sunset
+
+    if altitude == SUNRISE_ALTITUDE:
+        events = [sunrise, sunset]
+    else:
+        events = [
+            lambda observer, day, tzinfo: dawn(observer, day, -altitude, tzinfo),
+            lambda observer, day, tzinfo: dusk(observer, day, -altitude, tzinfo),
+        ]
+
+    rng = random.Random(seed)
+    worst = 0.0
+    for _ in range(points):
+        lat = rng.uniform(-max_latitude, max_latitude)
+        lon = rng.uniform(-180, 180)
+        exact = Observer(lat, lon)
+        snapped = Observer(*grid.snap(lat, lon))
+        # compute in (roughly) local solar time, so both events are always attributed to the same date
+        tzinfo = timezone(timedelta(hours=round(lon / 15)))
+        for day_offset in range(0, 366, 7):
+            day = date(2023, 1, 1) + timedelta(days=day_offset)
+            for event in events:
+                try:
+                    difference = event(exact, day, tzinfo) - event(snapped, day, tzinfo)
+                except ValueError:
+                    continue  # the sun doesn't reach the altitude on that day
+                worst = max(worst, abs(difference.total_seconds()))
+    return worst
+
+
+if __name__ == "__main__":
+    for seconds in (10, 30, 60):
+        for max_latitude in (35, 60):
+            grid = CoordinateGrid.from_max_error(seconds, max_latitude)
+            measured = max_error_against_astral(grid, max_latitude)
+            print(
+                f"max error {seconds}s up to latitude {max_latitude}: "
+                f"grid {grid.lat_step:.4f} x {grid.lon_step:.4f} degrees, measured {measured:.1f}s "
+                f"{'OK' if measured <= seconds else 'EXCEEDED'}"
+            )
@@ -0,0 +1,136 @@
+"""Classification of a range of days as bit fields
+
+Every day is classified once into a DayFlag, the flags of the whole range are kept in an array,
+and for every flag a bitset of the range is kept as a python int (bit i is the i-th day of the range).
+Questions about the range are then bitwise operations on those ints instead of loops over the days.
+
+Example:
+    >>> index = DayIndex(ZmanimAPI.get_zmanim(date(2023, 3, 1), days=179, city=Cities.JERUSALEM))
+    >>> # days that are erev yom tov (a yom tov starts the next day) and next to a fast day
+    >>> mask = index.before(index.mask(DayFlag.YOM_TOV)) & index.around(index.mask(DayFlag.FAST))
+    >>> index.dates(mask)
+"""
+
+from array import array
+from datetime import date, timedelta
+from enum import IntFlag
+from zmanim_api import ZmanimDay, ZmanimTypes
+
+
+class DayFlag(IntFlag):
+    EREV = 1  # candle lighting, erev shabbat or yom tov
+    SHABBAT = 2
+    YOM_TOV = 4  # chabad.org's IsHoliday
+    SECOND_DAY = 8  # shabbat after yom tov or second day of yom tov, see ZmanimDay.is_second_e_shabbat
+    FAST = 16
+    CHAMETZ = 32  # bedikat, last eating or burn chametz time
+
+
+# flags that only depend on which zmanim exist in the day
+_ZMAN_FLAGS = {
+    ZmanimTypes.CandleLighting.name: DayFlag.EREV,
+    ZmanimTypes.FastStarts.name: DayFlag.FAST,
+    ZmanimTypes.FastEnds.name: DayFlag.FAST,
+    ZmanimTypes.BedikatChametz.name: DayFlag.CHAMETZ,
+    ZmanimTypes.LastEatingChametzTime.name: DayFlag.CHAMETZ,
+    ZmanimTypes.BurnChametzTime.name: DayFlag.CHAMETZ,
+}
+
+
+def classify(zmanim_day: ZmanimDay) -> DayFlag:
+    """Get the flags of a day, with a single pass over its zmanim names"""
+    flags = 0
+    for name in zmanim_day.zmanim.keys():
+        flags |= _ZMAN_FLAGS.get(name, 0)
+
+    if zmanim_day.day.is_holiday:
+        flags |= DayFlag.YOM_TOV
+    elif zmanim_day.day.day_of_week == 6:
+        # not by ShabbatEndTime, an erev shabbat enriched by get_zmanim or iter_zmanim has shabbat's one too
+        flags |= DayFlag.SHABBAT
+
+    if zmanim_day.is_second_e_shabbat():
+        flags |= DayFlag.SECOND_DAY
+
+    return DayFlag(flags)
+
+
+class DayIndex:
+    """Flags of a range of days
+
+    Args:
+        zmanim_days (list[ZmanimDay]): The days, sorted by date. Missing dates are allowed and have no flags.
+    """
+
+    def __init__(self, zmanim_days: list[ZmanimDay]):
+        if not zmanim_days:
+            raise ValueError("At least one day is needed")
+
+        self.start: date = zmanim_days[0].day.date
+        length = (zmanim_days[-1].day.date - self.start).days + 1
+        self.flags = array("B", bytes(length))
+        self._days: list = [None] * length
+        self._masks = {flag: 0 for flag in DayFlag}
+
+        for zmanim_day in zmanim_days:
+            i = (zmanim_day.day.date - self.start).days
+            flags = classify(zmanim_day)
+            self.flags[i] = flags
+            self._days[i] = zmanim_day
+            for flag in DayFlag:
+                if flags & flag:
+                    self._masks[flag] |= 1 << i
+
+        self.full = (1 << length) - 1
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def flags_of(self, day: date) -> DayFlag:
+        return DayFlag(self.flags[(day - self.start).days])
+
+    def mask(self, flag: DayFlag) -> int:
+        """Bitset of the days that have all the given flags, e.g. mask(DayFlag.EREV | DayFlag.FAST)"""
+        result = self.full
+        for single in DayFlag:
+            if flag & single:
+                result &= self._masks[single]
+        return result
+
+    def any(self, flag: DayFlag) -> int:
+        """Bitset of the days that have at least one of the given flags"""
+        result = 0
+        for single in DayFlag:
+            if flag & single:
+                result |= self._masks[single]
+        return result
+
+    def before(self, mask: int, days: int = 1) -> int:
+        """Bitset of the days that are `days` days before a day in mask"""
+        return mask >> days
+
+    def after(self, mask: int, days: int = 1) -> int:
+        """Bitset of the days that are `days` days after a day in mask"""
+        return (mask << days) & self.full
+
+    def around(self, mask: int, days: int = 1) -> int:
+        """Bitset of the days within `days` days of a day in mask (including the day itself)"""
+        result = mask
+        for distance in range(1, days + 1):
+            result |= self.before(mask, distance) | self.after(mask, distance)
+        return result
+
+    def dates(self, mask: int) -> list[date]:
+        result = []
+        while mask:
+            lowest = mask & -mask
+            result.append(self.start + timedelta(days=lowest.bit_length() - 1))
+            mask ^= lowest
+        return result
+
+    def days(self, mask: int) -> list[ZmanimDay]:
+        return [
+            self._days[(day - self.start).days]
+            for day in self.dates(mask)
+            if self._days[(day - self.start).days] is not None
+        ]
@@ -0,0 +1,470 @@
+"""Offline Hebrew calendar: holidays, fasts, erev shabbat/yom tov and the weekly parsha
+
+Everything chabad.org returns in Day (is_holiday, holiday_name, parsha) and the fast/erev classification,
+computed locally so questions like "is next friday erev yom tov?" don't need a request.
+Diaspora and Israel rules differ in the second day of yom tov and in the parsha schedule after
+Pesach or Shavuot that falls on a friday.
+
+The date arithmetic follows the fixed (rata die) day numbers of Calendrical Calculations, which are the
+same as date.toordinal(). Months are numbered from Nisan (1) to Adar (12) and Adar II (13), the year
+starts at Tishrei (7). Everything about a year is computed once and cached, a range is then a lookup per day.
+
+Example:
+    >>> calendar = HebrewCalendar(israel=True)
+    >>> [day.holiday for day in calendar.days(date(2024, 10, 1), date(2024, 10, 5))]
+    >>> calendar.day(date(2024, 10, 26)).parsha  # 'Bereishit'
+"""
+
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+NISAN, IYAR, SIVAN, TAMMUZ, AV, ELUL = 1, 2, 3, 4, 5, 6
+TISHREI, CHESHVAN, KISLEV, TEVET, SHEVAT, ADAR, ADAR_II = 7, 8, 9, 10, 11, 12, 13
+
+# date(-3760, 10, 7) in the julian calendar, 1 Tishrei of the year 1
+HEBREW_EPOCH = -1373427
+
+SATURDAY = 5  # date.weekday()
+THURSDAY = 3
+
+PARSHIOT = [
+    ("Bereishit", "בראשית"),
+    ("Noach", "נח"),
+    ("Lech Lecha", "לך לך"),
+    ("Vayeira", "וירא"),
+    ("Chayei Sarah", "חיי שרה"),
+    ("Toldot", "תולדות"),
+    ("Vayetze", "ויצא"),
+    ("Vayishlach", "וישלח"),
+    ("Vayeshev", "וישב"),
+    ("Miketz", "מקץ"),
+    ("Vayigash", "ויגש"),
+    ("Vayechi", "ויחי"),
+    ("Shemot", "שמות"),
+    ("Va'eira", "וארא"),
+    ("Bo", "בא"),
+    ("Beshalach", "בשלח"),
+    ("Yitro", "יתרו"),
+    ("Mishpatim", "משפטים"),
+    ("Terumah", "תרומה"),
+    ("Tetzaveh", "תצוה"),
+    ("Ki Tisa", "כי תשא"),
+    ("Vayakhel", "ויקהל"),
+    ("Pekudei", "פקודי"),
+    ("Vayikra", "ויקרא"),
+    ("Tzav", "צו"),
+    ("Shemini", "שמיני"),
+    ("Tazria", "תזריע"),
+    ("Metzora", "מצורע"),
+    ("Acharei", "אחרי מות"),
+    ("Kedoshim", "קדושים"),
+    ("Emor", "אמור"),
+    ("Behar", "בהר"),
+    ("Bechukotai", "בחוקותי"),
+    ("Bamidbar", "במדבר"),
+    ("Naso", "נשא"),
+    ("Behaalotecha", "בהעלותך"),
+    ("Shelach", "שלח"),
+    ("Korach", "קרח"),
+    ("Chukat", "חוקת"),
+    ("Balak", "בלק"),
+    ("Pinchas", "פינחס"),
+    ("Matot", "מטות"),
+    ("Masei", "מסעי"),
+    ("Devarim", "דברים"),
+    ("Va'etchanan", "ואתחנן"),
+    ("Eikev", "עקב"),
+    ("Re'eh", "ראה"),
+    ("Shoftim", "שופטים"),
+    ("Ki Teitzei", "כי תצא"),
+    ("Ki Tavo", "כי תבוא"),
+    ("Nitzavim", "נצבים"),
+    ("Vayelech", "וילך"),
+    ("Haazinu", "האזינו"),
+]
+VAYAKHEL, TAZRIA, ACHAREI, BEHAR, CHUKAT, MATOT, NITZAVIM, VAYELECH, HAAZINU = (
+    21,
+    26,
+    28,
+    31,
+    38,
+    41,
+    50,
+    51,
+    52,
+)
+
+
+class Holiday(NamedTuple):
+    eng_name: str
+    heb_name: str
+    yom_tov: bool = False  # work is forbidden, chabad.org's IsHoliday
+    fast: bool = False
+
+
+class CalendarDay(NamedTuple):
+    date: date
+    hebrew_date: tuple[int, int, int]  # (year, month, day)
+    holiday: Optional[Holiday]
+    parsha: Optional[str]  # on shabbat only, e.g. "Vayakhel-Pekudei"
+    is_shabbat: bool
+    is_yom_tov: bool
+    is_erev: bool  # candle lighting, the next day is shabbat or yom tov
+    candles_after_nightfall: bool  # erev that is itself shabbat or yom tov, e.g. first day of a two day yom tov
+    is_fast: bool
+
+    @property
+    def is_holy_day(self) -> bool:
+        return self.is_shabbat or self.is_yom_tov
+
+
+def is_leap_year(year: int) -> bool:
+    return (7 * year + 1) % 19 < 7
+
+
+def _elapsed_days(year: int) -> int:
+    """Days from the epoch to the molad of Tishrei of year, with the "molad zaken" and weekday postponements"""
+    months = (235 * year - 234) // 19
+    parts = 12084 + 13753 * months
+    days = 29 * months + parts // 25920
+    return days + 1 if (3 * (days + 1)) % 7 < 3 else days
+
+
+def _year_length_correction(year: int) -> int:
+    previous, current, following = (
+        _elapsed_days(year - 1),
+        _elapsed_days(year),
+        _elapsed_days(year + 1),
+    )
+    if following - current == 356:
+        return 2
+    if current - previous == 382:
+        return 1
+    return 0
+
+
+@lru_cache(maxsize=None)
+def new_year(year: int) -> int:
+    """Ordinal of 1 Tishrei of year"""
+    return HEBREW_EPOCH + _elapsed_days(year) + _year_length_correction(year)
+
+
+def year_length(year: int) -> int:
+    return new_year(year + 1) - new_year(year)
+
+
+def month_length(year: int, month: int) -> int:
+    if month in (IYAR, TAMMUZ, ELUL, TEVET, ADAR_II):
+        return 29
+    if month == ADAR and not is_leap_year(year):
+        return 29
+    if month == CHESHVAN and year_length(year) % 10 != 5:
+        return 29  # cheshvan is long in complete years (355 or 385 days)
+    if month == KISLEV and year_length(year) % 10 == 3:
+        return 29  # kislev is short in deficient years (353 or 383 days)
+    return 30
+
+
+@lru_cache(maxsize=None)
+def _months(year: int) -> tuple[tuple[int, int], ...]:
+    """(month, ordinal of its first day) of every month of year, in calendar order"""
+    order = [TISHREI, CHESHVAN, KISLEV, TEVET, SHEVAT, ADAR]
+    if is_leap_year(year):
+        order.append(ADAR_II)
+    order += [NISAN, IYAR, SIVAN, TAMMUZ, AV, ELUL]
+
+    months = []
+    start = new_year(year)
+    for month in order:
+        months.append((month, start))
+        start += month_length(year, month)
+    return tuple(months)
+
+
+def to_ordinal(year: int, month: int, day: int) -> int:
+    for m, start in _months(year):
+        if m == month:
+            return start + day - 1
+    raise ValueError(f"Month {month} is not in year {year}")
+
+
+def to_date(year: int, month: int, day: int) -> date:
+    return date.fromordinal(to_ordinal(year, month, day))
+
+
+def from_ordinal(ordinal: int) -> tuple[int, int, int]:
+    """(year, month, day) of the given date.toordinal()"""
+    year = int((ordinal - HEBREW_EPOCH) / (35975351 / 98496)) + 1
+    while new_year(year) > ordinal:
+        year -= 1
+    while new_year(year + 1) <= ordinal:
+        year += 1
+
+    for month, start in reversed(_months(year)):
+        if start <= ordinal:
+            return year, month, ordinal - start + 1
+    raise AssertionError("unreachable")
+
+
+def from_date(d: date) -> tuple[int, int, int]:
+    return from_ordinal(d.toordinal())
+
+
+def _holidays(year: int, israel: bool) -> dict[int, Holiday]:
+    """Holiday of every ordinal in year that has one"""
+    holidays: dict[int, Holiday] = {}
+
+    def add(month: int, day: int, *holiday) -> None:
+        holidays[to_ordinal(year, month, day)] = Holiday(*holiday)
+
+    def add_fast(month: int, day: int, eng_name: str, heb_name: str) -> None:
+        ordinal = to_ordinal(year, month, day)
+        if date.fromordinal(ordinal).weekday() == SATURDAY:
+            # taanit esther moves back to thursday, the other fasts are postponed to sunday
+            ordinal += -2 if eng_name == "Taanit Esther" else 1
+        holidays[ordinal] = Holiday(eng_name, heb_name, fast=True)
+
+    # rosh chodesh first, so holidays on rosh chodesh (e.g. chanukah) replace it
+    # it is the first day of the month, and the 30th day of the previous month if it has one
+    months = _months(year)
+    for (_, previous), (_, start) in zip(months, months[1:]):
+        holidays[start] = Holiday("Rosh Chodesh", "ראש חודש")
+        if start - previous == 30:
+            holidays[start - 1] = Holiday("Rosh Chodesh", "ראש חודש")
+
+    add(TISHREI, 1, "Rosh Hashana", "ראש השנה", True)
+    add(TISHREI, 2, "Rosh Hashana", "ראש השנה", True)
+    add_fast(TISHREI, 3, "Tzom Gedaliah", "צום גדליה")
+    add(TISHREI, 10, "Yom Kippur", "יום כיפור", True, True)
+    add(TISHREI, 15, "Sukkot", "סוכות", True)
+    add(TISHREI, 16, "Sukkot", "סוכות", not israel)
+    for day in range(16 if israel else 17, 21):
+        add(TISHREI, day, "Chol Hamoed Sukkot", "חול המועד סוכות")
+    add(TISHREI, 21, "Hoshana Rabbah", "הושענא רבה")
+    if israel:
+        add(
+            TISHREI,
+            22,
+            "Shemini Atzeret & Simchat Torah",
+            "שמיני עצרת ושמחת תורה",
+            True,
+        )
+    else:
+        add(TISHREI, 22, "Shemini Atzeret", "שמיני עצרת", True)
+        add(TISHREI, 23, "Simchat Torah", "שמחת תורה", True)
+
+    chanukah = to_ordinal(year, KISLEV, 25)
+    for day in range(8):
+        holidays[chanukah + day] = Holiday("Chanukah", "חנוכה")
+
+    add_fast(TEVET, 10, "Asara B'Tevet", "עשרה בטבת")
+    add(SHEVAT, 15, "Tu B'Shevat", "ט״ו בשבט")
+
+    adar = ADAR_II if is_leap_year(year) else ADAR
+    add_fast(adar, 13, "Taanit Esther", "תענית אסתר")
+    add(adar, 14, "Purim", "פורים")
+    add(adar, 15, "Shushan Purim", "שושן פורים")
+
+    add(NISAN, 14, "Erev Pesach", "ערב פסח")
+    add(NISAN, 15, "Pesach", "פסח", True)
+    add(NISAN, 16, "Pesach", "פסח", not israel)
+    for day in range(16 if israel else 17, 21):
+        add(NISAN, day, "Chol Hamoed Pesach", "חול המועד פסח")
+    add(NISAN, 21, "Shvi'i Shel Pesach", "שביעי של פסח", True)
+    if not israel:
+        add(NISAN, 22, "Acharon Shel Pesach", "אחרון של פסח", True)
+
+    add(IYAR, 18, "Lag BaOmer", "ל״ג בעומר")
+    add(SIVAN, 6, "Shavuot", "שבועות", True)
+    if not israel:
+        add(SIVAN, 7, "Shavuot", "שבועות", True)
+
+    add_fast(TAMMUZ, 17, "Shiva Asar B'Tammuz", "שבעה עשר בתמוז")
+    add_fast(AV, 9, "Tisha B'Av", "תשעה באב")
+    add(ELUL, 29, "Erev Rosh Hashana", "ערב ראש השנה")
+
+    return holidays
+
+
+def _no_parsha(ordinal: int, year: int, israel: bool) -> bool:
+    """Shabbat with a holiday reading instead of the weekly parsha"""
+    _, month, day = from_ordinal(ordinal)
+    if israel and (month, day) in ((TISHREI, 23), (NISAN, 22), (SIVAN, 7)):
+        return False
+    if month == TISHREI and (day in (1, 2, 10) or 15 <= day <= 23):
+        return True
+    if month == NISAN and 15 <= day <= 22:
+        return True
+    return month == SIVAN and day in (6, 7)
+
+
+def _parshiot(year: int, israel: bool) -> dict[int, str]:
+    """The parsha of every shabbat of year (by ordinal), holiday shabbatot are left out.
+    The parshiot are read in order from Simchat Torah, pairs are joined so that Bamidbar is read before Shavuot,
+    Va'etchanan after Tisha B'Av and Nitzavim before Rosh Hashana
+    """
+    queue = [VAYELECH, HAAZINU] + list(range(VAYELECH))
+    rosh_hashana = new_year(year)
+    if date.fromordinal(rosh_hashana).weekday() in (THURSDAY, SATURDAY):
+        queue.pop(0)  # vayelech was read with nitzavim before rosh hashana
+
+    leap = is_leap_year(year)
+    pesach = to_ordinal(year, NISAN, 15)
+    pesach_weekday = date.fromordinal(pesach).weekday()
+    tisha_bav = to_ordinal(year, AV, 9)
+    next_rosh_hashana_weekday = date.fromordinal(new_year(year + 1)).weekday()
+
+    parshiot = {}
+    shabbat = rosh_hashana + (SATURDAY - date.fromordinal(rosh_hashana).weekday()) % 7
+    position = 0
+    while shabbat < new_year(year + 1) and position < len(queue):
+        if _no_parsha(shabbat, year, israel):
+            shabbat += 7
+            continue
+
+        parsha = queue[position]
+        position += 1
+        joined = (
+            (parsha == VAYAKHEL and (pesach - 1 - shabbat) // 7 < 3)
+            or (parsha in (TAZRIA, ACHAREI) and not leap)
+            or (
+                parsha == BEHAR
+                and not leap
+                and (not israel or pesach_weekday != SATURDAY)
+            )
+            or (parsha == CHUKAT and not israel and pesach_weekday == THURSDAY)
+            or (parsha == MATOT and (tisha_bav - shabbat) // 7 < 2)
+            or (
+                parsha == NITZAVIM and next_rosh_hashana_weekday in (THURSDAY, SATURDAY)
+            )
+        )
+        if joined and position < len(queue):
+            parshiot[shabbat] = f"{PARSHIOT[parsha][0]}-{PARSHIOT[queue[position]][0]}"
+            position += 1
+        else:
+            parshiot[shabbat] = PARSHIOT[parsha][0]
+        shabbat += 7
+
+    return parshiot
+
+
+class _Year(NamedTuple):
+    start: int
+    end: int  # ordinal of the next rosh hashana
+    holidays: dict[int, Holiday]
+    parshiot: dict[int, str]
+
+
+class HebrewCalendar:
+    """Holiday, fast, erev and parsha information for any date, see the module docstring
+
+    Args:
+        israel (bool): Israel rules (one day yom tov, Israel's parsha schedule). Defaults to False (Diaspora).
+    """
+
+    def __init__(self, israel: bool = False):
+        self.israel = israel
+        self._years: dict[int, _Year] = {}
+
+    def _year(self, year: int) -> _Year:
+        info = self._years.get(year)
+        if info is None:
+            info = _Year(
+                new_year(year),
+                new_year(year + 1),
+                _holidays(year, self.israel),
+                _parshiot(year, self.israel),
+            )
+            self._years[year] = info
+        return info
+
+    def _year_of(self, ordinal: int, year: int) -> tuple[int, _Year]:
+        info = self._year(year)
+        while ordinal >= info.end:
+            year += 1
+            info = self._year(year)
+        while ordinal < info.start:
+            year -= 1
+            info = self._year(year)
+        return year, info
+
+    def _is_holy(self, ordinal: int, year: int) -> bool:
+        if date.fromordinal(ordinal).weekday() == SATURDAY:
+            return True
+        _, info = self._year_of(ordinal, year)
+        holiday = info.holidays.get(ordinal)
+        return holiday is not None and holiday.yom_tov
+
+    def day(self, d: date) -> CalendarDay:
+        return self.days(d, d)[0]
+
+    def days(self, start: date, end: date) -> list[CalendarDay]:
+        """Information about every date in [start, end]"""
+        first, last = start.toordinal(), end.toordinal()
+        year = from_ordinal(first)[0]
+        months = _months(year)
+        month_index = 0
+        _, info = self._year_of(first, year)
+
+        result = []
+        holy = self._is_holy(first, year)
+        for ordinal in range(first, last + 1):
+            if ordinal >= info.end:
+                year += 1
+                info = self._year(year)
+                months = _months(year)
+                month_index = 0
+            while (
+                month_index + 1 < len(months) and months[month_index + 1][1] <= ordinal
+            ):
+                month_index += 1
+            month, month_start = months[month_index]
+
+            holiday = info.holidays.get(ordinal)
+            next_holy = self._is_holy(ordinal + 1, year)
+            result.append(
+                CalendarDay(
+                    date=date.fromordinal(ordinal),
+                    hebrew_date=(year, month, ordinal - month_start + 1),
+                    holiday=holiday,
+                    parsha=info.parshiot.get(ordinal),
+                    is_shabbat=(ordinal % 7) == 6,
+                    is_yom_tov=holiday is not None and holiday.yom_tov,
+                    is_erev=next_holy,
+                    candles_after_nightfall=next_holy and holy,
+                    is_fast=holiday is not None and holiday.fast,
+                )
+            )
+            holy = next_holy
+        return result
+
+    def holy_days_after(self, d: date) -> int:
+        """Number of consecutive shabbat/yom tov days right after d, 0 if d is not erev shabbat or yom tov (at most 3)"""
+        ordinal = d.toordinal()
+        year = from_ordinal(ordinal)[0]
+        count = 0
+        while count < 3 and self._is_holy(ordinal + count + 1, year):
+            count += 1
+        return count
+
+
+def parsha_heb_name(parsha: str) -> str:
+    """Hebrew name of a parsha returned by HebrewCalendar, e.g. "Vayakhel-Pekudei" -> "ויקהל-פקודי" """
+    names = dict(PARSHIOT)
+    return "-".join(names[part] for part in _split_parsha(parsha))
+
+
+def _split_parsha(parsha: str) -> list[str]:
+    names = {eng for eng, _ in PARSHIOT}
+    if parsha in names:
+        return [parsha]
+    for eng in names:
+        if parsha.startswith(eng + "-") and parsha[len(eng) + 1 :] in names:
+            return [eng, parsha[len(eng) + 1 :]]
+    raise ValueError(f"Unknown parsha: {parsha}")
+
+
+def is_israel(time_zone_name: str) -> bool:
+    """Whether a chabad.org time zone name (e.g. "Israel", "Asia*Jerusalem") is in Israel"""
+    return time_zone_name in ("Israel", "Asia*Jerusalem", "Asia*Tel_Aviv")
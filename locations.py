@@ -8,6 +8,11 @@ class TimeZone(BaseModel):
     utc_offset: str
     extended_name: str
 
+    @property
+    def iana_name(self) -> str:
+        """The IANA name of the time zone, chabad.org uses * instead of / and ~ instead of +"""
+        return self.name.replace("*", "/").replace("~", "+")
+
 
 class TimeZones(Enum):
     """Enum of all timezones in the Chabad API"""
@@ -728,12 +733,12 @@ class Coordinates(BaseModel):
     # read only field
     type: LocationType = Field(LocationType.COORDINATES, const=True)
 
-    @validator("http_format")
-    def http_format_validator(cls, v):
+    @validator("http_format", always=True)
+    def http_format_validator(cls, v, values):
         if v:
             raise ValueError("http_format is read only")
 
-        return f"{cls.lat},{cls.lon}"
+        return f"{values.get('lat')},{values.get('lon')}"
 
 
 class CityInfo(BaseModel):
@@ -741,6 +746,9 @@ class CityInfo(BaseModel):
     eng_name: str
     location_id: int
     astral_city_name: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    time_zone: Optional[TimeZone] = None
 
     # read only field
     type: LocationType = Field(LocationType.CITY, const=True)
@@ -749,6 +757,7 @@ class CityInfo(BaseModel):
 class Location(BaseModel):
     city: Optional[CityInfo] = None
     coordinates: Optional[Coordinates] = None
+    zip_code: Optional[str] = None
 
     # read only field
     type: Optional[LocationType] = None
@@ -760,10 +769,13 @@ class Location(BaseModel):
             raise ValueError("type is read only")
 
         # duplicate or no location was provided
-        if values.get("city") and values.get("coordinates"):
+        provided = [
+            key for key in ("city", "coordinates", "zip_code") if values.get(key)
+        ]
+        if len(provided) > 1:
             raise ValueError("Only one type of location is allowed")
 
-        if values.get("city") is None and values.get("coordinates") is None:
+        if not provided:
             raise ValueError("No/invalid location was provided")
 
         # set the type of location
@@ -771,9 +783,35 @@ class Location(BaseModel):
             values["type"] = LocationType.CITY
         if values.get("coordinates"):
             values["type"] = LocationType.COORDINATES
+        if values.get("zip_code"):
+            values["type"] = LocationType.ZIP_CODE
 
         return values
 
+    @classmethod
+    def for_city(cls, city: CityInfo) -> "Location":
+        """Get the location of a city without running the validators, the instance is shared so don't modify it"""
+        location = _city_locations.get(city.location_id)
+        if location is None:
+            location = cls.construct(
+                city=city, coordinates=None, zip_code=None, type=LocationType.CITY
+            )
+            _city_locations[city.location_id] = location
+        return location
+
+    @classmethod
+    def for_coordinates(cls, coordinates: Coordinates) -> "Location":
+        """Get the location of already validated coordinates without running the validators"""
+        return cls.construct(
+            city=None,
+            coordinates=coordinates,
+            zip_code=None,
+            type=LocationType.COORDINATES,
+        )
+
+
+_city_locations: dict[int, Location] = {}
+
 
 class Cities(Enum):
     """Enum of of popular cities. I will happaly add more cities if you ask.
@@ -782,20 +820,47 @@ class Cities(Enum):
 
     JERUSALEM: CityInfo = (
         CityInfo(
-            heb_name="ירושלים", eng_name="Jerusalem", location_id=247, location_type=1
+            heb_name="ירושלים",
+            eng_name="Jerusalem",
+            location_id=247,
+            location_type=1,
+            astral_city_name="Jerusalem",
+            latitude=31.7683,
+            longitude=35.2137,
+            time_zone=TimeZones.JERUSALEM.value,
         ),
     )
     TEL_AVIV: CityInfo = (
         CityInfo(
-            heb_name="תל אביב", eng_name="Tel Aviv", location_id=531, location_type=1
+            heb_name="תל אביב",
+            eng_name="Tel Aviv",
+            location_id=531,
+            location_type=1,
+            latitude=32.0853,
+            longitude=34.7818,
+            time_zone=TimeZones.JERUSALEM.value,
         ),
     )
     HAIFA: CityInfo = (
-        CityInfo(heb_name="חיפה", eng_name="Haifa", location_id=689, location_type=1),
+        CityInfo(
+            heb_name="חיפה",
+            eng_name="Haifa",
+            location_id=689,
+            location_type=1,
+            latitude=32.7940,
+            longitude=34.9896,
+            time_zone=TimeZones.JERUSALEM.value,
+        ),
     )
     BEER_SHEVA: CityInfo = (
         CityInfo(
-            heb_name="באר שבע", eng_name="Beer Sheva", location_id=688, location_type=1
+            heb_name="באר שבע",
+            eng_name="Beer Sheva",
+            location_id=688,
+            location_type=1,
+            latitude=31.2518,
+            longitude=34.7913,
+            time_zone=TimeZones.JERUSALEM.value,
         ),
     )
 
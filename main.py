@@ -1,6 +1,7 @@
+import logging
+import sys
 import yaml
-from datetime import datetime
-import time
+from datetime import date, datetime
 import pytz
 import tweepy
 
@@ -8,11 +9,18 @@ import tweepy
 from astral.sun import sun
 from astral.geocoder import database, lookup
 
+import sun_table
+
 # from tweet_parameters import placeholders
 
 
 def get_next_sunrise(city: str):
     """Returns the next sunrise time for the specified city as a UTC datetime object."""
+    # use the precomputed table when the city and date are in it (see sun_table.py)
+    sunrise = sun_table.lookup(city, date.today())
+    if sunrise is not None:
+        return sunrise
+
     # get a LocationInfo object for the specified city
     try:
         city = lookup(city, database())
@@ -30,22 +38,6 @@ def tweet(api, tweet_content):
     print(f"Tweeted: {tweet_content} at {datetime.now()}")
 
 
-def convert_utc_to_local(utc_datetime: datetime):
-    """Converts a UTC datetime object to a system local datetime object."""
-    return utc_datetime.astimezone(pytz.timezone(time.tzname[0]))
-
-
-def is_sunrise(city: str):
-    """Returns True if it is currently sunrise in the specified city, otherwise returns False."""
-    # get the next sunrise time for the specified city
-    sun = get_next_sunrise(city)
-    # get the local time for the next sunrise time for the specified city
-    l_sun = convert_utc_to_local(sun)
-
-    l_time = datetime.now()
-    return l_sun.hour == l_time.hour and l_sun.minute == l_time.minute
-
-
 def fill_tweet_placeholder(tweet_content: str, *values: str):
     """Replaces the placeholders in the tweet content with the specified values (if any)."""
     # if no values are passed, return the tweet content as is
@@ -59,9 +51,18 @@ def fill_tweet_placeholder(tweet_content: str, *values: str):
 
 # ZmanimAPI Sectoin added as an extra to this file
 from zmanim_api import *
-
-
-def get_loc_with_zmanim() -> list[dict]:
+from scheduler import (
+    Job,
+    Scheduler,
+    create_trigger,
+    location_from_config,
+    location_time_zone,
+)
+from profiling import Profiler
+from zoneinfo import ZoneInfo
+
+
+def get_loc_with_zmanim(day: Optional[date] = None) -> list[dict]:
     locations = [
         {"city": Cities.JERUSALEM, "zmanim": None},
         {"city": Cities.TEL_AVIV, "zmanim": None},
@@ -70,7 +71,9 @@ def get_loc_with_zmanim() -> list[dict]:
     ]
 
     for location in locations:
-        zmanim = ZmanimAPI.get_zmanim(date=date.today(), city=location["city"])
+        zmanim = ZmanimAPI.get_zmanim(
+            date=day or date.today(), city=location["city"], lazy=True
+        )
         location["zmanim"] = zmanim[0].get_important_zmanim()
 
     return locations
@@ -94,24 +97,107 @@ def format_zmanim_for_tweet(zmanim: list[dict]) -> str:
     return tweet
 
 
+def format_location_zmanim_for_tweet(zmanim_day: ZmanimDay) -> str:
+    """Format the important zmanim of a single location for the tweet"""
+    return "".join(
+        f"{zman.heb_title}: {zman.time}\n" for zman in zmanim_day.get_important_zmanim()
+    )
+
+
+def get_twitter_api(account: dict, apis: dict) -> tweepy.API:
+    """Create (once per account) an API client using the Twitter API keys and tokens"""
+    key = (account["consumerKey"], account["accessToken"])
+    if key not in apis:
+        auth = tweepy.OAuthHandler(account["consumerKey"], account["consumerSecret"])
+        auth.set_access_token(account["accessToken"], account["accessTokenSecret"])
+        apis[key] = tweepy.API(auth)
+    return apis[key]
+
+
+def create_tweet_action(api, tweet_content: str, location: Optional[dict]):
+    def action(job: Job, fire_time: datetime):
+        if location is None:
+            # the default locations are all in Israel
+            day = fire_time.astimezone(
+                ZoneInfo(TimeZones.JERUSALEM.value.iana_name)
+            ).date()
+            zmanim_str = format_zmanim_for_tweet(get_loc_with_zmanim(day))
+        else:
+            time_zone = ZoneInfo(location_time_zone(location).iana_name)
+            zmanim_day = ZmanimAPI.get_zmanim(
+                date=fire_time.astimezone(time_zone).date(), lazy=True, **location
+            )[0]
+            zmanim_str = format_location_zmanim_for_tweet(zmanim_day)
+        tweet(api, fill_tweet_placeholder(tweet_content, zmanim_str))
+
+    return action
+
+
+def job_configs(config: dict) -> list[dict]:
+    """The configs of the jobs, every one with a name.
+    Without a jobs section, a single job tweets the zmanim of all the cities at the sunrise of config["city"]
+    """
+    configs = config.get("jobs") or [
+        {
+            "name": "default",
+            "trigger": {"type": "sunrise", "city": config["city"]},
+            "tweetContent": config["tweetContent"],
+        }
+    ]
+    return [{"name": f"job-{i}", **job_config} for i, job_config in enumerate(configs)]
+
+
+def load_jobs(config: dict, get_api=get_twitter_api) -> list[Job]:
+    """Create the jobs from the config, see job_configs
+
+    get_api(account, apis) creates the client a job tweets with, see simulation.py for a fake one.
+    """
+    apis = {}
+    jobs = []
+    for job_config in job_configs(config):
+        location = location_from_config(job_config.get("location"))
+        api = get_api(job_config.get("account", config), apis)
+        jobs.append(
+            Job(
+                name=job_config["name"],
+                trigger=create_trigger(job_config["trigger"], location),
+                action=create_tweet_action(
+                    api,
+                    job_config.get("tweetContent", config.get("tweetContent")),
+                    location,
+                ),
+            )
+        )
+    return jobs
+
+
 def main():
     # read the config data from the config.yaml file. this is a yaml file because it's easier to read and write than a json file
     with open("config.yaml", "r") as f:
         config = yaml.safe_load(f)
 
-    # create an API client using the Twitter API keys and tokens from the config
-    auth = tweepy.OAuthHandler(config["consumerKey"], config["consumerSecret"])
-    auth.set_access_token(config["accessToken"], config["accessTokenSecret"])
-    api = tweepy.API(auth)
-
-    # after sunrise is reached, hold for 22 hours and start checking again
-    while True:
-        if is_sunrise(config["city"]):
-            zmanim_str = format_zmanim_for_tweet(get_loc_with_zmanim())
-            tweet(api, fill_tweet_placeholder(config["tweetContent"], zmanim_str))
-            time.sleep(22 * 60 * 60)
-        else:
-            time.sleep(60)
+    # optional tuning of the chabad.org client (hedged requests, circuit breaker)
+    if config.get("chabadApi"):
+        ZmanimAPI.chabad_api = ChabadAPI.from_config(config["chabadApi"])
+
+    # opt-in profiling (ZMANIM_PROFILE env var or the profile section), every job fire is reported as a run
+    profiler = Profiler.from_config(config)
+    if profiler:
+        profiler.instrument([(sys.modules[__name__], "tweet", "tweet")])
+
+    # failed jobs and next fire times that are retried are logged
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    # all the jobs run from a single thread, each one fires when its trigger is due,
+    # the next fire times are computed in the background (a chabad.org outage only delays them)
+    scheduler = Scheduler()
+    for job in load_jobs(config):
+        if profiler:
+            job.action = profiler.runs(job.action, job.name)
+        scheduler.add(job)
+    scheduler.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""Fetch zmanim for many locations at once
+
+The pydantic validation and parsing of the responses is CPU bound, so with thousands of locations
+a single process is limited by the GIL even though the http requests run in threads.
+Here the locations are split into chunks that are handled by a pool of worker processes,
+every worker does its own I/O with a thread pool and sends back the days as plain tuples
+(see ZmanimDay.to_compact) instead of pickled pydantic models.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Optional, Union
+from chabad_org_wrapper import ChabadAPI, Cities, Coordinates
+from zmanim_api import ZmanimAPI, ZmanimDay
+
+
+def _init_worker(api_factory: Optional[Callable[[], ChabadAPI]]) -> None:
+    if api_factory is not None:
+        ZmanimAPI.chabad_api = api_factory()
+
+
+def _fetch_one(location: Union[Cities, dict], start_date: date, days: int) -> list:
+    if isinstance(location, Cities):
+        zmanim_days = ZmanimAPI.get_zmanim(start_date, days, city=location)
+    else:
+        zmanim_days = ZmanimAPI.get_zmanim(
+            start_date, days, coordinates=Coordinates(**location)
+        )
+    return [day.to_compact() for day in zmanim_days]
+
+
+def _fetch_chunk(
+    chunk: list[Union[Cities, dict]], start_date: date, days: int, threads: int
+) -> list[list]:
+    with ThreadPoolExecutor(threads) as executor:
+        return list(
+            executor.map(lambda location: _fetch_one(location, start_date, days), chunk)
+        )
+
+
+def fetch_many_compact(
+    locations: list[Union[Cities, Coordinates]],
+    start_date: date,
+    days: int = 1,
+    processes: Optional[int] = None,
+    threads: int = 8,
+    chunk_size: int = 50,
+    api_factory: Optional[Callable[[], ChabadAPI]] = None,
+) -> list[list[tuple]]:
+    """Same as fetch_many, but the days are returned in the compact tuple format"""
+    # coordinates are sent to the workers as plain dicts
+    locations = [
+        location.dict(exclude={"http_format", "type"})
+        if isinstance(location, Coordinates)
+        else location
+        for location in locations
+    ]
+    chunks = [
+        locations[i : i + chunk_size] for i in range(0, len(locations), chunk_size)
+    ]
+    processes = processes or os.cpu_count() or 1
+
+    results = []
+    with ProcessPoolExecutor(
+        processes, initializer=_init_worker, initargs=(api_factory,)
+    ) as pool:
+        for chunk_result in pool.map(
+            _fetch_chunk,
+            chunks,
+            [start_date] * len(chunks),
+            [days] * len(chunks),
+            [threads] * len(chunks),
+        ):
+            results.extend(chunk_result)
+
+    return results
+
+
+def fetch_many(
+    locations: list[Union[Cities, Coordinates]],
+    start_date: date,
+    days: int = 1,
+    processes: Optional[int] = None,
+    threads: int = 8,
+    chunk_size: int = 50,
+    api_factory: Optional[Callable[[], ChabadAPI]] = None,
+) -> list[list[ZmanimDay]]:
+    """Get zmanim for many locations using a pool of worker processes
+
+    Example:
+        >>> results = fetch_many([Cities.JERUSALEM, Cities.TEL_AVIV], date(2023, 1, 6), days=7, processes=2)
+        >>> results[1][0].get_important_zmanim()  # Tel Aviv, first day
+
+    Args:
+        locations (list[Union[Cities, Coordinates]]): The locations to get zmanim for
+        start_date (date): The first date to get zmanim for
+        days (int, optional): The number of days to get zmanim for. Defaults to 1.
+        processes (Optional[int], optional): Number of worker processes. Defaults to the number of cores.
+        threads (int, optional): Number of concurrent requests in each worker. Defaults to 8.
+        chunk_size (int, optional): Number of locations sent to a worker at a time. Defaults to 50.
+        api_factory (Optional[Callable[[], ChabadAPI]], optional): Creates the ChabadAPI client used in each worker,
+            must be picklable (a module level function or class). Defaults to the ZmanimAPI default client.
+
+    Returns:
+        list[list[ZmanimDay]]: The days of every location, in the same order as locations
+    """
+    return [
+        [ZmanimDay.from_compact(day) for day in location_days]
+        for location_days in fetch_many_compact(
+            locations, start_date, days, processes, threads, chunk_size, api_factory
+        )
+    ]
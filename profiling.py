@@ -0,0 +1,339 @@
+"""Opt-in profiling of the stages of a run (fetch, validate, decode, format, enrich, tweet)
+
+Enabled with the ZMANIM_PROFILE environment variable (the output directory) or the profile section of config.yaml:
+
+    profile:
+      directory: profiles
+      memory: true  # tracemalloc, slows everything down
+
+When enabled, the stage functions are replaced by wrappers that switch cProfile profilers, so a stage's
+CPU time doesn't include the stages nested in it. When disabled nothing is replaced, so there is no overhead.
+
+Every run (e.g. a job fire, see Profiler.run) writes a directory with:
+    summary.txt          calls, wall and CPU time and net allocated memory of every stage
+    <stage>.pstats       cProfile stats of the stage, `python -m pstats <file>`
+    <stage>.collapsed    the same as collapsed stacks, for flamegraph.pl or speedscope
+    run.pstats, run.collapsed    all the stages together
+    <stage>.snapshot     tracemalloc snapshot after the first call of the stage, `tracemalloc.Snapshot.load(path)`
+    run.snapshot         tracemalloc snapshot at the end of the run
+"""
+
+import contextlib
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Optional
+
+ENV_VAR = "ZMANIM_PROFILE"
+
+
+class _Run:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.profiles: dict[str, list[cProfile.Profile]] = defaultdict(list)
+        self.calls = Counter()
+        self.wall = Counter()
+        self.allocated = Counter()
+        self.snapshots: dict[str, tracemalloc.Snapshot] = {}
+        self.lock = threading.Lock()
+
+
+class Profiler:
+    """Collects per stage cProfile stats and tracemalloc snapshots, see the module docstring
+
+    Example:
+        >>> profiler = Profiler("profiles")
+        >>> profiler.instrument()
+        >>> with profiler.run("friday"):
+        ...     ZmanimAPI.get_zmanim(date(2023, 1, 6), city=Cities.JERUSALEM)
+
+    Args:
+        directory (str): Where the reports of the runs are written.
+        memory (bool): Trace allocations with tracemalloc. Defaults to False.
+    """
+
+    def __init__(self, directory: str, memory: bool = False):
+        self.directory = directory
+        self.memory = memory
+        self._current: Optional[_Run] = None
+        self._local = threading.local()
+        self._patched: list[tuple[object, str, object]] = []
+        self._tracing = False
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> Optional["Profiler"]:
+        """Create a profiler from the ZMANIM_PROFILE env var or the profile config section, None if neither is set"""
+        directory = os.environ.get(ENV_VAR)
+        section = (config or {}).get("profile")
+        if directory:
+            return cls(directory, memory=bool(section and section.get("memory")))
+        if section:
+            return cls(
+                section.get("directory", "profiles"),
+                memory=section.get("memory", False),
+            )
+        return None
+
+    def instrument(self, extra: Optional[list[tuple[object, str, str]]] = None) -> None:
+        """Wrap the stage functions, extra is a list of (owner, attribute, stage) to wrap as well"""
+        from pydantic import BaseModel
+        import zmanim_api
+        from chabad_org_wrapper import ChabadAPI
+        from zmanim_api import ZmanimAPI
+
+        stages = [
+            (ChabadAPI, "get_zmanim", "fetch"),
+            (BaseModel, "__init__", "validate"),
+            (zmanim_api, "decode_response", "decode"),
+            (ZmanimAPI, "format_day", "format"),
+            (ZmanimAPI, "enrich_with_special_times", "enrich"),
+        ]
+        for owner, attribute, stage in stages + (extra or []):
+            self.wrap(owner, attribute, stage)
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            self._tracing = True
+
+    def uninstrument(self) -> None:
+        for owner, attribute, original in reversed(self._patched):
+            setattr(owner, attribute, original)
+        self._patched.clear()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def wrap(self, owner: object, attribute: str, stage: str) -> None:
+        """Replace owner.attribute (a function, method, staticmethod or classmethod) with a wrapper timing it as stage"""
+        original = inspect.getattr_static(owner, attribute)
+        if isinstance(original, (staticmethod, classmethod)):
+            function = original.__func__
+            wrapper = type(original)(self._wrapper(function, stage))
+        else:
+            wrapper = self._wrapper(original, stage)
+        self._patched.append((owner, attribute, original))
+        setattr(owner, attribute, wrapper)
+
+    def _wrapper(self, function: Callable, stage: str) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.stage(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def _profile(self, run: _Run, stage: str) -> cProfile.Profile:
+        """The profiler of the stage in this thread, cProfile profilers can't be shared between threads"""
+        profiles = getattr(self._local, "profiles", None)
+        if profiles is None or self._local.run is not run:
+            profiles = self._local.profiles = {}
+            self._local.run = run
+        profile = profiles.get(stage)
+        if profile is None:
+            profile = profiles[stage] = cProfile.Profile()
+            with run.lock:
+                run.profiles[stage].append(profile)
+        return profile
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """Profile the code in the block as stage, outside of a run nothing is collected"""
+        run = self._current
+        if run is None:
+            yield
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack and stack[-1][0] == stage:
+            yield  # a recursive call (e.g. validating a nested model) stays in the same profiler
+            return
+
+        if stack:
+            stack[-1][1].disable()
+        profile = self._profile(run, stage)
+        stack.append((stage, profile))
+        started = time.perf_counter()
+        memory_before = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        try:
+            profile.enable()
+        except ValueError:
+            # python 3.12+ allows a single active profiler, another thread is profiling a stage
+            profile = None
+            stack[-1] = (stage, _NotProfiled)
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            stack.pop()
+            with run.lock:
+                run.calls[stage] += 1
+                run.wall[stage] += time.perf_counter() - started
+                if self.memory:
+                    run.allocated[stage] += (
+                        tracemalloc.get_traced_memory()[0] - memory_before
+                    )
+                    take_snapshot = stage not in run.snapshots
+                    if take_snapshot:
+                        run.snapshots[stage] = None  # taken below, outside of the lock
+            if self.memory and take_snapshot:
+                run.snapshots[stage] = tracemalloc.take_snapshot()
+            if stack:
+                stack[-1][1].enable()
+
+    @contextlib.contextmanager
+    def run(self, name: str):
+        """Collect the stages called in the block (in any thread) as a run, the report is written when the block ends"""
+        run = _Run(name)
+        previous, self._current = self._current, run
+        try:
+            with self.stage("run"):
+                yield run
+        finally:
+            self._current = previous
+            self.write(run)
+
+    def write(self, run: _Run) -> str:
+        """Write the reports of a run, returns its directory"""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        directory = os.path.join(
+            self.directory, f"{stamp}-{re.sub(r'[^A-Za-z0-9_.-]', '_', run.name)}"
+        )
+        os.makedirs(directory, exist_ok=True)
+
+        everything = []
+        lines = [f"run {run.name}: {time.perf_counter() - run.started:.3f}s", ""]
+        lines.append(
+            f"{'stage':<12}{'calls':>8}{'wall s':>10}{'cpu s':>10}{'alloc KB':>12}"
+        )
+        for stage, profiles in sorted(run.profiles.items()):
+            stats = _merge(profiles)
+            if stats is None:
+                continue
+            stats.dump_stats(os.path.join(directory, f"{stage}.pstats"))
+            _write_collapsed(stats, os.path.join(directory, f"{stage}.collapsed"))
+            everything.extend(profiles)
+            lines.append(
+                f"{stage:<12}{run.calls[stage]:>8}{run.wall[stage]:>10.3f}{stats.total_tt:>10.3f}"
+                + (
+                    f"{run.allocated[stage] / 1024:>12.1f}"
+                    if self.memory
+                    else f"{'-':>12}"
+                )
+            )
+
+        stats = _merge(everything)
+        if stats is not None:
+            stats.dump_stats(os.path.join(directory, "run.pstats"))
+            _write_collapsed(stats, os.path.join(directory, "run.collapsed"))
+
+        if self.memory:
+            for stage, snapshot in run.snapshots.items():
+                if snapshot is not None:
+                    snapshot.dump(os.path.join(directory, f"{stage}.snapshot"))
+            tracemalloc.take_snapshot().dump(os.path.join(directory, "run.snapshot"))
+            lines += [
+                "",
+                "(alloc is the net memory still allocated after the stage, nested stages included)",
+            ]
+
+        with open(os.path.join(directory, "summary.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return directory
+
+    def runs(self, function: Callable, name: str) -> Callable:
+        """Wrap function so that every call is profiled as a run"""
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.run(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+
+class _NotProfiled:
+    @staticmethod
+    def enable() -> None:
+        pass
+
+    @staticmethod
+    def disable() -> None:
+        pass
+
+
+def _merge(profiles: list[cProfile.Profile]) -> Optional[pstats.Stats]:
+    stats = None
+    for profile in profiles:
+        profile.create_stats()
+        if not profile.stats:
+            continue
+        if stats is None:
+            stats = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+    return stats
+
+
+def _frame_name(function: tuple) -> str:
+    filename, line, name = function
+    if filename == "~":
+        return name  # built-in
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def _write_collapsed(
+    stats: pstats.Stats, path: str, max_depth: int = 64, min_seconds: float = 1e-5
+) -> None:
+    """Write the stats as collapsed stacks ("a;b;c microseconds" lines).
+    cProfile only records caller -> callee edges, so the time of a function called from several places is
+    split between the stacks by the time spent through each caller. Branches under min_seconds are dropped.
+    """
+    callees = defaultdict(list)
+    roots = []
+    for function, (_, _, _, cumulative, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, edge in callers.items():
+            callees[caller].append((function, edge[3]))
+
+    lines = Counter()
+
+    def walk(
+        function: tuple, fraction: float, stack: list[str], seen: frozenset
+    ) -> None:
+        _, _, own, cumulative, _ = stats.stats[function]
+        if cumulative * fraction < min_seconds:
+            return
+        stack = stack + [_frame_name(function)]
+        microseconds = round(own * fraction * 1e6)
+        if microseconds:
+            lines[";".join(stack)] += microseconds
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_cumulative in callees[function]:
+            if callee in seen:
+                continue
+            callee_cumulative = stats.stats[callee][3]
+            if callee_cumulative <= 0:
+                continue
+            share = min(1.0, edge_cumulative / callee_cumulative)
+            walk(callee, fraction * share, stack, seen | {callee})
+
+    for root in roots:
+        walk(root, 1.0, [], frozenset([root]))
+
+    with open(path, "w") as f:
+        for stack, microseconds in lines.items():
+            f.write(f"{stack} {microseconds}\n")
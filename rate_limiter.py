@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no token is available and the policy is to fail fast"""
+
+
+class TokenBucket:
+    """A token bucket shared by all the processes on the host
+
+    The bucket state (tokens left and last refill time) is a single row in a small sqlite database,
+    every acquire is one short `BEGIN IMMEDIATE` transaction so processes never hand out the same token twice.
+    When blocking, the token is reserved inside the transaction (the bucket may go negative) and the waiting
+    is done outside of it, so waiting callers are served in order and don't hold the lock.
+
+    Example:
+        >>> limiter = TokenBucket(rate=5, burst=10)
+        >>> limiter.acquire()  # blocks until a token is available
+
+    Args:
+        rate (float): Tokens added per second, this is the sustained request rate.
+        burst (int): Maximum number of tokens in the bucket.
+        path (Optional[str]): The sqlite file, all processes that share it share the bucket. Defaults to a file in the temp dir.
+        name (str): Name of the bucket, so a single file can hold several buckets. Defaults to "chabad.org".
+        policy (str): "block" to wait for a token, "fail" to raise RateLimitExceeded. Defaults to "block".
+        max_wait (Optional[float]): When blocking, raise RateLimitExceeded instead of waiting longer than this. Defaults to no limit.
+    """
+
+    BLOCK = "block"
+    FAIL = "fail"
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        path: Optional[str] = None,
+        name: str = "chabad.org",
+        policy: str = BLOCK,
+        max_wait: Optional[float] = None,
+    ):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+
+        if policy not in (self.BLOCK, self.FAIL):
+            raise ValueError(f"policy must be '{self.BLOCK}' or '{self.FAIL}'")
+
+        self.rate = rate
+        self.burst = burst
+        self.path = path or os.path.join(
+            tempfile.gettempdir(), "chabad_rate_limit.sqlite"
+        )
+        self.name = name
+        self.policy = policy
+        self.max_wait = max_wait
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _take(self, tokens: int, reserve: bool) -> float:
+        """Take tokens from the bucket, return how long the caller has to wait before using them.
+        If reserve is False and there are not enough tokens, nothing is taken and -1 is returned.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            available = float(self.burst) if row is None else row[0]
+            if row is not None:
+                available = min(
+                    float(self.burst), available + (now - row[1]) * self.rate
+                )
+
+            wait = max(0.0, (tokens - available) / self.rate)
+            if wait and (
+                not reserve or (self.max_wait is not None and wait > self.max_wait)
+            ):
+                conn.execute("ROLLBACK")
+                return -1
+
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, available - tokens, now),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """Take tokens only if they are available right now, never waits"""
+        return self._take(tokens, reserve=False) == 0
+
+    def acquire(self, tokens: int = 1) -> float:
+        """Take tokens according to the policy
+
+        Returns:
+            float: The number of seconds spent waiting
+        """
+        wait = self._take(tokens, reserve=self.policy == self.BLOCK)
+        if wait < 0:
+            raise RateLimitExceeded(
+                f"Rate limit of {self.rate}/s for {self.name} reached"
+            )
+
+        if wait:
+            time.sleep(wait)
+        return wait
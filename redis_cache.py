@@ -0,0 +1,431 @@
+"""A response cache on a Redis server, shared by all the nodes, and a small Redis-protocol server to test it with
+
+RedisCache speaks RESP (the Redis protocol) over a plain socket, no client package is needed.
+Entries are stored as a short header (time added and encoding) and compact JSON, compressed with zlib above
+a size, which is smaller and faster to decode than pickled pydantic models. Entries are kept retention
+seconds after their ttl, so expired responses can still be served while chabad.org is down.
+get_many and set_many send all their commands at once (MGET, pipelined SETs), a single round trip.
+
+Network errors never fail a request: the lookup is a miss, the write is dropped (counted in stats["errors"]),
+and the connection is opened again on the next call. A value that can't be decoded (corrupt, or written by something
+else under the prefix) is a miss too, counted in stats["corrupt"].
+
+The stand-in server keeps the data in memory and supports the commands the cache uses
+(PING, GET, SET with EX/PX, MGET, DEL, EXISTS, DBSIZE, FLUSHDB, QUIT):
+
+    python redis_cache.py --port 6379
+"""
+
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Optional
+from urllib.parse import urlparse
+from cache import CacheBackend
+
+
+class RedisError(Exception):
+    """An error reply from the server"""
+
+
+class RedisConnection:
+    """A single connection speaking RESP, not thread safe"""
+
+    def __init__(
+        self, host: str, port: int, db: int = 0, timeout: Optional[float] = 2.0
+    ):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if db:
+            self.execute("SELECT", db)
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisError(f"Unknown reply: {line!r}")
+
+    def execute(self, *args) -> Any:
+        self.sock.sendall(self.encode(*args))
+        return self.read_reply()
+
+    def pipeline(self, commands: list[tuple]) -> list[Any]:
+        """Send all the commands at once and read their replies, error replies are returned as RedisError objects"""
+        self.sock.sendall(b"".join(self.encode(*command) for command in commands))
+        replies = []
+        for _ in commands:
+            try:
+                replies.append(self.read_reply())
+            except RedisError as e:
+                replies.append(e)
+        return replies
+
+
+class RedisCache(CacheBackend):
+    """Response cache on a Redis server (or anything speaking its protocol), see the module docstring
+
+    Example:
+        >>> cache = RedisCache("redis://cache.internal:6379/0", ttl=24 * 60 * 60)
+        >>> api = ChabadAPI(cache=cache)
+
+    Args:
+        url (str): redis://host:port/db
+        ttl (float): Seconds an entry is fresh. Defaults to 24 hours.
+        retention (float): Seconds an entry is kept after it expired, for serving while chabad.org is down. Defaults to 7 days.
+        prefix (str): Prefix of the keys, so several caches can share a database. Defaults to "zmanim:".
+        compress_above (int): JSON larger than this (bytes) is compressed with zlib. Defaults to 1024.
+        timeout (float): Socket timeout in seconds. Defaults to 2.
+    """
+
+    JSON = b"j"
+    ZLIB = b"z"
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        ttl: float = 24 * 60 * 60,
+        retention: float = 7 * 24 * 60 * 60,
+        prefix: str = "zmanim:",
+        compress_above: int = 1024,
+        timeout: float = 2.0,
+    ):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported cache url: {url}")
+
+        self.url = url
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.ttl = ttl
+        self.retention = retention
+        self.prefix = prefix
+        self.compress_above = compress_above
+        self.timeout = timeout
+        self.stats = Counter()
+        self._local = threading.local()
+
+    def _connection(self) -> RedisConnection:
+        # a connection per thread, the replies of concurrent requests must not interleave
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = RedisConnection(
+                self.host, self.port, self.db, self.timeout
+            )
+        return conn
+
+    def _reset(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, function, default):
+        try:
+            return function(self._connection())
+        except (OSError, ConnectionError, RedisError):
+            self.stats["errors"] += 1
+            self._reset()
+            return default
+
+    def encode(self, value: Any) -> bytes:
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        encoding = self.JSON
+        if len(data) > self.compress_above:
+            data = zlib.compress(data, 6)
+            encoding = self.ZLIB
+        return b"%.3f %s\n%s" % (time.time(), encoding, data)
+
+    def decode(self, data: bytes) -> tuple[float, Any]:
+        """(age in seconds, value) of a stored entry"""
+        header, _, body = data.partition(b"\n")
+        added, encoding = header.split(b" ")
+        if encoding == self.ZLIB:
+            body = zlib.decompress(body)
+        return time.time() - float(added), json.loads(body)
+
+    def _decode(self, data: Optional[bytes]) -> Optional[tuple[float, Any]]:
+        """decode, None when there is no value or it can't be decoded"""
+        if data is None:
+            return None
+        try:
+            return self.decode(data)
+        except (ValueError, zlib.error):
+            self.stats["corrupt"] += 1
+            return None
+
+    def __len__(self) -> int:
+        """The number of keys in the database, including keys of other prefixes"""
+        return self._call(lambda conn: conn.execute("DBSIZE"), 0)
+
+    def entry(self, key: str) -> Optional[tuple[float, Any]]:
+        data = self._call(lambda conn: conn.execute("GET", self.prefix + key), None)
+        return self._decode(data)
+
+    def get(self, key: str, allow_expired: bool = False) -> Optional[Any]:
+        entry = self.entry(key)
+        if entry is None or (not allow_expired and entry[0] > self.ttl):
+            if not allow_expired:
+                self.stats["misses"] += 1
+            return None
+
+        if not allow_expired:
+            self.stats["hits"] += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self._call(
+            lambda conn: conn.execute(
+                "SET", self.prefix + key, self.encode(value), "PX", self._expiry()
+            ),
+            None,
+        )
+
+    def _expiry(self) -> int:
+        return int((self.ttl + self.retention) * 1000)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Get the fresh values of many keys with a single MGET"""
+        if not keys:
+            return {}
+        replies = self._call(
+            lambda conn: conn.execute("MGET", *(self.prefix + key for key in keys)),
+            [None] * len(keys),
+        )
+        values = {}
+        for key, data in zip(keys, replies):
+            entry = self._decode(data)
+            if entry is not None and entry[0] <= self.ttl:
+                values[key] = entry[1]
+        self.stats["hits"] += len(values)
+        self.stats["misses"] += len(keys) - len(values)
+        return values
+
+    def set_many(self, values: dict[str, Any]) -> None:
+        """Set many entries with pipelined SETs, a single round trip"""
+        if not values:
+            return
+        expiry = self._expiry()
+        commands = [
+            ("SET", self.prefix + key, self.encode(value), "PX", expiry)
+            for key, value in values.items()
+        ]
+        self._call(lambda conn: conn.pipeline(commands), None)
+
+
+class LocalRedisServer:
+    """An in memory server speaking enough of the Redis protocol for RedisCache, for tests and local runs
+
+    Example:
+        >>> server = LocalRedisServer()
+        >>> server.start()
+        >>> cache = RedisCache(server.url)
+        >>> server.stop()
+
+    Args:
+        host (str): Address to listen on. Defaults to 127.0.0.1.
+        port (int): Port to listen on, 0 for any free port. Defaults to 0.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.data: dict[
+            bytes, tuple[bytes, Optional[float]]
+        ] = {}  # key -> (value, expires at)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self._connections: set[socket.socket] = set()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server._connections.add(self.connection)
+
+            def finish(self):
+                with server.lock:
+                    server._connections.discard(self.connection)
+                try:
+                    super().finish()
+                except OSError:
+                    pass  # closed by stop()
+
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                while True:
+                    try:
+                        command = _read_command(self.rfile)
+                    except (OSError, ValueError):
+                        return
+                    if command is None:
+                        return
+                    if not command:
+                        continue
+                    reply = server.execute(command)
+                    try:
+                        self.wfile.write(reply)
+                    except OSError:
+                        return
+                    if command[0].upper() == b"QUIT":
+                        return
+
+        self._server = socketserver.ThreadingTCPServer(
+            (host, port), Handler, bind_and_activate=False
+        )
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until stop() is called from another one"""
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving and close the open connections, the clients see it as the server going down"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self.lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, command: list[bytes]) -> bytes:
+        name = command[0].upper().decode()
+        args = command[1:]
+        self.stats[name] += 1
+        with self.lock:
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name in ("QUIT", "SELECT"):
+                return b"+OK\r\n"
+            if name == "GET" and len(args) == 1:
+                return _bulk(self._get(args[0]))
+            if name == "MGET" and args:
+                return b"*%d\r\n" % len(args) + b"".join(
+                    _bulk(self._get(key)) for key in args
+                )
+            if name == "SET" and len(args) in (2, 4):
+                expires = None
+                if len(args) == 4:
+                    unit = args[2].upper()
+                    if unit not in (b"EX", b"PX"):
+                        return b"-ERR syntax error\r\n"
+                    seconds = int(args[3]) / (1000 if unit == b"PX" else 1)
+                    expires = time.monotonic() + seconds
+                self.data[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if name == "DEL" and args:
+                deleted = sum(self.data.pop(key, None) is not None for key in args)
+                return b":%d\r\n" % deleted
+            if name == "EXISTS" and args:
+                return b":%d\r\n" % sum(self._get(key) is not None for key in args)
+            if name == "DBSIZE":
+                return b":%d\r\n" % len(self.data)
+            if name in ("FLUSHDB", "FLUSHALL"):
+                self.data.clear()
+                return b"+OK\r\n"
+        return (
+            b"-ERR unknown command or wrong number of arguments for '%s'\r\n"
+            % name.lower().encode()
+        )
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _read_command(reader) -> Optional[list[bytes]]:
+    """Read a command (an array of bulk strings), None when the client closed the connection"""
+    line = reader.readline()
+    if not line:
+        return None
+    if line[:1] != b"*":
+        return line.strip().split()  # inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = reader.readline()
+        if header[:1] != b"$":
+            raise ValueError("Expected a bulk string")
+        length = int(header[1:-2])
+        args.append(reader.read(length + 2)[:-2])
+    return args
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local Redis-protocol server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = LocalRedisServer(args.host, args.port)
+    print(f"listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,221 @@
+"""Refresh the zmanim of a long range without re-parsing the days that didn't change
+
+Upstream corrections touch a few days at most, so refreshing a range every day mostly re-parses identical data.
+RangeRefresher keeps a hash of every raw Days entry of the last refresh, and only the days whose hash changed
+are decoded and formatted again.
+
+The enrichment of an erev shabbat or yom tov (ShabbatEndTime, SecondDayCandleLighting, ThirdDayCandleLighting,
+see ZmanimAPI.enrich_with_special_times) reads up to 3 of the following days. The refresher remembers which days
+each enrichment read, and an unchanged erev day is enriched again only when one of them changed.
+
+Every day whose zmanim or fields differ after a refresh is reported as a DayChange, to the on_change callback and
+in the list refresh() returns.
+
+Example:
+    >>> refresher = RangeRefresher(Location.for_city(Cities.JERUSALEM.value), date(2023, 1, 1), date(2023, 12, 31))
+    >>> refresher.refresh()  # the first refresh adds every day
+    >>> for change in refresher.refresh():  # later ones only report the differences
+    ...     print(change.date, change.kind, change.fields)
+"""
+
+import hashlib
+import json
+from collections import Counter
+from datetime import date, timedelta
+from typing import Callable, NamedTuple, Optional
+from chabad_org_wrapper import Location, LocationType, ZmanimRequest
+import zip_codes
+from response_schema import ResponseDay, decode_day, parse_display_date
+from zmanim_api import ZmanimAPI, ZmanimDay
+
+ADDED = "added"
+CHANGED = "changed"  # the day's own data changed
+ENRICHED = "enriched"  # only the zmanim copied from the following days changed
+REMOVED = "removed"
+
+
+class DayChange(NamedTuple):
+    date: date
+    kind: str  # ADDED, CHANGED, ENRICHED or REMOVED
+    day: Optional[ZmanimDay]  # the new day, None when removed
+    fields: frozenset  # names of the zmanim and of the Day fields that differ
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def day_hash(raw_day: dict) -> bytes:
+    """Hash of a raw Days entry, entries with the same content in the same key order have the same hash"""
+    return hashlib.blake2b(_ENCODER.encode(raw_day).encode(), digest_size=16).digest()
+
+
+def _fields(zmanim_day: ZmanimDay) -> dict:
+    day = zmanim_day.day
+    fields = dict(zmanim_day.zman_times())
+    fields.update(
+        is_holiday=day.is_holiday,
+        holiday_name=day.holiday_name,
+        parsha=day.parsha,
+        day_of_week=day.day_of_week,
+    )
+    return fields
+
+
+_ABSENT = object()
+
+
+def _diff(old: Optional[ZmanimDay], new: Optional[ZmanimDay]) -> frozenset:
+    old_fields = _fields(old) if old is not None else {}
+    new_fields = _fields(new) if new is not None else {}
+    return frozenset(
+        name
+        for name in old_fields.keys() | new_fields.keys()
+        if old_fields.get(name, _ABSENT) != new_fields.get(name, _ABSENT)
+    )
+
+
+class RangeRefresher:
+    """The parsed and enriched days of a location's range, refreshed incrementally (see the module docstring)
+
+    Args:
+        location (Location): The location, e.g. Location.for_city(Cities.JERUSALEM.value).
+        start (date): The first day.
+        end (date): The last day (included).
+        lazy (bool, optional): Decode each zman only when it is accessed, see ZmanimAPI.get_zmanim. Defaults to False.
+        on_change (Optional[Callable[[DayChange], None]]): Called with every change, in date order. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        location: Location,
+        start: date,
+        end: date,
+        lazy: bool = False,
+        on_change: Optional[Callable[[DayChange], None]] = None,
+    ):
+        if end < start:
+            raise ValueError("end must not be before start")
+        if location.type == LocationType.ZIP_CODE:
+            location = zip_codes.to_location(location.zip_code)
+        self.location = location
+        self.start = start
+        self.end = end
+        self.lazy = lazy
+        self.on_change = on_change
+        self.stats = Counter()
+
+        # by date, of the days of the range and the LOOKAHEAD_DAYS after it
+        self._hashes: dict[date, bytes] = {}
+        self._decoded: dict[date, ResponseDay] = {}
+        # by date, of the days of the range only
+        self._days: dict[date, ZmanimDay] = {}
+        self._read: dict[
+            date, tuple[date, ...]
+        ] = {}  # the following days the enrichment of an erev day read
+
+    def days(self) -> list[ZmanimDay]:
+        return [self._days[day] for day in sorted(self._days)]
+
+    def get(self, day: date) -> Optional[ZmanimDay]:
+        return self._days.get(day)
+
+    def _fetch(self) -> list[dict]:
+        """The raw days of the range and LOOKAHEAD_DAYS after it, in requests of up to WINDOW_DAYS + LOOKAHEAD_DAYS days"""
+        last = self.end + timedelta(days=ZmanimAPI.LOOKAHEAD_DAYS)
+        span = ZmanimAPI.WINDOW_DAYS + ZmanimAPI.LOOKAHEAD_DAYS
+        raw_days = []
+        window_start = self.start
+        while window_start <= last:
+            window_end = min(last, window_start + timedelta(days=span - 1))
+            request = ZmanimRequest.trusted(
+                location=self.location, start_date=window_start, end_date=window_end
+            )
+            raw_days.extend(ZmanimAPI.call_chabad_api(request)["Days"])
+            self.stats["requests"] += 1
+            window_start = window_end + timedelta(days=1)
+        return raw_days
+
+    def refresh(self) -> list[DayChange]:
+        """Fetch the range again and update the days that changed, returns the changes in date order"""
+        hashes = {}
+        touched = set()  # dates whose raw entry was added, changed or removed
+        for i, raw_day in enumerate(self._fetch()):
+            digest = day_hash(raw_day)
+            try:
+                day = parse_display_date(raw_day["DisplayDate"])
+            except (KeyError, TypeError, ValueError):
+                day = decode_day(
+                    raw_day, i
+                ).date  # raises a SchemaError with the details
+            hashes[day] = digest
+            if self._hashes.get(day) != digest:
+                self._decoded[day] = decode_day(raw_day, i)
+                touched.add(day)
+        self.stats["days"] += len(hashes)
+        self.stats["parsed"] += len(touched)
+
+        for day in self._hashes.keys() - hashes.keys():
+            del self._decoded[day]
+            touched.add(day)
+        self._hashes = hashes
+
+        # the days to build again: the touched ones, and the erev days whose enrichment read a touched day
+        rebuild = {day for day in touched if self.start <= day <= self.end}
+        for day, read in self._read.items():
+            if day not in rebuild and any(following in touched for following in read):
+                rebuild.add(day)
+
+        changes = []
+        for day in sorted(rebuild):
+            old = self._days.pop(day, None)
+            self._read.pop(day, None)
+            new = self._build(day) if day in self._decoded else None
+            if new is not None:
+                self._days[day] = new
+
+            fields = _diff(old, new)
+            if new is None:
+                kind = REMOVED if old is not None else None
+            elif old is None:
+                kind = ADDED
+            elif day in touched:
+                kind = CHANGED if fields else None  # e.g. a key order change only
+            else:
+                kind = ENRICHED if fields else None
+            if kind is not None:
+                changes.append(DayChange(day, kind, new, fields))
+
+        self.stats["rebuilt"] += len(rebuild)
+        self.stats["changes"] += len(changes)
+        if self.on_change is not None:
+            for change in changes:
+                self.on_change(change)
+        return changes
+
+    def _build(self, day: date) -> ZmanimDay:
+        """Format a day, and enrich it when it is an erev day, from the decoded days"""
+        zmanim_day = ZmanimAPI.format_day(self._decoded[day], self.lazy)
+        if zmanim_day.is_erev_shabbat():
+            # the following days as they are before their own enrichment, like iter_zmanim
+            following = []
+            for offset in range(1, ZmanimAPI.LOOKAHEAD_DAYS + 1):
+                decoded = self._decoded.get(day + timedelta(days=offset))
+                if decoded is None:
+                    break
+                following.append(ZmanimAPI.format_day(decoded, lazy=True))
+            ZmanimAPI.enrich_with_special_times([zmanim_day] + following)
+            self._read[day] = tuple(
+                following_day.day.date
+                for following_day in following[: _days_read(following)]
+            )
+        zmanim_day.add_location_data(self.location)
+        return zmanim_day
+
+
+def _days_read(following: list[ZmanimDay]) -> int:
+    """How many of the following days enrich_with_special_times reads, it stops at the first that is not a
+    second day (shabbat after yom tov or second day of yom tov)"""
+    for i, zmanim_day in enumerate(following, 1):
+        if not zmanim_day.is_second_e_shabbat():
+            return i
+    return len(following)
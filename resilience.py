@@ -0,0 +1,247 @@
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent response times (in seconds)"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-100) of the recorded samples, None if there are no samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+
+        if not samples:
+            return None
+
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgingPolicy:
+    """Decides when a duplicate (hedged) request should be sent
+
+    The hedge delay is the given percentile of the recent latencies, clamped between min_delay and max_delay.
+    Until min_samples responses were observed, initial_delay is used.
+
+    Args:
+        percentile (float): The latency percentile to wait before hedging. Defaults to 95.
+        initial_delay (float): The delay to use before enough samples were collected. Defaults to 1 second.
+        min_delay (float): Lower bound for the delay. Defaults to 0.05 seconds.
+        max_delay (float): Upper bound for the delay. Defaults to 5 seconds.
+        min_samples (int): Number of samples needed before the percentile is trusted. Defaults to 20.
+        other_host (bool): Send the hedge to the other language host (he./www.). Defaults to False.
+        window (int): Number of recent latencies to keep. Defaults to 200.
+        timeout (float): Timeout in seconds of each http request when the client has none, so the losing requests
+            that are left to finish don't hold a worker forever. Defaults to 10 seconds.
+        max_abandoned (int): No hedge is sent while this many losing requests are still running. Defaults to 4.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        max_delay: float = 5.0,
+        min_samples: int = 20,
+        other_host: bool = False,
+        window: int = 200,
+        timeout: float = 10.0,
+        max_abandoned: int = 4,
+    ):
+        if not 0 < percentile <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if timeout <= 0:
+            raise ValueError("timeout must be positive")
+
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.other_host = other_host
+        self.timeout = timeout
+        self.max_abandoned = max_abandoned
+        self.latencies = LatencyTracker(window)
+
+    def delay(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+
+        return min(
+            self.max_delay,
+            max(self.min_delay, self.latencies.percentile(self.percentile)),
+        )
+
+
+class CircuitBreaker:
+    """A simple consecutive-failures circuit breaker
+
+    closed -> open after failure_threshold consecutive failures.
+    open -> half open after reset_timeout seconds, letting a single trial call through.
+    half open -> closed if the trial call succeeds, back to open if it fails.
+
+    Args:
+        failure_threshold (int): Consecutive failures needed to open the circuit. Defaults to 5.
+        reset_timeout (float): Seconds to stay open before allowing a trial call. Defaults to 30.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.stats = Counter()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Check if a call may go upstream, a half open circuit lets exactly one call through"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                self.stats["trials"] += 1
+                return True
+
+            self.stats["rejected"] += 1
+            return False
+
+    def release(self) -> None:
+        """Give back a half open trial that was allowed but never sent"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                self.stats["closed"] += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.stats["opened"] += 1
+
+
+class StaleWhileRevalidate:
+    """Serve expired cache entries while a single background request refreshes them
+
+    An entry up to max_stale seconds past its ttl is returned immediately and its key is refreshed in the
+    background, so callers don't wait for chabad.org when entries expire. Concurrent callers of the same
+    key share the refresh. Entries that are older are fetched in the foreground, and are only served when
+    chabad.org fails, up to hard_expiry seconds past the ttl.
+
+    Args:
+        max_stale (float): Seconds past the ttl an entry is served while it is refreshed. Defaults to 1 hour.
+        hard_expiry (Optional[float]): Seconds past the ttl after which an entry is never served, even when
+            chabad.org fails. Defaults to None (no limit).
+        concurrency (int): Refreshes running at once, others wait for a free worker. Defaults to 2.
+        window (int): Number of recent refresh latencies to keep. Defaults to 200.
+    """
+
+    def __init__(
+        self,
+        max_stale: float = 60 * 60,
+        hard_expiry: Optional[float] = None,
+        concurrency: int = 2,
+        window: int = 200,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if hard_expiry is not None and hard_expiry < max_stale:
+            raise ValueError("hard_expiry can't be shorter than max_stale")
+
+        self.max_stale = max_stale
+        self.hard_expiry = hard_expiry
+        self.concurrency = concurrency
+        self.stats = Counter()
+        self.latencies = LatencyTracker(window)
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def servable(self, seconds_expired: float) -> bool:
+        """Whether an entry that expired seconds_expired ago may still be served while chabad.org fails"""
+        return self.hard_expiry is None or seconds_expired <= self.hard_expiry
+
+    def refresh(self, key: str, fetch: Callable[[], object]) -> bool:
+        """Run fetch in the background, unless a refresh of key is already running. Returns whether it was started"""
+        with self._lock:
+            if key in self._refreshing:
+                self.stats["joined"] += 1
+                return False
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="revalidate"
+                )
+            self.stats["started"] += 1
+            self._executor.submit(self._run, key, fetch)
+            return True
+
+    def _run(self, key: str, fetch: Callable[[], object]) -> None:
+        start = time.monotonic()
+        try:
+            fetch()
+            self.stats["succeeded"] += 1
+        except Exception:
+            self.stats["failed"] += 1
+        finally:
+            self.latencies.record(time.monotonic() - start)
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refreshing(self) -> int:
+        with self._lock:
+            return len(self._refreshing)
+
+    def metrics(self) -> dict:
+        """Refresh counters and latency percentiles (seconds)"""
+        return {
+            **self.stats,
+            "latency_p50": self.latencies.percentile(50),
+            "latency_p99": self.latencies.percentile(99),
+        }
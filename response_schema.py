@@ -0,0 +1,190 @@
+"""The schema of chabad.org Get_Zmanim responses, and a decoder from JSON to typed tuples
+
+    {"Days": [{"DisplayDate": "01/06/2023", "DayOfWeek": 5, "IsHoliday": false, "HolidayName": null, "Parsha": null,
+               "TimeGroups": [{"ZmanType": "CandleLighting", "Title": "...", "FootnoteType": null,
+                               "Items": [{"Zman": "4:18 PM"}, ...]}, ...]}, ...]}
+
+Other fields are ignored. decode_response checks the types of every field it reads and parses the dates
+while building the tuples, in a single pass. When anything doesn't match, the response is walked again
+to raise a SchemaError naming the first field that differs, e.g. "Days[3].TimeGroups[2].Items[0].Zman".
+"""
+
+import json
+from datetime import date
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional, Union
+
+
+class SchemaError(ValueError):
+    """Raised when a response doesn't match the expected schema"""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path or 'response'}: {message}")
+        self.path = path
+
+
+class TimeGroup(NamedTuple):
+    zman_type: str
+    title: Optional[str]
+    foot_note_type: Optional[str]
+    zman: str  # the time of the first item, e.g. "4:18 PM"
+
+
+class ResponseDay(NamedTuple):
+    date: date
+    day_of_week: int  # 0 is sunday
+    is_holiday: bool
+    holiday_name: Optional[str]
+    parsha: Optional[str]
+    time_groups: tuple[TimeGroup, ...]
+
+
+class ZmanimResponse(NamedTuple):
+    days: tuple[ResponseDay, ...]
+
+
+@lru_cache(maxsize=4096)
+def parse_display_date(s: str) -> date:
+    """Parse a "%m/%d/%Y" DisplayDate, the same dates repeat in the responses of every location"""
+    month, day, year = s.split("/")
+    if len(year) != 4:
+        raise ValueError(f"Invalid date: {s}")
+    return date(int(year), int(month), int(day))
+
+
+def load_response(data: Union[bytes, str]) -> dict:
+    """Parse a raw Get_Zmanim response (the http body, bytes are parsed without decoding them to str first),
+    only the Days list is checked, decode_response checks the rest
+    """
+    try:
+        data = json.loads(data)
+    except ValueError as e:
+        raise SchemaError("", f"invalid JSON ({e})") from None
+    _field(data, "Days", list, "")
+    return data
+
+
+def decode_response(data: Union[bytes, str, dict]) -> ZmanimResponse:
+    """Decode a Get_Zmanim response, raw JSON or already parsed, see the module docstring"""
+    if isinstance(data, (bytes, bytearray, str)):
+        data = load_response(data)
+
+    try:
+        return ZmanimResponse(tuple(_decode_day(day) for day in data["Days"]))
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        pass
+    _explain(data)
+    raise SchemaError(
+        "", "invalid response"
+    )  # _explain always raises, unless the fast path has a bug
+
+
+def decode_day(day: Any, index: int = 0) -> ResponseDay:
+    """Decode a single Days entry, index is its position in the response (for the SchemaError path)"""
+    try:
+        return _decode_day(day)
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        pass
+    _explain_day(day, f"Days[{index}]")
+    raise SchemaError(f"Days[{index}]", "invalid day")
+
+
+def _decode_day(day: dict) -> ResponseDay:
+    time_groups = []
+    for group in day["TimeGroups"]:
+        zman_type = group["ZmanType"]
+        title = group["Title"]
+        foot_note_type = group["FootnoteType"]
+        zman = group["Items"][0]["Zman"]
+        if (
+            type(zman_type) is not str
+            or type(zman) is not str
+            or (title is not None and type(title) is not str)
+            or (foot_note_type is not None and type(foot_note_type) is not str)
+        ):
+            raise TypeError
+        time_groups.append(TimeGroup(zman_type, title, foot_note_type, zman))
+
+    day_of_week = day["DayOfWeek"]
+    is_holiday = day["IsHoliday"]
+    holiday_name = day["HolidayName"]
+    parsha = day["Parsha"]
+    if (
+        type(day_of_week) is not int
+        or not 0 <= day_of_week <= 6
+        or type(is_holiday) is not bool
+        or (holiday_name is not None and type(holiday_name) is not str)
+        or (parsha is not None and type(parsha) is not str)
+    ):
+        raise TypeError
+
+    return ResponseDay(
+        parse_display_date(day["DisplayDate"]),
+        day_of_week,
+        is_holiday,
+        holiday_name,
+        parsha,
+        tuple(time_groups),
+    )
+
+
+def _type_name(value: Any) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def _field(
+    obj: Any, key: Union[str, int], expected: type, path: str, nullable: bool = False
+) -> Any:
+    if isinstance(key, int):
+        if not isinstance(obj, list) or key >= len(obj):
+            raise SchemaError(path, "expected a non empty list")
+        value = obj[key]
+        path = f"{path}[{key}]"
+    else:
+        if not isinstance(obj, dict):
+            raise SchemaError(path, f"expected an object, got {_type_name(obj)}")
+        if key not in obj:
+            raise SchemaError(f"{path}.{key}" if path else key, "missing")
+        value = obj[key]
+        path = f"{path}.{key}" if path else key
+
+    if value is None and nullable:
+        return value
+    if type(value) is not expected:
+        raise SchemaError(
+            path, f"expected {expected.__name__}, got {_type_name(value)} {value!r:.40}"
+        )
+    return value
+
+
+def _explain(data: Any) -> None:
+    """Raise a SchemaError for the first field of data that doesn't match the schema"""
+    days = _field(data, "Days", list, "")
+    for i, day in enumerate(days):
+        _explain_day(day, f"Days[{i}]")
+
+
+def _explain_day(day: Any, path: str) -> None:
+    display_date = _field(day, "DisplayDate", str, path)
+    try:
+        parse_display_date(display_date)
+    except ValueError:
+        raise SchemaError(
+            f"{path}.DisplayDate", f"expected MM/DD/YYYY, got {display_date!r}"
+        ) from None
+    day_of_week = _field(day, "DayOfWeek", int, path)
+    if not 0 <= day_of_week <= 6:
+        raise SchemaError(f"{path}.DayOfWeek", f"expected 0-6, got {day_of_week}")
+    _field(day, "IsHoliday", bool, path)
+    _field(day, "HolidayName", str, path, nullable=True)
+    _field(day, "Parsha", str, path, nullable=True)
+
+    time_groups = _field(day, "TimeGroups", list, path)
+    for j, group in enumerate(time_groups):
+        group_path = f"{path}.TimeGroups[{j}]"
+        _field(group, "ZmanType", str, group_path)
+        _field(group, "Title", str, group_path, nullable=True)
+        _field(group, "FootnoteType", str, group_path, nullable=True)
+        items = _field(group, "Items", list, group_path)
+        item = _field(items, 0, dict, f"{group_path}.Items")
+        _field(item, "Zman", str, f"{group_path}.Items[0]")
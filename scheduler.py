@@ -0,0 +1,393 @@
+"""Run many jobs from a single thread
+
+Every job has a trigger that tells when it should fire next, the scheduler keeps the jobs in a min-heap
+keyed on the next fire time and sleeps until the earliest one is due, so the idle cost doesn't depend
+on the number of jobs.
+
+Triggers:
+    sunrise: {type: sunrise, city: Jerusalem}  (astral city name or Cities english name)
+    candle lighting: {type: candle_lighting, minutes_before: 60}  (uses the job's location)
+    fixed time: {type: fixed_time, time: "08:00", time_zone: Asia/Jerusalem, weekdays: [4]}  (weekdays: 0 is monday)
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from datetime import time as dt_time
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+import sun_table
+import zip_codes
+from hebrew_calendar import is_israel
+from locations import Cities, Coordinates, TimeZone, TimeZones
+from zmanim_api import ZmanimAPI, ZmanimTypes, parse_zman_time
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+    """Wall clock time and sleeping, the scheduler only uses time through a Clock so it can run on a virtual one"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        """Sleep until the event is set or the timeout passed, returns whether the event is set"""
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when something sleeps on it, so days of scheduling run in milliseconds.
+    Waiting returns immediately after moving the time forward, for a single threaded simulation.
+    """
+
+    def __init__(self, start: datetime):
+        self._now = start.timestamp()
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        self._now += max(seconds, 0)
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        if event.is_set():
+            return True
+        if timeout is None:
+            raise RuntimeError(
+                "Waiting without a timeout on a virtual clock would never return"
+            )
+        self.sleep(timeout)
+        return False
+
+
+class Trigger:
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        """Get the first fire time (UTC) strictly after `after`, None if the trigger will never fire again"""
+        raise NotImplementedError
+
+
+class SunriseTrigger(Trigger):
+    def __init__(self, city: str):
+        self.city = city
+
+    def sunrise(self, day: date) -> datetime:
+        sunrise = sun_table.lookup(self.city, day)
+        if sunrise is not None:
+            return sunrise
+
+        from astral.geocoder import database, lookup
+        from astral.sun import sunrise as astral_sunrise
+
+        try:
+            observer = lookup(self.city, database()).observer
+        except KeyError:
+            raise ValueError(f"City '{self.city}' not found in the database")
+        return astral_sunrise(observer, day, timezone.utc)
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        for offset in range(-1, 3):
+            sunrise = self.sunrise(after.date() + timedelta(days=offset))
+            if sunrise > after:
+                return sunrise
+        return None
+
+
+class FixedTimeTrigger(Trigger):
+    def __init__(
+        self, at: dt_time, time_zone: str = "UTC", weekdays: Optional[list[int]] = None
+    ):
+        self.at = at
+        self.time_zone = ZoneInfo(time_zone)
+        self.weekdays = set(weekdays) if weekdays is not None else set(range(7))
+        if not self.weekdays:
+            raise ValueError("At least one weekday is needed")
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        local_day = after.astimezone(self.time_zone).date()
+        for offset in range(8):
+            day = local_day + timedelta(days=offset)
+            if day.weekday() not in self.weekdays:
+                continue
+            fire = datetime.combine(day, self.at, self.time_zone).astimezone(
+                timezone.utc
+            )
+            if fire > after:
+                return fire
+        return None
+
+
+class CandleLightingTrigger(Trigger):
+    """Fires minutes_before the next candle lighting of the location (erev shabbat and yom tov)"""
+
+    def __init__(self, location: dict, minutes_before: int = 0):
+        self.location = location
+        self.minutes_before = minutes_before
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        location_tz = location_time_zone(self.location)
+        time_zone = ZoneInfo(location_tz.iana_name)
+        start = after.astimezone(time_zone).date()
+        calendar = ZmanimAPI.calendars[is_israel(location_tz.name)]
+        # there is a candle lighting at least once a week, only the erev days (by the local calendar) are fetched
+        for calendar_day in calendar.days(start, start + timedelta(days=8)):
+            if not calendar_day.is_erev:
+                continue
+            zmanim_day = ZmanimAPI.get_zmanim(
+                calendar_day.date, lazy=True, **self.location
+            )[0]
+            if ZmanimTypes.CandleLighting.name not in zmanim_day.zmanim:
+                continue
+            candle_lighting = parse_zman_time(
+                zmanim_day.get_zman(ZmanimTypes.CandleLighting).time
+            )
+            fire = datetime.combine(
+                zmanim_day.day.date, candle_lighting, time_zone
+            ).astimezone(timezone.utc) - timedelta(minutes=self.minutes_before)
+            if fire > after:
+                return fire
+        return None
+
+
+def location_from_config(config: Optional[dict]) -> Optional[dict]:
+    """Get the ZmanimAPI.get_zmanim location argument from a job config, for example:
+    {city: TEL_AVIV}, {zip_code: "11213"} or {lat: 32.08, lon: 34.78, time_zone: JERUSALEM, name: Tel Aviv}
+    A ZIP code location can have a time_zone too, it is needed when there is no ZIP code index (see zip_codes.py)
+    """
+    if not config:
+        return None
+    if "city" in config:
+        return {"city": Cities[config["city"]]}
+    if "zip_code" in config:
+        if "time_zone" in config:
+            zip_codes.set_time_zone(
+                str(config["zip_code"]), TimeZones[config["time_zone"]].value
+            )
+        return {"zip_code": str(config["zip_code"])}
+    return {
+        "coordinates": Coordinates(
+            lat=config["lat"],
+            lon=config["lon"],
+            time_zone=TimeZones[config["time_zone"]].value,
+            custom_name=config.get("name", "Default location name"),
+        )
+    }
+
+
+def location_time_zone(location: dict) -> TimeZone:
+    if "city" in location:
+        return location["city"].value.time_zone
+    if "zip_code" in location:
+        return zip_codes.time_zone(location["zip_code"])
+    return location["coordinates"].time_zone
+
+
+def create_trigger(config: dict, location: Optional[dict] = None) -> Trigger:
+    """Create a trigger from its config, see the module docstring"""
+    trigger_type = config["type"]
+    if trigger_type == "sunrise":
+        return SunriseTrigger(config["city"])
+    if trigger_type == "fixed_time":
+        hour, minute = (int(part) for part in str(config["time"]).split(":"))
+        return FixedTimeTrigger(
+            dt_time(hour, minute),
+            config.get("time_zone", "UTC"),
+            config.get("weekdays"),
+        )
+    if trigger_type == "candle_lighting":
+        if location is None:
+            raise ValueError("A candle_lighting trigger needs a job location")
+        return CandleLightingTrigger(location, config.get("minutes_before", 0))
+    raise ValueError(f"Unknown trigger type: {trigger_type}")
+
+
+class Job:
+    """A named action that runs whenever its trigger fires
+
+    Args:
+        name (str): The job name, used in logs.
+        trigger (Trigger): When to run.
+        action (Callable[["Job", datetime], None]): Called with the job and the scheduled fire time (UTC).
+    """
+
+    def __init__(
+        self, name: str, trigger: Trigger, action: Callable[["Job", datetime], None]
+    ):
+        self.name = name
+        self.trigger = trigger
+        self.action = action
+
+
+class Scheduler:
+    """Fire jobs at their trigger times from a single thread
+
+    The next fire time of a job is computed by a pool of resolver threads, a candle lighting trigger fetches
+    from chabad.org and a slow response shouldn't delay the other jobs. When it fails, it is retried after
+    retry_delay seconds, doubled on every failure up to max_retry_delay, so a job is never dropped.
+
+    Example:
+        >>> scheduler = Scheduler()
+        >>> scheduler.add(Job("morning", FixedTimeTrigger(dt_time(8, 0), "Asia/Jerusalem"), lambda job, at: print(at)))
+        >>> scheduler.run()  # blocks, call scheduler.stop() from another thread to return
+
+    Args:
+        jitter_window (int): Number of recent fire delays kept for jitter_stats. Defaults to 10000.
+        clock (Optional[Clock]): Source of time and sleeping, e.g. a VirtualClock for simulations. Defaults to the system clock.
+        resolver_threads (int): Threads computing the next fire times, 0 computes them on the scheduler thread
+            (needed with a VirtualClock, it can't wait for other threads). Defaults to 2.
+        retry_delay (float): Seconds before the first retry of a failed next fire time. Defaults to 60.
+        max_retry_delay (float): The longest delay between retries. Defaults to 3600.
+    """
+
+    def __init__(
+        self,
+        jitter_window: int = 10000,
+        clock: Optional[Clock] = None,
+        resolver_threads: int = 2,
+        retry_delay: float = 60.0,
+        max_retry_delay: float = 3600.0,
+    ):
+        self.clock = clock or Clock()
+        # (due, tie breaker, job, retry), retry is None for a fire and (after, attempt) for a retry of next_fire
+        self._heap: list[tuple[float, int, Job, Optional[tuple[datetime, int]]]] = []
+        self._counter = itertools.count()  # tie breaker, jobs are not comparable
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._resolver = (
+            ThreadPoolExecutor(
+                resolver_threads, thread_name_prefix="scheduler-resolver"
+            )
+            if resolver_threads
+            else None
+        )
+        self._resolving = 0
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.fired = 0
+        self.failed = 0  # failed actions and failed next fire times
+        self.jitter = deque(
+            maxlen=jitter_window
+        )  # seconds between scheduled and actual fire time
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, job: Job, after: Optional[datetime] = None) -> None:
+        """Schedule the job's next fire time after `after` (defaults to now), computed in the background"""
+        self._resolve(job, after or self.clock.now(), 0)
+
+    def _resolve(self, job: Job, after: datetime, attempt: int) -> None:
+        if self._resolver is None:
+            self._next_fire(job, after, attempt)
+            return
+        with self._lock:
+            self._resolving += 1
+        self._resolver.submit(self._next_fire, job, after, attempt)
+
+    def _next_fire(self, job: Job, after: datetime, attempt: int) -> None:
+        try:
+            fire = job.trigger.next_fire(after)
+        except Exception as e:
+            delay = min(self.retry_delay * 2**attempt, self.max_retry_delay)
+            logger.warning(
+                "Job %s: the next fire time after %s failed (%r), retrying in %gs",
+                job.name,
+                after,
+                e,
+                delay,
+            )
+            self._push(
+                self.clock.time() + delay, job, (after, attempt + 1), failed=True
+            )
+        else:
+            self._push(None if fire is None else fire.timestamp(), job, None)
+
+    def _push(
+        self,
+        due: Optional[float],
+        job: Job,
+        retry: Optional[tuple],
+        failed: bool = False,
+    ) -> None:
+        """Add the result of a next fire time to the heap, and wake the scheduler up"""
+        with self._lock:
+            if due is not None:
+                heapq.heappush(self._heap, (due, next(self._counter), job, retry))
+            if failed:
+                self.failed += 1
+            if self._resolver is not None:
+                self._resolving -= 1
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+    def run(self, until: Optional[datetime] = None) -> None:
+        """Fire the jobs until stop() is called, or until no job is due before `until`"""
+        self._stopped = False
+        end = until.timestamp() if until else None
+        while not self._stopped:
+            with self._lock:
+                due = self._heap[0][0] if self._heap else None
+                resolving = self._resolving
+
+            if end is not None and (due is None or due > end):
+                if not resolving:
+                    return
+                # a next fire time that is still being computed may be before `until`
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = None if due is None else due - self.clock.time()
+            if delay is None or delay > 0:
+                # sleep until the earliest job is due, or a job was added/resolved or the scheduler stopped
+                self.clock.wait(self._wakeup, delay)
+                self._wakeup.clear()
+                continue
+
+            with self._lock:
+                due, _, job, retry = heapq.heappop(self._heap)
+
+            if retry is not None:
+                after, attempt = retry
+                self._resolve(job, after, attempt)
+                continue
+
+            self.jitter.append(self.clock.time() - due)
+            scheduled = datetime.fromtimestamp(due, timezone.utc)
+            try:
+                job.action(job, scheduled)
+                self.fired += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error("Job %s failed at %s: %r", job.name, self.clock.now(), e)
+
+            self.add(job, after=scheduled)
+
+    def jitter_stats(self) -> dict:
+        """Statistics (in seconds) of how late the jobs fired"""
+        if not self.jitter:
+            return {"count": 0}
+        samples = sorted(self.jitter)
+        return {
+            "count": len(samples),
+            "mean": sum(samples) / len(samples),
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": samples[-1],
+        }
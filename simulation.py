@@ -0,0 +1,412 @@
+"""Replay the scheduler and the tweets on a virtual clock
+
+The jobs of a config (see config_template.yaml) run on a VirtualClock, with zmanim from recorded chabad.org
+responses (--fixtures) or synthetic ones, and the tweets go to a fake sink instead of twitter.
+A year replays in seconds, and the report lists every fire time, missed and unexpected fires, duplicate posts and
+the CPU time of each stage (scheduler, trigger, fetch, action).
+
+The expected fire times don't come from the triggers, they are computed from each job's config and the data
+(see reference_fires): astral's sunrise, the fixed times, and the CandleLighting times of the responses.
+A duplicate post is a job posting more than once for the same fire time.
+
+    python simulation.py [config.yaml] [--start 2026-01-01] [--days 365] [--fixtures recorded.json [--record]]
+
+With --record, requests missing from the fixtures file are sent to chabad.org and saved to it.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from datetime import time as dt_time
+from typing import Optional
+from zoneinfo import ZoneInfo
+import yaml
+import sun_table
+import zip_codes
+from chabad_org_wrapper import ChabadAPI, Location, ZmanimRequest
+from main import job_configs, load_jobs
+from scheduler import (
+    Job,
+    Scheduler,
+    Trigger,
+    VirtualClock,
+    location_from_config,
+    location_time_zone,
+)
+from synthetic_api import SyntheticChabadAPI, shift_time
+from zmanim_api import ZmanimAPI, ZmanimTypes, parse_zman_time
+
+# a fire matches an expected time this close to it (the sun table keeps whole seconds)
+TOLERANCE = timedelta(seconds=60)
+
+DEFAULT_CONFIG = {
+    "city": "Jerusalem",
+    "tweetContent": "{1}",
+    "jobs": [
+        {"name": "sunrise", "trigger": {"type": "sunrise", "city": "Jerusalem"}},
+        {
+            "name": "tel-aviv-candle-lighting",
+            "location": {"city": "TEL_AVIV"},
+            "trigger": {"type": "candle_lighting", "minutes_before": 60},
+        },
+        {
+            "name": "haifa-friday-morning",
+            "location": {"city": "HAIFA"},
+            "trigger": {
+                "type": "fixed_time",
+                "time": "08:00",
+                "time_zone": "Asia/Jerusalem",
+                "weekdays": [4],
+            },
+        },
+    ],
+}
+
+
+class StageTimer:
+    """CPU time per stage, a nested stage's time is not counted in the stage around it"""
+
+    def __init__(self):
+        self.cpu = Counter()
+        self.calls = Counter()
+        self._stack: list[str] = []
+        self._started = 0.0
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        now = time.process_time()
+        if self._stack:
+            self.cpu[self._stack[-1]] += now - self._started
+        self._stack.append(stage)
+        self._started = now
+        self.calls[stage] += 1
+        try:
+            yield
+        finally:
+            now = time.process_time()
+            self.cpu[self._stack.pop()] += now - self._started
+            self._started = now
+
+
+class TimedTrigger(Trigger):
+    def __init__(self, trigger: Trigger, timer: StageTimer):
+        self.trigger = trigger
+        self.timer = timer
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        with self.timer.measure("trigger"):
+            return self.trigger.next_fire(after)
+
+
+class TimedChabadAPI:
+    def __init__(self, api: ChabadAPI, timer: StageTimer):
+        self.api = api
+        self.timer = timer
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        with self.timer.measure("fetch"):
+            return self.api.get_zmanim(r)
+
+
+class SimulatedChabadAPI(SyntheticChabadAPI):
+    """Synthetic responses whose times drift through the year like the real ones, so posts differ from day to day"""
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        response = super().get_zmanim(r)
+        for day in response["Days"]:
+            day_of_year = (
+                datetime.strptime(day["DisplayDate"], "%m/%d/%Y").timetuple().tm_yday
+            )
+            minutes = round(60 * math.sin(2 * math.pi * day_of_year / 365))
+            for time_group in day["TimeGroups"]:
+                item = time_group["Items"][0]
+                item["Zman"] = shift_time(item["Zman"], minutes)
+        return response
+
+
+class RecordedChabadAPI(ChabadAPI):
+    """Serve chabad.org responses from a JSON file, with record=True missing ones are fetched and added to it"""
+
+    def __init__(self, path: str, record: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.record = record
+        self.responses = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.responses = json.load(f)
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        key = f"{r.language}|{self.cache_key(r)}"
+        if key not in self.responses:
+            if not self.record:
+                raise KeyError(f"No recorded response for {key}, run with --record")
+            self.responses[key] = super().get_zmanim(r)
+        return self.responses[key]
+
+    def save(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.responses, f, ensure_ascii=False)
+
+
+class FakeTwitter:
+    """Collects the posts of every account instead of tweeting them"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.posts: list[tuple[datetime, str, str]] = []  # (time, account, content)
+
+    def get_api(self, account: dict, apis: dict) -> "FakeAccount":
+        key = account.get("accessToken", "default")
+        if key not in apis:
+            apis[key] = FakeAccount(self, key)
+        return apis[key]
+
+
+class FakeAccount:
+    def __init__(self, twitter: FakeTwitter, name: str):
+        self.twitter = twitter
+        self.name = name
+
+    def update_status(self, content: str) -> None:
+        self.twitter.posts.append((self.twitter.clock.now(), self.name, content))
+
+
+def reference_fires(job_config: dict, start: datetime, end: datetime) -> list[datetime]:
+    """The fire times of a job in (start, end], computed from its config without its trigger"""
+    trigger = job_config["trigger"]
+    first, last = start.date() - timedelta(days=1), end.date() + timedelta(days=1)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+    if trigger["type"] == "sunrise":
+        from astral import Observer
+        from astral.sun import sunrise
+
+        coordinates = sun_table.resolve(trigger["city"])
+        if coordinates is None:
+            raise ValueError(f"City '{trigger['city']}' not found in the database")
+        observer = Observer(*coordinates)
+        fires = [sunrise(observer, day, timezone.utc) for day in days]
+    elif trigger["type"] == "fixed_time":
+        hour, minute = (int(part) for part in str(trigger["time"]).split(":"))
+        time_zone = ZoneInfo(trigger.get("time_zone", "UTC"))
+        weekdays = trigger.get("weekdays", range(7))
+        fires = [
+            datetime.combine(day, dt_time(hour, minute), time_zone).astimezone(
+                timezone.utc
+            )
+            for day in days
+            if day.weekday() in weekdays
+        ]
+    elif trigger["type"] == "candle_lighting":
+        # every day with a candle lighting in the responses, not only the erev days of the local calendar
+        location = location_from_config(job_config["location"])
+        time_zone = ZoneInfo(location_time_zone(location).iana_name)
+        if "city" in location:
+            request_location = Location.for_city(location["city"].value)
+        elif "zip_code" in location:
+            request_location = zip_codes.to_location(location["zip_code"])
+        else:
+            request_location = Location.for_coordinates(location["coordinates"])
+        minutes_before = timedelta(minutes=trigger.get("minutes_before", 0))
+        fires = [
+            datetime.combine(
+                zmanim_day.day.date,
+                parse_zman_time(zmanim_day.get_zman(ZmanimTypes.CandleLighting).time),
+                time_zone,
+            ).astimezone(timezone.utc)
+            - minutes_before
+            for zmanim_day in ZmanimAPI.iter_zmanim(
+                request_location, first, last, lazy=True
+            )
+            if ZmanimTypes.CandleLighting.name in zmanim_day.zmanim
+        ]
+    else:
+        raise ValueError(f"Unknown trigger type: {trigger['type']}")
+    return [fire for fire in fires if start < fire <= end]
+
+
+def _unmatched(times: list[datetime], others: list[datetime]) -> list[datetime]:
+    """The times with no time of others within TOLERANCE, both sorted"""
+    unmatched = []
+    i = 0
+    for value in times:
+        while i < len(others) and others[i] < value - TOLERANCE:
+            i += 1
+        if i == len(others) or others[i] > value + TOLERANCE:
+            unmatched.append(value)
+    return unmatched
+
+
+def simulate(
+    config: dict, start: datetime, days: int, chabad_api: Optional[ChabadAPI] = None
+) -> dict:
+    """Run the jobs of config from start for days on a virtual clock, see the module docstring"""
+    end = start + timedelta(days=days)
+    clock = VirtualClock(start)
+    timer = StageTimer()
+    twitter = FakeTwitter(clock)
+    fires: list[dict] = []
+
+    previous_api = ZmanimAPI.chabad_api
+    chabad_api = chabad_api or SimulatedChabadAPI()
+    try:
+        # the reference requests are not measured
+        ZmanimAPI.chabad_api = chabad_api
+        expected = {
+            job_config["name"]: reference_fires(job_config, start, end)
+            for job_config in job_configs(config)
+        }
+
+        ZmanimAPI.chabad_api = TimedChabadAPI(chabad_api, timer)
+        jobs = load_jobs(config, get_api=twitter.get_api)
+
+        # the triggers are resolved on the scheduler thread, the virtual clock only moves when it sleeps
+        scheduler = Scheduler(clock=clock, resolver_threads=0)
+        for job in jobs:
+            job.trigger = TimedTrigger(job.trigger, timer)
+            job.action = _recorded(job.action, fires, clock, timer, twitter)
+            scheduler.add(job, after=start)
+
+        # tweet() prints every post
+        with contextlib.redirect_stdout(io.StringIO()):
+            with timer.measure("scheduler"):
+                scheduler.run(until=end)
+    finally:
+        ZmanimAPI.chabad_api = previous_api
+
+    missed = []
+    unexpected = []
+    for name, times in expected.items():
+        posted = sorted(
+            fire["scheduled"]
+            for fire in fires
+            if fire["job"] == name and fire["error"] is None
+        )
+        missed.extend((name, scheduled) for scheduled in _unmatched(times, posted))
+        unexpected.extend((name, scheduled) for scheduled in _unmatched(posted, times))
+
+    scheduled_fires = Counter((fire["job"], fire["scheduled"]) for fire in fires)
+    posts = Counter()
+    for fire in fires:
+        posts[fire["job"], fire["scheduled"]] += fire["posts"]
+
+    return {
+        "fires": fires,
+        "posts": twitter.posts,
+        "missed": sorted(missed, key=lambda entry: entry[1]),
+        "unexpected": sorted(unexpected, key=lambda entry: entry[1]),
+        "duplicate_fires": [key for key, count in scheduled_fires.items() if count > 1],
+        "duplicate_posts": [key for key, count in posts.items() if count > 1],
+        "jitter": scheduler.jitter_stats(),
+        "cpu": dict(timer.cpu),
+        "calls": dict(timer.calls),
+    }
+
+
+def _recorded(
+    action,
+    fires: list[dict],
+    clock: VirtualClock,
+    timer: StageTimer,
+    twitter: FakeTwitter,
+):
+    def recorded_action(job: Job, scheduled: datetime):
+        fire = {
+            "job": job.name,
+            "scheduled": scheduled,
+            "fired": clock.now(),
+            "error": None,
+            "posts": 0,
+        }
+        fires.append(fire)
+        posted = len(twitter.posts)
+        try:
+            with timer.measure("action"):
+                action(job, scheduled)
+        except Exception as e:
+            fire["error"] = repr(e)
+            raise
+        finally:
+            fire["posts"] = len(twitter.posts) - posted
+
+    return recorded_action
+
+
+def print_report(report: dict, fires: bool = True) -> None:
+    if fires:
+        for fire in report["fires"]:
+            status = f"FAILED {fire['error']}" if fire["error"] else "posted"
+            print(f"{fire['scheduled'].isoformat()} {fire['job']}: {status}")
+        print()
+
+    print(f"fires: {len(report['fires'])}, posts: {len(report['posts'])}")
+    print(f"missed fires: {len(report['missed'])}")
+    for name, scheduled in report["missed"]:
+        print(f"  {scheduled.isoformat()} {name}")
+    print(f"unexpected fires: {len(report['unexpected'])}")
+    for name, scheduled in report["unexpected"]:
+        print(f"  {scheduled.isoformat()} {name}")
+    print(f"duplicate fires: {len(report['duplicate_fires'])}")
+    for name, scheduled in report["duplicate_fires"]:
+        print(f"  {scheduled.isoformat()} {name}")
+    print(f"duplicate posts: {len(report['duplicate_posts'])}")
+    for name, scheduled in report["duplicate_posts"]:
+        print(f"  {scheduled.isoformat()} {name}")
+    print(f"lateness: {report['jitter']}")
+    print("cpu per stage:")
+    for stage, seconds in sorted(report["cpu"].items(), key=lambda item: -item[1]):
+        print(f"  {stage:10} {seconds * 1000:9.1f} ms  {report['calls'][stage]} calls")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "config", nargs="?", help="config.yaml, defaults to a sample config"
+    )
+    parser.add_argument(
+        "--start", type=date.fromisoformat, default=date(date.today().year, 1, 1)
+    )
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--fixtures", help="JSON file of recorded chabad.org responses")
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="fetch and save responses missing from --fixtures",
+    )
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    if args.record and not args.fixtures:
+        parser.error("--record needs --fixtures")
+
+    if args.config:
+        with open(args.config, "r") as f:
+            config = yaml.safe_load(f)
+    else:
+        config = DEFAULT_CONFIG
+
+    chabad_api = (
+        RecordedChabadAPI(args.fixtures, args.record) if args.fixtures else None
+    )
+    started = time.perf_counter()
+    report = simulate(
+        config,
+        datetime.combine(args.start, datetime.min.time(), timezone.utc),
+        args.days,
+        chabad_api,
+    )
+    elapsed = time.perf_counter() - started
+    if chabad_api and args.record:
+        chabad_api.save()
+
+    print_report(report, fires=not args.quiet)
+    print(f"replayed {args.days} days in {elapsed:.2f}s")
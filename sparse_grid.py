@@ -0,0 +1,325 @@
+"""Zmanim for many nearby locations from a sparse lattice of anchor points
+
+Instead of a request per location, zmanim are fetched only for the anchors of a lat/lon lattice covering the
+bounding box of the locations, and the zmanim of every location are bilinearly interpolated from the 4 anchors
+around it. The number of requests depends on the area and the lattice step, not on the number of locations.
+
+The interpolation runs column by column: the cell and weights of every location are computed once,
+then each (day, zman) is a single pass over flat arrays.
+
+Error bound:
+    Sun based zmanim change smoothly with the location, so the interpolation error shrinks with the square of the
+    lattice step. SparseGrid.max_error measures it directly, by comparing astral's sunrise, sunset, alos (16.1)
+    and tzeis (8.5) at random points of the bounding box to the interpolation of the anchors' values, over a year.
+    SparseGrid.from_max_error halves the step until the measured error is within the bound.
+    Note that chabad.org rounds its times to the minute, so anchor times carry up to 30 seconds of rounding as well.
+
+    python sparse_grid.py  # lattice steps and measured errors for two sample regions
+"""
+
+import random
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta, timezone
+from math import ceil, floor, isnan
+from typing import Optional
+from locations import Coordinates
+from zmanim_api import (
+    Day,
+    LocationInfo,
+    Zman,
+    ZmanimAPI,
+    ZmanimDay,
+    ZmanimTypes,
+    parse_zman_time,
+)
+
+Bounds = tuple[float, float, float, float]  # (min lat, min lon, max lat, max lon)
+
+DAY_SECONDS = 24 * 60 * 60
+NAN = float("nan")
+
+
+def bounds_of(points: list[Coordinates]) -> Bounds:
+    return (
+        min(point.lat for point in points),
+        min(point.lon for point in points),
+        max(point.lat for point in points),
+        max(point.lon for point in points),
+    )
+
+
+class SparseGrid:
+    """A lattice of anchor points, aligned to multiples of the steps so anchors are shared between calls
+
+    Example:
+        >>> grid = SparseGrid.from_max_error(30, bounds_of(towns))
+        >>> zmanim = grid.fetch(towns, date(2023, 3, 1), days=7)  # zmanim[i] are the days of towns[i]
+
+    Args:
+        lat_step (float): Distance between anchors in degrees of latitude.
+        lon_step (float): Distance between anchors in degrees of longitude.
+    """
+
+    DECIMALS = 6
+
+    def __init__(self, lat_step: float, lon_step: float):
+        if lat_step <= 0 or lon_step <= 0:
+            raise ValueError("Lattice steps must be positive")
+
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.stats = Counter()
+
+    @classmethod
+    def from_max_error(
+        cls, seconds: float, bounds: Bounds, max_step: float = 4.0, samples: int = 100
+    ) -> "SparseGrid":
+        """Create the coarsest lattice (up to max_step) whose measured interpolation error within bounds is at most seconds"""
+        step = max_step
+        while True:
+            grid = cls(step, step)
+            if grid.max_error(bounds, samples) <= seconds:
+                return grid
+            step /= 2
+            if step < 1e-4:
+                raise ValueError(f"No lattice keeps the error within {seconds} seconds")
+
+    def axis(self, low: float, high: float, step: float) -> list[float]:
+        first, last = floor(low / step), ceil(high / step)
+        if last == first:
+            last += 1
+        return [round(i * step, self.DECIMALS) for i in range(first, last + 1)]
+
+    def anchors(self, bounds: Bounds) -> tuple[list[float], list[float]]:
+        """The anchor latitudes and longitudes covering bounds, anchor (i, j) is (lats[i], lons[j])"""
+        min_lat, min_lon, max_lat, max_lon = bounds
+        return (
+            self.axis(min_lat, max_lat, self.lat_step),
+            self.axis(min_lon, max_lon, self.lon_step),
+        )
+
+    def cells(
+        self, lats: list[float], lons: list[float], points: list[tuple[float, float]]
+    ) -> tuple[list[array], list[array]]:
+        """The 4 anchor indices and bilinear weights of every point, as parallel arrays (one per corner)"""
+        width = len(lons)
+        indices = [array("l") for _ in range(4)]
+        weights = [array("d") for _ in range(4)]
+        for lat, lon in points:
+            i = min(max(floor((lat - lats[0]) / self.lat_step), 0), len(lats) - 2)
+            j = min(max(floor((lon - lons[0]) / self.lon_step), 0), width - 2)
+            y = (lat - lats[i]) / self.lat_step
+            x = (lon - lons[j]) / self.lon_step
+            for corner, (index, weight) in enumerate(
+                (
+                    (i * width + j, (1 - y) * (1 - x)),
+                    (i * width + j + 1, (1 - y) * x),
+                    ((i + 1) * width + j, y * (1 - x)),
+                    ((i + 1) * width + j + 1, y * x),
+                )
+            ):
+                indices[corner].append(index)
+                weights[corner].append(weight)
+        return indices, weights
+
+    @staticmethod
+    def interpolate(
+        values: array, indices: list[array], weights: list[array]
+    ) -> list[float]:
+        """Interpolate one column of anchor values for every point, NaN where a corner has no value"""
+        i0, i1, i2, i3 = indices
+        w0, w1, w2, w3 = weights
+        return [
+            values[a] * wa + values[b] * wb + values[c] * wc + values[d] * wd
+            for a, b, c, d, wa, wb, wc, wd in zip(i0, i1, i2, i3, w0, w1, w2, w3)
+        ]
+
+    def max_error(self, bounds: Bounds, samples: int = 100, seed: int = 0) -> float:
+        """Largest difference (seconds) between astral's times at random points within bounds and their interpolation"""
+        from astral import Observer
+        from astral.sun import dawn, dusk, sunrise, sunset
+
+        events = [
+            sunrise,
+            sunset,
+            lambda observer, day, tzinfo: dawn(observer, day, 16.1, tzinfo),
+            lambda observer, day, tzinfo: dusk(observer, day, 8.5, tzinfo),
+        ]
+        lats, lons = self.anchors(bounds)
+        rng = random.Random(seed)
+        points = [
+            (rng.uniform(bounds[0], bounds[2]), rng.uniform(bounds[1], bounds[3]))
+            for _ in range(samples)
+        ]
+        indices, weights = self.cells(lats, lons, points)
+        # (roughly) local solar time, so all the events of a day are on the same date
+        tzinfo = timezone(timedelta(hours=round((bounds[1] + bounds[3]) / 2 / 15)))
+
+        def seconds(event, lat: float, lon: float, day: date) -> float:
+            try:
+                moment = event(Observer(lat, lon), day, tzinfo)
+            except ValueError:
+                return NAN  # the sun doesn't reach the altitude on that day
+            return (
+                moment.hour * 3600
+                + moment.minute * 60
+                + moment.second
+                + moment.microsecond / 1e6
+            )
+
+        worst = 0.0
+        for day_offset in range(0, 366, 14):
+            day = date(2023, 1, 1) + timedelta(days=day_offset)
+            for event in events:
+                anchor_values = array(
+                    "d", (seconds(event, lat, lon, day) for lat in lats for lon in lons)
+                )
+                estimates = self.interpolate(anchor_values, indices, weights)
+                for (lat, lon), estimate in zip(points, estimates):
+                    exact = seconds(event, lat, lon, day)
+                    if not isnan(exact) and not isnan(estimate):
+                        worst = max(worst, abs(exact - estimate))
+        return worst
+
+    def fetch(
+        self,
+        points: list[Coordinates],
+        start_date: date,
+        days: int = 1,
+        threads: int = 8,
+    ) -> list[list[ZmanimDay]]:
+        """Get the zmanim of every point (in the order of points) from the zmanim of the anchors around them.
+        Points with different time zones are handled as separate groups.
+        """
+        results: list[Optional[list[ZmanimDay]]] = [None] * len(points)
+        groups = defaultdict(list)
+        for index, point in enumerate(points):
+            groups[point.time_zone.name].append(index)
+
+        for indices in groups.values():
+            group = [points[index] for index in indices]
+            for index, zmanim_days in zip(
+                indices, self._fetch_group(group, start_date, days, threads)
+            ):
+                results[index] = zmanim_days
+        return results
+
+    def _fetch_group(
+        self, points: list[Coordinates], start_date: date, days: int, threads: int
+    ) -> list[list[ZmanimDay]]:
+        lats, lons = self.anchors(bounds_of(points))
+        time_zone = points[0].time_zone
+        anchors = [
+            Coordinates(
+                lat=lat, lon=lon, time_zone=time_zone, custom_name=f"{lat},{lon}"
+            )
+            for lat in lats
+            for lon in lons
+        ]
+        with ThreadPoolExecutor(threads) as executor:
+            anchor_days = list(
+                executor.map(
+                    lambda anchor: ZmanimAPI.get_zmanim(
+                        start_date, days, coordinates=anchor, lazy=True
+                    ),
+                    anchors,
+                )
+            )
+        self.stats["anchors"] += len(anchors)
+        self.stats["points"] += len(points)
+
+        indices, weights = self.cells(lats, lons, [(p.lat, p.lon) for p in points])
+        # the anchor with the largest weight, the day data and missing zmanim are taken from it
+        nearest = [
+            max(range(4), key=lambda corner: weights[corner][k])
+            for k in range(len(points))
+        ]
+        nearest = [indices[corner][k] for k, corner in enumerate(nearest)]
+
+        results = [[] for _ in points]
+        for day_index in range(min(len(zmanim_days) for zmanim_days in anchor_days)):
+            # every zman of the day as a column of seconds over the anchors
+            names = []
+            for zmanim_days in anchor_days:
+                for name in zmanim_days[day_index].zmanim.keys():
+                    if name not in names:
+                        names.append(name)
+
+            columns = {}
+            for name in names:
+                values = array("d", [NAN] * len(anchors))
+                for k, zmanim_days in enumerate(anchor_days):
+                    zmanim = zmanim_days[day_index].zmanim
+                    if name in zmanim:
+                        values[k] = _seconds(zmanim[name].time)
+                _unwrap(values)
+                columns[name] = (values, self.interpolate(values, indices, weights))
+
+            for k, point in enumerate(points):
+                source = anchor_days[nearest[k]][day_index]
+                zmanim_day = ZmanimDay(Day.construct(**source.day.__dict__))
+                zmanim_day.location = LocationInfo.construct(name=point.custom_name)
+                for name in source.zmanim.keys():
+                    values, estimates = columns[name]
+                    estimate = estimates[k]
+                    if isnan(estimate):
+                        estimate = values[nearest[k]]
+                    zman = source.zmanim[name]
+                    zman_type = getattr(ZmanimTypes, name)
+                    zmanim_day.zmanim[name] = Zman.construct(
+                        name=name,
+                        eng_title=zman_type.eng_title,
+                        heb_title=zman_type.heb_title,
+                        time=_format(estimate, clock=zman.time.rstrip().endswith("M")),
+                        raw_title=zman.raw_title,
+                        foot_note_type=zman.foot_note_type,
+                    )
+                results[k].append(zmanim_day)
+
+        return results
+
+
+def _seconds(time_str: str) -> float:
+    t = parse_zman_time(time_str)
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _unwrap(values: array) -> None:
+    """Keep times around midnight (e.g. chatzos night) on the same side of it as the first anchor"""
+    reference = next((value for value in values if not isnan(value)), None)
+    if reference is None:
+        return
+    for k, value in enumerate(values):
+        if value - reference > DAY_SECONDS / 2:
+            values[k] = value - DAY_SECONDS
+        elif reference - value > DAY_SECONDS / 2:
+            values[k] = value + DAY_SECONDS
+
+
+def _format(seconds: float, clock: bool = True) -> str:
+    """Format seconds since midnight as "5:27:12 PM", or as a "0:57:03" duration"""
+    total = round(seconds)
+    if not clock:
+        return f"{total // 3600}:{total // 60 % 60:02d}:{total % 60:02d}"
+    total %= DAY_SECONDS
+    hour, minute, second = total // 3600, total // 60 % 60, total % 60
+    return (
+        f"{(hour - 1) % 12 + 1}:{minute:02d}:{second:02d} {'AM' if hour < 12 else 'PM'}"
+    )
+
+
+if __name__ == "__main__":
+    for region, bounds in (
+        ("Israel", (29.5, 34.2, 33.3, 35.9)),
+        ("Pacific Northwest", (45, -125, 49, -117)),
+    ):
+        for seconds in (5, 30):
+            grid = SparseGrid.from_max_error(seconds, bounds)
+            lats, lons = grid.anchors(bounds)
+            measured = grid.max_error(bounds, samples=300, seed=1)
+            print(
+                f"{region}, max error {seconds}s: step {grid.lat_step:.4f} degrees, {len(lats) * len(lons)} anchors, "
+                f"measured on other points {measured:.1f}s {'OK' if measured <= seconds else 'EXCEEDED'}"
+            )
@@ -0,0 +1,252 @@
+"""Precomputed sunrise and sunset times
+
+Sunrise and sunset (UTC, as astral calculates them) for every city in astral's geocoder and every city in Cities,
+for several years. Times are stored as seconds after UTC midnight in 2 second units (uint16),
+the day-to-day differences of each series are lzma compressed, so the whole table is a few hundred KB.
+The table is loaded on the first lookup and a lookup is an array index.
+
+Build (and validate against astral) with:
+    python sun_table.py build [start year] [years]
+    python sun_table.py validate
+"""
+
+import lzma
+import os
+import random
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from locations import Cities
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "sun_table.bin"
+)
+
+
+def resolve(name: str) -> Optional[tuple[float, float]]:
+    """(latitude, longitude) of a city name, as the callers of the table resolve it without the table:
+    astral's lookup (the first match when cities in different regions share a name, e.g. Birmingham),
+    then the Cities members. None if it is not found
+    """
+    from astral.geocoder import database, lookup
+
+    try:
+        location = lookup(name, database())
+        return location.latitude, location.longitude
+    except KeyError:
+        pass
+    for city in Cities:
+        if (
+            city.value.latitude is not None
+            and city.value.eng_name.lower() == name.lower()
+        ):
+            return city.value.latitude, city.value.longitude
+    return None
+
+
+def table_locations() -> dict[str, tuple[float, float]]:
+    """Name (lower case) -> (latitude, longitude) of every location in the table"""
+    from astral.geocoder import all_locations, database
+
+    names = {location.name.lower() for location in all_locations(database())}
+    names.update(
+        city.value.eng_name.lower()
+        for city in Cities
+        if city.value.latitude is not None
+    )
+    return {name: resolve(name) for name in names}
+
+
+class SunTable:
+    MAGIC = b"SUN1"
+    EVENTS = ("sunrise", "sunset")
+    RESOLUTION = 2  # seconds
+    MISSING = 0xFFFF  # no sunrise/sunset on that day (polar day or night)
+
+    def __init__(self, first_day: date, days: int, names: list[str], values: array):
+        self.first_day = first_day
+        self.days = days
+        self.names = {name: i for i, name in enumerate(names)}
+        self.values = values  # [location][event][day]
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self.names
+
+    def lookup(
+        self, name: str, day: date, event: str = "sunrise"
+    ) -> Optional[datetime]:
+        """Get the UTC time of the event, None if the location or day are not in the table or there is no event that day"""
+        location = self.names.get(name.lower())
+        offset = (day - self.first_day).days
+        if location is None or not 0 <= offset < self.days:
+            return None
+
+        value = self.values[
+            (location * len(self.EVENTS) + self.EVENTS.index(event)) * self.days
+            + offset
+        ]
+        if value == self.MISSING:
+            return None
+
+        return datetime.combine(day, time(), timezone.utc) + timedelta(
+            seconds=value * self.RESOLUTION
+        )
+
+    @classmethod
+    def compute(cls, latitude: float, longitude: float, day: date, event: str) -> int:
+        """Calculate a single table value with astral"""
+        from astral import Observer
+        from astral import sun
+
+        try:
+            event_time = getattr(sun, event)(
+                Observer(latitude, longitude), day, timezone.utc
+            )
+        except ValueError:
+            return cls.MISSING
+
+        midnight = datetime.combine(day, time(), timezone.utc)
+        seconds = (event_time - midnight).total_seconds()
+        return round(seconds / cls.RESOLUTION) % (86400 // cls.RESOLUTION)
+
+    @classmethod
+    def build(cls, first_day: date, days: int) -> "SunTable":
+        locations = table_locations()
+        names = sorted(locations)
+        values = array("H")
+        for name in names:
+            latitude, longitude = locations[name]
+            for event in cls.EVENTS:
+                values.extend(
+                    cls.compute(
+                        latitude, longitude, first_day + timedelta(days=i), event
+                    )
+                    for i in range(days)
+                )
+        return cls(first_day, days, names, values)
+
+    def validate(self, samples: int = 2000, seed: int = 0) -> int:
+        """Compare random table entries to astral, returns the number of mismatches.
+        Every location with a name shared by several astral cities is checked, they are the ones a wrong
+        name -> city mapping would get wrong
+        """
+        from astral.geocoder import all_locations, database
+
+        counts = Counter(
+            location.name.lower() for location in all_locations(database())
+        )
+        names = [name for name in self.names if counts[name] > 1]
+        rng = random.Random(seed)
+        names += [rng.choice(list(self.names)) for _ in range(samples)]
+        mismatches = 0
+        for name in names:
+            event = rng.choice(self.EVENTS)
+            offset = rng.randrange(self.days)
+            location = resolve(name)
+            if location is None:
+                mismatches += 1
+                continue
+            expected = self.compute(
+                *location, self.first_day + timedelta(days=offset), event
+            )
+            actual = self.values[
+                (self.names[name] * len(self.EVENTS) + self.EVENTS.index(event))
+                * self.days
+                + offset
+            ]
+            if expected != actual:
+                mismatches += 1
+        return mismatches
+
+    def save(self, path: str) -> None:
+        # store the differences between consecutive days, they are small and compress very well
+        deltas = array("H", self.values)
+        for start in range(0, len(deltas), self.days):
+            for i in range(start + self.days - 1, start, -1):
+                deltas[i] = (self.values[i] - self.values[i - 1]) & 0xFFFF
+        if sys.byteorder == "big":
+            deltas.byteswap()
+
+        names = "\n".join(sorted(self.names, key=self.names.get)).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(
+                struct.pack(
+                    "<4sIII",
+                    self.MAGIC,
+                    self.first_day.toordinal(),
+                    self.days,
+                    len(names),
+                )
+            )
+            f.write(names)
+            f.write(lzma.compress(deltas.tobytes()))
+
+    @classmethod
+    def load(cls, path: str) -> "SunTable":
+        with open(path, "rb") as f:
+            magic, first_ordinal, days, names_size = struct.unpack("<4sIII", f.read(16))
+            if magic != cls.MAGIC:
+                raise ValueError(f"{path} is not a sun table")
+            names = f.read(names_size).decode("utf-8").split("\n")
+            values = array("H")
+            values.frombytes(lzma.decompress(f.read()))
+
+        if sys.byteorder == "big":
+            values.byteswap()
+        for start in range(0, len(values), days):
+            for i in range(start + 1, start + days):
+                values[i] = (values[i - 1] + values[i]) & 0xFFFF
+
+        return cls(date.fromordinal(first_ordinal), days, names, values)
+
+
+_table: Optional[SunTable] = None
+_table_loaded = False
+_table_lock = threading.Lock()
+
+
+def get_table(path: Optional[str] = None) -> Optional[SunTable]:
+    """Get the sun table, it is loaded on the first call. None if the table file doesn't exist"""
+    global _table, _table_loaded
+    with _table_lock:
+        if not _table_loaded:
+            path = path or DEFAULT_PATH
+            _table = SunTable.load(path) if os.path.exists(path) else None
+            _table_loaded = True
+        return _table
+
+
+def lookup(name: str, day: date, event: str = "sunrise") -> Optional[datetime]:
+    """Get the UTC time of sunrise/sunset from the table, None if it is not in the table"""
+    table = get_table()
+    return table.lookup(name, day, event) if table else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        start_year = int(sys.argv[2]) if len(sys.argv) > 2 else date.today().year
+        years = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+        first_day = date(start_year, 1, 1)
+        table = SunTable.build(
+            first_day, (date(start_year + years, 1, 1) - first_day).days
+        )
+        os.makedirs(os.path.dirname(DEFAULT_PATH), exist_ok=True)
+        table.save(DEFAULT_PATH)
+        table = SunTable.load(DEFAULT_PATH)
+        print(
+            f"Saved {len(table.names)} locations x {table.days} days to {DEFAULT_PATH} "
+            f"({os.path.getsize(DEFAULT_PATH)} bytes), {table.validate()} mismatches with astral"
+        )
+    elif len(sys.argv) == 2 and sys.argv[1] == "validate":
+        table = get_table()
+        if table is None:
+            sys.exit(f"{DEFAULT_PATH} not found, build it first")
+        mismatches = table.validate()
+        print(f"{mismatches} mismatches with astral")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print(__doc__)
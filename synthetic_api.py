@@ -0,0 +1,84 @@
+"""Synthetic chabad.org responses, for the benchmarks and the simulation, no network access needed
+
+make_response builds a response with the same daily zmanim every day, a candle lighting on friday and a shabbat
+end time on saturday. SyntheticChabadAPI answers every request with one.
+"""
+
+from datetime import date, datetime, timedelta
+from chabad_org_wrapper import ChabadAPI, ZmanimRequest
+
+DAILY_ZMANIM = [
+    ("AlosHashachar", "5:02 AM"),
+    ("EarliestTefillin", "5:29 AM"),
+    ("NetzHachamah", "6:21 AM"),
+    ("LatestShema", "9:12 AM"),
+    ("LatestTefillah", "10:09 AM"),
+    ("Chatzos", "12:03 PM"),
+    ("MinchahGedolah", "12:31 PM"),
+    ("MinchahKetanah", "3:22 PM"),
+    ("PlagHaminchah", "4:33 PM"),
+    ("Shkiah", "5:45 PM"),
+    ("Tzeis", "6:11 PM"),
+    ("ChatzosNight", "12:03 AM"),
+    ("ShaahZmanit", "0:57"),
+]
+
+
+def make_time_group(zman_type: str, time_str: str, footnote_type: str = None) -> dict:
+    return {
+        "ZmanType": zman_type,
+        "Title": zman_type,
+        "FootnoteType": footnote_type,
+        "Items": [{"Zman": time_str}],
+    }
+
+
+def make_response(start_date: date, end_date: date) -> dict:
+    """Build a chabad.org like response with a day for every date in [start_date, end_date]"""
+    days = []
+    current = start_date
+    while current <= end_date:
+        day_of_week = (current.weekday() + 1) % 7  # chabad.org counts from sunday
+        time_groups = [make_time_group(*zman) for zman in DAILY_ZMANIM]
+        if day_of_week == 5:
+            time_groups.append(make_time_group("CandleLighting", "5:27 PM"))
+        if day_of_week == 6:
+            time_groups.append(make_time_group("ShabbatEndTime", "6:24 PM"))
+
+        days.append(
+            {
+                "DisplayDate": current.strftime("%m/%d/%Y"),
+                "DayOfWeek": day_of_week,
+                "IsHoliday": False,
+                "HolidayName": None,
+                "Parsha": "Noach" if day_of_week == 6 else None,
+                "TimeGroups": time_groups,
+            }
+        )
+        current += timedelta(days=1)
+
+    return {"Days": days}
+
+
+class SyntheticChabadAPI(ChabadAPI):
+    """A ChabadAPI client that answers every request with a synthetic response"""
+
+    def get_zmanim(self, r: ZmanimRequest) -> dict:
+        if r.date:
+            start_date = end_date = datetime.strptime(r.date, "%m/%d/%Y").date()
+        else:
+            start_date = datetime.strptime(r.start_date, "%m/%d/%Y").date()
+            end_date = datetime.strptime(r.end_date, "%m/%d/%Y").date()
+        return make_response(start_date, end_date)
+
+
+def shift_time(time_str: str, minutes: int) -> str:
+    """Move a "5:27 PM" like time by minutes, durations (e.g. ShaahZmanit "0:57") are returned as is"""
+    from zmanim_api import parse_zman_time
+
+    if not time_str.endswith("M"):
+        return time_str
+    shifted = datetime.combine(date(2000, 1, 1), parse_zman_time(time_str)) + timedelta(
+        minutes=minutes
+    )
+    return shifted.strftime("%I:%M %p").lstrip("0")
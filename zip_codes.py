@@ -0,0 +1,306 @@
+"""Offline US ZIP code resolution
+
+ZIP codes are resolved to coordinates and an IANA time zone from a compact binary index, no geocoding request needed.
+The index is a sorted array of ZIP codes with parallel arrays of latitude/longitude (in 1e-5 degrees) and time zone ids,
+a lookup is a binary search. It is loaded lazily on the first lookup.
+
+No index is shipped. Without one, a ZIP code location is sent to chabad.org as is (locationtype 2) and chabad.org
+resolves it, see to_location. Only the time zone of the ZIP code can't be known then (see time_zone).
+
+The time zones are the chabad.org TimeZones whose UTC offsets match the IANA zone of the ZIP code.
+
+The index is built from a CSV file with zip, latitude, longitude and timezone (IANA name) columns:
+    python zip_codes.py build us_zip_codes.csv
+    python zip_codes.py lookup 11213
+"""
+
+import logging
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+from locations import Coordinates, Location, LocationType, TimeZone, TimeZones
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "us_zip_codes.bin"
+)
+
+
+def normalize_zip_code(zip_code: str) -> int:
+    """Get the 5 digit ZIP code as an int, "02134" and "02134-1234" are both 2134"""
+    zip_code = str(zip_code).strip().split("-")[0]
+    if len(zip_code) != 5 or not zip_code.isdigit():
+        raise ValueError(f"Invalid ZIP code: {zip_code}")
+    return int(zip_code)
+
+
+# the UTC offsets of a time zone are compared at noon UTC of every day of a year, which catches DST rules
+# that differ by a day
+_SAMPLES = [
+    datetime(2025, 1, 1, 12, tzinfo=timezone.utc) + timedelta(days=i)
+    for i in range(365)
+]
+
+
+def _offsets(iana_name: str) -> tuple:
+    zone = ZoneInfo(iana_name)
+    return tuple(sample.astimezone(zone).utcoffset() for sample in _SAMPLES)
+
+
+@lru_cache(maxsize=1)
+def _chabad_offsets() -> list[tuple[TimeZone, tuple]]:
+    return [(member.value, _offsets(member.value.iana_name)) for member in TimeZones]
+
+
+@lru_cache(maxsize=None)
+def time_zone_from_iana(iana_name: str) -> TimeZone:
+    """Get the chabad.org TimeZone of an IANA name, chabad.org only accepts the TimeZones names.
+    A zone that is not one of them (e.g. America/New_York) is the TimeZones member with the same UTC offsets
+    all year (America*Detroit), preferably of the same region. When none has exactly the same offsets,
+    the one that matches on the most days is used.
+    """
+    for member in TimeZones:
+        if member.value.iana_name == iana_name:
+            return member.value
+
+    offsets = _offsets(iana_name)
+    region = iana_name.split("/")[0]
+
+    def score(candidate: tuple[TimeZone, tuple]) -> tuple[int, bool]:
+        time_zone, candidate_offsets = candidate
+        matching = sum(a == b for a, b in zip(offsets, candidate_offsets))
+        return matching, time_zone.iana_name.split("/")[0] == region
+
+    time_zone, candidate_offsets = max(_chabad_offsets(), key=score)
+    if candidate_offsets != offsets:
+        logger.warning(
+            "No chabad.org time zone has the UTC offsets of %s, using %s",
+            iana_name,
+            time_zone.name,
+        )
+    return time_zone
+
+
+class ZipCodeIndex:
+    MAGIC = b"ZIP1"
+    SCALE = 100000  # coordinates are stored as int32 in 1e-5 degrees (~1 meter)
+
+    def __init__(
+        self,
+        zip_codes: array,
+        lats: array,
+        lons: array,
+        zone_ids: array,
+        zones: list[str],
+    ):
+        self.zip_codes = zip_codes
+        self.lats = lats
+        self.lons = lons
+        self.zone_ids = zone_ids
+        self.zones = zones
+
+    def __len__(self) -> int:
+        return len(self.zip_codes)
+
+    def lookup(self, zip_code: str) -> Optional[tuple[float, float, str]]:
+        """Get (lat, lon, IANA time zone) of the ZIP code, None if it is not in the index"""
+        key = normalize_zip_code(zip_code)
+        i = bisect_left(self.zip_codes, key)
+        if i == len(self.zip_codes) or self.zip_codes[i] != key:
+            return None
+        return (
+            self.lats[i] / self.SCALE,
+            self.lons[i] / self.SCALE,
+            self.zones[self.zone_ids[i]],
+        )
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple[str, float, float, str]]) -> "ZipCodeIndex":
+        """Create an index from (zip code, lat, lon, IANA time zone) rows"""
+        entries = sorted(
+            (normalize_zip_code(zip_code), lat, lon, zone)
+            for zip_code, lat, lon, zone in rows
+        )
+        zones = sorted({entry[3] for entry in entries})
+        zone_ids = {zone: i for i, zone in enumerate(zones)}
+
+        return cls(
+            array("I", [entry[0] for entry in entries]),
+            array("i", [round(entry[1] * cls.SCALE) for entry in entries]),
+            array("i", [round(entry[2] * cls.SCALE) for entry in entries]),
+            array("H", [zone_ids[entry[3]] for entry in entries]),
+            zones,
+        )
+
+    @classmethod
+    def from_csv(cls, path: str) -> "ZipCodeIndex":
+        """Create an index from a csv file with zip, latitude/lat, longitude/lon/lng and timezone columns"""
+        import csv
+
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            columns = {name.lower(): name for name in reader.fieldnames}
+
+            def column(*names: str) -> str:
+                for name in names:
+                    if name in columns:
+                        return columns[name]
+                raise ValueError(f"{path} has no {' or '.join(names)} column")
+
+            zip_column = column("zip", "zip_code", "zipcode", "postal_code")
+            lat_column = column("latitude", "lat")
+            lon_column = column("longitude", "lon", "lng")
+            zone_column = column("timezone", "time_zone", "tz")
+
+            rows = [
+                (
+                    row[zip_column].zfill(5),
+                    float(row[lat_column]),
+                    float(row[lon_column]),
+                    row[zone_column],
+                )
+                for row in reader
+                if row[lat_column] and row[lon_column] and row[zone_column]
+            ]
+
+        return cls.from_rows(rows)
+
+    def save(self, path: str) -> None:
+        zones = "\n".join(self.zones).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sII", self.MAGIC, len(self), len(zones)))
+            f.write(zones)
+            for values in (self.zip_codes, self.lats, self.lons, self.zone_ids):
+                values = array(values.typecode, values)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                f.write(values.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "ZipCodeIndex":
+        with open(path, "rb") as f:
+            magic, count, zones_size = struct.unpack("<4sII", f.read(12))
+            if magic != cls.MAGIC:
+                raise ValueError(f"{path} is not a ZIP code index")
+
+            zones = f.read(zones_size).decode("utf-8").split("\n")
+            arrays = []
+            for typecode in ("I", "i", "i", "H"):
+                values = array(typecode)
+                values.frombytes(f.read(count * values.itemsize))
+                if sys.byteorder == "big":
+                    values.byteswap()
+                arrays.append(values)
+
+        return cls(*arrays, zones)
+
+
+_index: Optional[ZipCodeIndex] = None
+_index_missing = False
+_index_lock = threading.Lock()
+
+
+def get_index(path: Optional[str] = None) -> ZipCodeIndex:
+    """Get the ZIP code index, it is loaded on the first call"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = path or os.environ.get("ZIP_CODES_INDEX", DEFAULT_PATH)
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"ZIP code index {path} not found, build it with `python zip_codes.py build <csv file>`"
+                )
+            _index = ZipCodeIndex.load(path)
+        return _index
+
+
+def has_index() -> bool:
+    """Whether there is a ZIP code index, the first missing index is logged and not looked for again"""
+    global _index_missing
+    if _index is not None:
+        return True
+    if _index_missing:
+        return False
+    try:
+        get_index()
+        return True
+    except FileNotFoundError as e:
+        logger.warning("%s, ZIP codes are resolved by chabad.org", e)
+        _index_missing = True
+        return False
+
+
+@lru_cache(maxsize=4096)
+def to_coordinates(zip_code: str) -> Coordinates:
+    """Resolve a US ZIP code to Coordinates, the ZIP code is used as the location name.
+    The result is cached and shared, don't modify it.
+    """
+    entry = get_index().lookup(zip_code)
+    if entry is None:
+        raise ValueError(f"Unknown ZIP code: {zip_code}")
+
+    lat, lon, zone = entry
+    return Coordinates(
+        lat=lat,
+        lon=lon,
+        time_zone=time_zone_from_iana(zone),
+        custom_name=f"{normalize_zip_code(zip_code):05d}",
+    )
+
+
+def to_location(zip_code: str) -> Location:
+    """The Location to request the zmanim of a ZIP code with: its coordinates from the index, or without an
+    index the ZIP code itself, for chabad.org to resolve
+    """
+    if has_index():
+        return Location.for_coordinates(to_coordinates(zip_code))
+    return Location.construct(
+        city=None,
+        coordinates=None,
+        zip_code=f"{normalize_zip_code(zip_code):05d}",
+        type=LocationType.ZIP_CODE,
+    )
+
+
+# time zones given for ZIP codes (e.g. the time_zone of a job location), used when there is no index
+_time_zones: dict[int, TimeZone] = {}
+
+
+def set_time_zone(zip_code: str, time_zone: TimeZone) -> None:
+    _time_zones[normalize_zip_code(zip_code)] = time_zone
+
+
+def time_zone(zip_code: str) -> TimeZone:
+    """The time zone of a ZIP code, from the index or set_time_zone (chabad.org only resolves the ZIP code of a request)"""
+    given = _time_zones.get(normalize_zip_code(zip_code))
+    if given is not None:
+        return given
+    if not has_index():
+        raise ValueError(
+            f"The time zone of ZIP code {zip_code} needs a ZIP code index (see zip_codes.py), "
+            "or a time_zone in its location config"
+        )
+    return to_coordinates(zip_code).time_zone
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "build":
+        index = ZipCodeIndex.from_csv(sys.argv[2])
+        output = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PATH
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        index.save(output)
+        print(
+            f"Saved {len(index)} ZIP codes to {output} ({os.path.getsize(output)} bytes)"
+        )
+    elif len(sys.argv) == 3 and sys.argv[1] == "lookup":
+        print(to_coordinates(sys.argv[2]))
+    else:
+        print(__doc__)
@@ -0,0 +1,250 @@
+"""The zmanim of a range of days as UTC instants
+
+Zman.time is the local time chabad.org displays ("5:27 PM"). ZmanTimes converts the times of a whole range
+to UTC epoch seconds at once, keeping a column (an array of int64) per zman, so schedulers and exporters
+compare integers instead of parsing strings and attaching time zones to every value.
+
+The conversion is cheap because the values repeat: every distinct time string is parsed once (seconds_of_day),
+and the UTC offset of every (time zone, date) is computed once (_day_offset). A column is then integer sums.
+Only on the days a DST transition happens is every value converted through zoneinfo, a time in the skipped
+hour is taken with the offset before the transition and a repeated time is the first one (fold=0).
+
+The zmanim an erev day got from the following days (ShabbatEndTime and the extra candle lightings) are converted
+with the date of the day they came from, so Friday's ShabbatEndTime is on Saturday.
+
+Example:
+    >>> times = ZmanTimes(ZmanimAPI.get_zmanim(date(2023, 3, 1), days=60, city=Cities.JERUSALEM), TimeZones.JERUSALEM.value)
+    >>> times.times(ZmanimTypes.CandleLighting.name)  # array('q', [MISSING, MISSING, 1677853560, ...])
+    >>> times.next_after(ZmanimTypes.CandleLighting.name, time.time())
+"""
+
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+from locations import TimeZone
+from response_schema import ZmanimResponse
+from zmanim_api import ZmanimDay, ZmanimTypes, parse_zman_time
+
+# the value of a zman the day doesn't have
+MISSING = -(2**63)
+
+# not a time of day (e.g. ShaahZmanit "0:57" is a length of an hour)
+DURATIONS = frozenset([ZmanimTypes.ShaahZmanit.name])
+# the night after the date, a time before noon is after midnight (e.g. ChatzosNight "12:03 AM")
+NIGHT_ZMANIM = frozenset([ZmanimTypes.ChatzosNight.name])
+# the extra candle lightings an erev day gets from the following days (see ZmanimAPI.enrich_with_special_times),
+# by the number of days after the erev day they are from
+EXTRA_CANDLE_LIGHTINGS = {
+    ZmanimTypes.SecondDayCandleLighting.name: 1,
+    ZmanimTypes.ThirdDayCandleLighting.name: 2,
+}
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_DAY = 24 * 60 * 60
+_NOON = 12 * 60 * 60
+
+
+@lru_cache(maxsize=8192)
+def seconds_of_day(time_str: str) -> int:
+    """Seconds since midnight of a chabad.org zman time, any of the ZMAN_TIME_FORMATS"""
+    parsed = parse_zman_time(time_str)
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+@lru_cache(maxsize=None)
+def _zone(iana_name: str) -> ZoneInfo:
+    return ZoneInfo(iana_name)
+
+
+@lru_cache(maxsize=65536)
+def _day_offset(iana_name: str, ordinal: int) -> Optional[int]:
+    """The UTC offset (seconds) of the whole local day, None when it changes during the day (a DST transition)"""
+    zone = _zone(iana_name)
+    day = date.fromordinal(ordinal)
+    start = datetime(day.year, day.month, day.day, tzinfo=zone).utcoffset()
+    end = datetime(day.year, day.month, day.day, 23, 59, 59, tzinfo=zone).utcoffset()
+    if start != end:
+        return None
+    return int(start.total_seconds())
+
+
+def to_epochs(
+    dates: Iterable[date],
+    times: Iterable[Optional[str]],
+    time_zone: TimeZone,
+    night: bool = False,
+) -> array:
+    """Convert local zman times to UTC epoch seconds, missing times (None or "") are MISSING
+
+    Args:
+        dates (Iterable[date]): The date of every time.
+        times (Iterable[Optional[str]]): The chabad.org times, e.g. "5:27 PM".
+        time_zone (TimeZone): The time zone of the location.
+        night (bool): The times are of the night after the date, see NIGHT_ZMANIM. Defaults to False.
+    """
+    iana_name = time_zone.iana_name
+    epochs = array("q")
+    append = epochs.append
+    for day, time_str in zip(dates, times):
+        if not time_str:
+            append(MISSING)
+            continue
+        seconds = seconds_of_day(time_str)
+        if night and seconds < _NOON:
+            day += timedelta(days=1)
+        ordinal = day.toordinal()
+        offset = _day_offset(iana_name, ordinal)
+        if offset is None:
+            local = datetime(
+                day.year, day.month, day.day, tzinfo=_zone(iana_name)
+            ) + timedelta(seconds=seconds)
+            append(int(local.timestamp()))
+        else:
+            append((ordinal - _EPOCH_ORDINAL) * _DAY + seconds - offset)
+    return epochs
+
+
+def _source_offsets(names: list[str]) -> dict[str, int]:
+    """The zmanim an erev day got from the following days, by the number of days after it they are from.
+    The enrichment copies the extra candle lightings of the second (and third) day, and the ShabbatEndTime
+    of the first day after them
+    """
+    if ZmanimTypes.CandleLighting.name not in names:
+        return {}
+    offsets = {
+        name: EXTRA_CANDLE_LIGHTINGS[name]
+        for name in names
+        if name in EXTRA_CANDLE_LIGHTINGS
+    }
+    if ZmanimTypes.ShabbatEndTime.name in names:
+        offsets[ZmanimTypes.ShabbatEndTime.name] = max(offsets.values(), default=0) + 1
+    return offsets
+
+
+class ZmanTimes:
+    """UTC epoch seconds of the zmanim of a range of days of a location
+
+    Args:
+        zmanim_days (list[ZmanimDay]): The days, sorted by date. Missing dates are allowed and have no zmanim.
+        time_zone (TimeZone): The time zone of the location, see ZmanimAPI.time_zone.
+    """
+
+    def __init__(self, zmanim_days: list[ZmanimDay], time_zone: TimeZone):
+        if not zmanim_days:
+            raise ValueError("At least one day is needed")
+        self._build(
+            time_zone,
+            zmanim_days[0].day.date,
+            zmanim_days[-1].day.date,
+            (
+                (zmanim_day.day.date, zmanim_day.zman_times())
+                for zmanim_day in zmanim_days
+            ),
+        )
+
+    @classmethod
+    def from_response(
+        cls, response: ZmanimResponse, time_zone: TimeZone
+    ) -> "ZmanTimes":
+        """Convert a decoded response (see decode_response) without creating the ZmanimDay objects"""
+        if not response.days:
+            raise ValueError("At least one day is needed")
+        times = cls.__new__(cls)
+        times._build(
+            time_zone,
+            response.days[0].date,
+            response.days[-1].date,
+            (
+                (day.date, ((group.zman_type, group.zman) for group in day.time_groups))
+                for day in response.days
+            ),
+        )
+        return times
+
+    def _build(
+        self, time_zone: TimeZone, first: date, last: date, days: Iterable
+    ) -> None:
+        self.time_zone = time_zone
+        self.start = first
+        length = (last - first).days + 1
+
+        # the dates and strings of every zman, by day, then every column is converted in a single pass
+        dates = [first + timedelta(days=i) for i in range(length)]
+        columns: dict[str, tuple[list[date], list[Optional[str]]]] = {}
+        for day, zman_times in days:
+            i = (day - first).days
+            zman_times = [
+                (name, time_str)
+                for name, time_str in zman_times
+                if name not in DURATIONS
+            ]
+            offsets = _source_offsets([name for name, _ in zman_times])
+            for name, time_str in zman_times:
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = (list(dates), [None] * length)
+                if name in offsets:
+                    column[0][i] = day + timedelta(days=offsets[name])
+                column[1][i] = time_str
+
+        self._columns: dict[str, array] = {
+            name: to_epochs(column_dates, column, time_zone, night=name in NIGHT_ZMANIM)
+            for name, (column_dates, column) in columns.items()
+        }
+        self._missing = array("q", [MISSING]) * length
+
+    def __len__(self) -> int:
+        return len(self._missing)
+
+    def names(self) -> list[str]:
+        """The zmanim that at least one day has"""
+        return list(self._columns)
+
+    def columns(self) -> dict[str, array]:
+        """zman name -> times, of the zmanim that at least one day has"""
+        return self._columns
+
+    def times(self, name: str) -> array:
+        """The epoch seconds of a zman for every day of the range, MISSING on the days without it"""
+        return self._columns.get(name, self._missing)
+
+    def at(self, name: str, day: date) -> Optional[int]:
+        i = (day - self.start).days
+        if not 0 <= i < len(self):
+            return None
+        value = self.times(name)[i]
+        return None if value == MISSING else value
+
+    def utc(self, name: str, day: date) -> Optional[datetime]:
+        """The zman of a day as an aware UTC datetime, None if the day doesn't have it"""
+        value = self.at(name, day)
+        return None if value is None else datetime.fromtimestamp(value, timezone.utc)
+
+    def present(self, name: str) -> int:
+        """Bitset of the days that have the zman, bit i is the i-th day (like DayIndex masks)"""
+        mask = 0
+        for i, value in enumerate(self.times(name)):
+            if value != MISSING:
+                mask |= 1 << i
+        return mask
+
+    def next_after(self, name: str, epoch: float) -> Optional[tuple[date, int]]:
+        """The (date, epoch seconds) of the first zman strictly after epoch, None if there is none in the range"""
+        for i, value in enumerate(self.times(name)):
+            if value != MISSING and value > epoch:
+                return self.start + timedelta(days=i), value
+        return None
+
+
+def convert_locations(
+    ranges: dict[str, tuple[list[ZmanimDay], TimeZone]]
+) -> dict[str, ZmanTimes]:
+    """Convert the ranges of many locations (label -> (days, time zone)), the parsed times and the
+    day offsets are shared, so locations of the same time zone only pay for the integer sums
+    """
+    return {
+        label: ZmanTimes(zmanim_days, time_zone)
+        for label, (zmanim_days, time_zone) in ranges.items()
+    }
@@ -8,10 +8,14 @@ from chabad_org_wrapper import (
     LocationType,
     TimeZones,
 )
-from locations import CityInfo
-from datetime import date, datetime, timedelta
-from typing import Optional
-from copy import deepcopy
+import zip_codes
+from hebrew_calendar import HebrewCalendar, is_israel
+from response_schema import ResponseDay, TimeGroup, decode_response
+from locations import CityInfo, TimeZone
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, Optional
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Zman(BaseModel):
@@ -23,6 +27,27 @@ class Zman(BaseModel):
     foot_note_type: Optional[str] = None
 
 
+# formats of Zman.time, as returned by chabad.org
+ZMAN_TIME_FORMATS = ("%I:%M %p", "%I:%M:%S %p", "%H:%M:%S", "%H:%M")
+
+
+def parse_zman_time(time_str: str) -> time:
+    """Parse a chabad.org zman time, e.g. "5:27 PM" """
+    for time_format in ZMAN_TIME_FORMATS:
+        try:
+            return datetime.strptime(time_str.strip(), time_format).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown zman time format: {time_str}")
+
+
+class ZmanTemplate(Zman):
+    """The read-only zmanim of ZmanimTypes, days get their own copies from ZmanimTypes.get_zman"""
+
+    class Config:
+        allow_mutation = False
+
+
 class Day(BaseModel):
     date: date
     day_of_week: int = Field(max=6, min=0)
@@ -37,66 +62,68 @@ class LocationInfo(BaseModel):
 
 
 class ZmanimTypes:
-    AlosHashachar = Zman(
+    AlosHashachar = ZmanTemplate(
         name="AlosHashachar", heb_title="עלות השחר", eng_title="Alos Hashachar"
     )
-    EarliestTefillin = Zman(
+    EarliestTefillin = ZmanTemplate(
         name="EarliestTefillin", heb_title="משיכיר", eng_title="Earliest Tefillin"
     )
-    NetzHachamah = Zman(
+    NetzHachamah = ZmanTemplate(
         name="NetzHachamah", heb_title="נץ החמה", eng_title="Netz Hachamah"
     )
-    LatestShema = Zman(
+    LatestShema = ZmanTemplate(
         name="LatestShema", heb_title="סוף זמן קריאת שמע", eng_title="Latest Shema"
     )
-    LatestTefillah = Zman(
+    LatestTefillah = ZmanTemplate(
         name="LatestTefillah", heb_title="סוף זמן תפילה", eng_title="Latest Tefillah"
     )
-    Chatzos = Zman(name="Chatzos", heb_title="חצות (היום)", eng_title="Chatzos")
-    MinchahGedolah = Zman(
+    Chatzos = ZmanTemplate(name="Chatzos", heb_title="חצות (היום)", eng_title="Chatzos")
+    MinchahGedolah = ZmanTemplate(
         name="MinchahGedolah", heb_title="מנחה גדולה", eng_title="Minchah Gedolah"
     )
-    MinchahKetanah = Zman(
+    MinchahKetanah = ZmanTemplate(
         name="MinchahKetanah", heb_title="מנחה קטנה", eng_title="Minchah Ketanah"
     )
-    PlagHaminchah = Zman(
+    PlagHaminchah = ZmanTemplate(
         name="PlagHaminchah", heb_title="פלג המנחה", eng_title="Plag Haminchah"
     )
-    Shkiah = Zman(name="Shkiah", heb_title="שקיעה", eng_title="Shkiah")
-    CandleLighting = Zman(
+    Shkiah = ZmanTemplate(name="Shkiah", heb_title="שקיעה", eng_title="Shkiah")
+    CandleLighting = ZmanTemplate(
         name="CandleLighting", heb_title="הדלקת נרות", eng_title="Candle Lighting"
     )
-    ShabbatEndTime = Zman(
+    ShabbatEndTime = ZmanTemplate(
         name="ShabbatEndTime", heb_title="צאת שבת", eng_title="Shabbat End Time"
     )
-    ChatzosNight = Zman(
+    ChatzosNight = ZmanTemplate(
         name="ChatzosNight", heb_title="חצות (הלילה)", eng_title="Chatzos Night"
     )
-    ShaahZmanit = Zman(
+    ShaahZmanit = ZmanTemplate(
         name="ShaahZmanit", heb_title="שעה זמנית", eng_title="Shaah Zmanit"
     )
-    Tzeis = Zman(name="Tzeis", heb_title="צאת הכוכבים", eng_title="Tzeis")
-    FastEnds = Zman(name="FastEnds", heb_title="צאת הצום", eng_title="Fast Ends")
-    FastStarts = Zman(
+    Tzeis = ZmanTemplate(name="Tzeis", heb_title="צאת הכוכבים", eng_title="Tzeis")
+    FastEnds = ZmanTemplate(
+        name="FastEnds", heb_title="צאת הצום", eng_title="Fast Ends"
+    )
+    FastStarts = ZmanTemplate(
         name="FastStarts", heb_title="התחלת הצום", eng_title="Fast Starts"
     )
-    LastEatingChametzTime = Zman(
+    LastEatingChametzTime = ZmanTemplate(
         name="LastEatingChametzTime",
         heb_title="סוף זמן אכילת חמץ",
         eng_title="Last Eating Chametz Time",
     )
-    BurnChametzTime = Zman(
+    BurnChametzTime = ZmanTemplate(
         name="BurnChametzTime", heb_title="ביעור חמץ", eng_title="Burn Chametz Time"
     )
-    BedikatChametz = Zman(
+    BedikatChametz = ZmanTemplate(
         name="BedikatChametz", heb_title="בדיקת חמץ", eng_title="Bedikat Chametz"
     )
-    SecondDayCandleLighting = Zman(
+    SecondDayCandleLighting = ZmanTemplate(
         name="SecondDayCandleLighting",
         heb_title="הדלקת נרות יום שני",
         eng_title="Second Day Candle Lighting",
     )
-    ThirdDayCandleLighting = Zman(
+    ThirdDayCandleLighting = ZmanTemplate(
         name="ThirdDayCandleLighting",
         heb_title="הדלקת נרות יום שלישי",
         eng_title="Third Day Candle Lighting",
@@ -104,7 +131,28 @@ class ZmanimTypes:
 
     @classmethod
     def get_zman(cls, name: str) -> Zman:
-        return deepcopy(getattr(cls, name))
+        """Get a new, mutable Zman of the given type. The class attributes are shared by all threads and can't be modified"""
+        template = getattr(cls, name)
+        return Zman.construct(
+            name=template.name,
+            eng_title=template.eng_title,
+            heb_title=template.heb_title,
+        )
+
+
+IMPORTANT_ZMANIM = frozenset(
+    [
+        ZmanimTypes.FastStarts.name,
+        ZmanimTypes.FastEnds.name,
+        ZmanimTypes.BedikatChametz.name,
+        ZmanimTypes.LastEatingChametzTime.name,
+        ZmanimTypes.BurnChametzTime.name,
+        ZmanimTypes.CandleLighting.name,
+        ZmanimTypes.SecondDayCandleLighting.name,
+        ZmanimTypes.ThirdDayCandleLighting.name,
+        ZmanimTypes.ShabbatEndTime.name,
+    ]
+)
 
 
 class ZmanimDay:
@@ -120,12 +168,77 @@ class ZmanimDay:
         else:
             raise ValueError(f"Zman {zman.name} already exists")
 
+    def to_compact(self) -> tuple:
+        """Serialize the day to plain tuples, much cheaper to pickle than the pydantic models"""
+        day = self.day
+        location = getattr(self, "location", None)
+        return (
+            day.date.toordinal(),
+            day.day_of_week,
+            day.is_holiday,
+            day.is_fast_day,
+            day.holiday_name,
+            day.parsha,
+            location.name if location else None,
+            tuple(
+                (zman.name, zman.time, zman.raw_title, zman.foot_note_type)
+                for zman in self.zmanim.values()
+            ),
+        )
+
+    @classmethod
+    def from_compact(cls, data: tuple) -> "ZmanimDay":
+        """Rebuild a day created by to_compact, the data is trusted so validation is skipped"""
+        (
+            ordinal,
+            day_of_week,
+            is_holiday,
+            is_fast_day,
+            holiday_name,
+            parsha,
+            location_name,
+            zmanim,
+        ) = data
+
+        zmanim_day = cls(
+            Day.construct(
+                date=date.fromordinal(ordinal),
+                day_of_week=day_of_week,
+                is_holiday=is_holiday,
+                is_fast_day=is_fast_day,
+                holiday_name=holiday_name,
+                parsha=parsha,
+            )
+        )
+        for name, time_str, raw_title, foot_note_type in zmanim:
+            zman_type = getattr(ZmanimTypes, name)
+            zmanim_day.zmanim[name] = Zman.construct(
+                name=name,
+                eng_title=zman_type.eng_title,
+                heb_title=zman_type.heb_title,
+                time=time_str,
+                raw_title=raw_title,
+                foot_note_type=foot_note_type,
+            )
+
+        if location_name is not None:
+            zmanim_day.location = LocationInfo.construct(name=location_name)
+
+        return zmanim_day
+
+    def zman_times(self) -> Iterator[tuple[str, Optional[str]]]:
+        """The (name, time) of every zman of the day"""
+        for name, zman in self.zmanim.items():
+            yield name, zman.time
+
     def add_location_data(self, location: Location) -> None:
         # TODO: add more details to location info, enable english names
         if location.type == LocationType.CITY:
             self.location = LocationInfo(name=location.city.heb_name)
         elif location.type == LocationType.COORDINATES:
             self.location = LocationInfo(name=location.coordinates.custom_name)
+        elif location.type == LocationType.ZIP_CODE:
+            self.location = LocationInfo(name=location.zip_code)
 
     def is_fast_day(self) -> bool:
         return (
@@ -202,49 +315,130 @@ class ZmanimDay:
         Returns:
             list[Zman]: Populated list of important zmanim
         """
-        important_zmanim = []
-        for zman in self.zmanim:
-            if zman in [
-                ZmanimTypes.FastStarts.name,
-                ZmanimTypes.FastEnds.name,
-                ZmanimTypes.BedikatChametz.name,
-                ZmanimTypes.LastEatingChametzTime.name,
-                ZmanimTypes.BurnChametzTime.name,
-                ZmanimTypes.CandleLighting.name,
-                ZmanimTypes.SecondDayCandleLighting.name,
-                ZmanimTypes.ThirdDayCandleLighting.name,
-                ZmanimTypes.ShabbatEndTime.name,
-            ]:
-                important_zmanim.append(self.get_zman_by_name(zman))
-        return important_zmanim
+        return [
+            self.get_zman_by_name(zman)
+            for zman in self.zmanim.keys()
+            if zman in IMPORTANT_ZMANIM
+        ]
+
+
+class LazyZmanim(MutableMapping):
+    """The zmanim dict of a LazyZmanimDay, zman name -> Zman
+
+    The decoded chabad.org time groups are kept as is and turned into Zman objects on first access,
+    checking which zmanim exist (e.g. is_fast_day) doesn't create anything.
+    """
+
+    def __init__(self, time_groups: tuple[TimeGroup, ...]):
+        entries = {}
+        for time_group in time_groups:
+            name = time_group.zman_type
+            getattr(
+                ZmanimTypes, name
+            )  # unknown zmanim fail while parsing, like the eager path
+            if name in entries:
+                raise ValueError(f"Zman {name} already exists")
+            entries[name] = time_group
+        self._entries: dict = entries
+
+    def __getitem__(self, name: str) -> Zman:
+        value = self._entries[name]
+        if not isinstance(value, Zman):
+            value = decode_zman(value)
+            self._entries[name] = value
+        return value
+
+    def __setitem__(self, name: str, zman: Zman) -> None:
+        self._entries[name] = zman
+
+    def __delitem__(self, name: str) -> None:
+        del self._entries[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def times(self) -> Iterator[tuple[str, Optional[str]]]:
+        """The (name, time) of every zman, without decoding the ones that weren't accessed"""
+        for name, value in self._entries.items():
+            yield name, value.time if isinstance(value, Zman) else value.zman
+
+
+class LazyZmanimDay(ZmanimDay):
+    """A ZmanimDay that decodes its zmanim only when they are used, see LazyZmanim"""
+
+    def __init__(self, day: Day, time_groups: tuple[TimeGroup, ...]):
+        super().__init__(day)
+        self.zmanim = LazyZmanim(time_groups)
+
+    def zman_times(self) -> Iterator[tuple[str, Optional[str]]]:
+        return self.zmanim.times()
+
+
+_ZMAN_FIELDS = frozenset(Zman.__fields__)
+
+
+def decode_zman(time_group: TimeGroup) -> Zman:
+    """Create a Zman from a chabad.org time group.
+    Same as Zman.construct with every field, without its per field loop (this runs for every zman of every day)
+    """
+    zman_type = getattr(ZmanimTypes, time_group.zman_type)
+    zman = Zman.__new__(Zman)
+    object.__setattr__(
+        zman,
+        "__dict__",
+        {
+            "name": zman_type.name,
+            "eng_title": zman_type.eng_title,
+            "heb_title": zman_type.heb_title,
+            "time": time_group.zman,
+            "raw_title": time_group.title,
+            "foot_note_type": time_group.foot_note_type,  # used to check for successesive holidays
+        },
+    )
+    object.__setattr__(zman, "__fields_set__", set(_ZMAN_FIELDS))
+    return zman
 
 
 class ZmanimAPI:
+    # shared client, so the latency history and circuit breaker state are kept between calls
+    chabad_api = ChabadAPI()
+    # local calendars (by israel), used to decide how many days to fetch
+    calendars = {israel: HebrewCalendar(israel) for israel in (False, True)}
+
     def __init__(self, city: CityInfo, date: date):
         self.get_zmanim(city, date)
 
     @staticmethod
-    def format_response(response: dict) -> ZmanimDay:
-        resp_zmanim = response["Days"][0]["TimeGroups"]
-
-        day = Day(
-            date=datetime.strptime(response["Days"][0]["DisplayDate"], "%m/%d/%Y"),
-            day_of_week=response["Days"][0]["DayOfWeek"],
-            is_holiday=response["Days"][0]["IsHoliday"],
-            holiday_name=response["Days"][0]["HolidayName"],
-            parsha=response["Days"][0]["Parsha"],
-        )
+    def format_response(response: dict, lazy: bool = False) -> ZmanimDay:
+        """Parse a single day response, with lazy=True the zmanim are only decoded when they are accessed"""
+        return ZmanimAPI.format_day(decode_response(response).days[0], lazy)
 
-        zmanim = ZmanimDay(day)
+    @staticmethod
+    def format_day(response_day: ResponseDay, lazy: bool = False) -> ZmanimDay:
+        """Create a ZmanimDay from a decoded response day, the types were already checked by decode_response"""
+        day = Day.construct(
+            date=response_day.date,
+            day_of_week=response_day.day_of_week,
+            is_holiday=response_day.is_holiday,
+            holiday_name=response_day.holiday_name,
+            parsha=response_day.parsha,
+        )
 
-        for zman in resp_zmanim:
-            zman_type = ZmanimTypes.get_zman(zman["ZmanType"])
-            zman_type.time = zman["Items"][0]["Zman"]
-            zman_type.raw_title = zman["Title"]
-            zman_type.foot_note_type = zman[
-                "FootnoteType"
-            ]  # used to check for successesive holidays
-            zmanim.add_zman(zman_type)
+        if lazy:
+            zmanim = LazyZmanimDay(day, response_day.time_groups)
+        else:
+            zmanim = ZmanimDay(day)
+            for time_group in response_day.time_groups:
+                zmanim.add_zman(decode_zman(time_group))
 
         zmanim.day.is_fast_day = zmanim.is_fast_day()
 
@@ -262,20 +456,25 @@ class ZmanimAPI:
             ZmanimDay: The enriched zmanim
         """
         # loop through the next 3 days to find the next day that is not a second shabbat
+        # the zmanim added to the first day are copies, nothing is shared between days or with ZmanimTypes
         for i in range(1, 4):
 
             # for regular erev shabbat, the next day is shabbat
             if not zmanim_days[i].is_second_e_shabbat():
                 zmanim_days[0].add_zman(
-                    zmanim_days[i].get_zman(ZmanimTypes.ShabbatEndTime)
+                    zmanim_days[i].get_zman(ZmanimTypes.ShabbatEndTime).copy()
                 )
                 return zmanim_days
 
             # add the candle lighting time to the appropriate zmanim type
             if i == 1:
-                extra_candle_lighting = ZmanimTypes.SecondDayCandleLighting
+                extra_candle_lighting = ZmanimTypes.get_zman(
+                    ZmanimTypes.SecondDayCandleLighting.name
+                )
             elif i == 2:
-                extra_candle_lighting = ZmanimTypes.ThirdDayCandleLighting
+                extra_candle_lighting = ZmanimTypes.get_zman(
+                    ZmanimTypes.ThirdDayCandleLighting.name
+                )
             # a third day is not possible here
 
             if ZmanimTypes.ShabbatEndTime.name not in zmanim_days[i].zmanim:
@@ -292,8 +491,42 @@ class ZmanimAPI:
         return zmanim_days
 
     @staticmethod
-    def call_chabad_api(request: ZmanimRequest) -> dict:
-        return ChabadAPI().get_zmanim(request)
+    def time_zone(location: Location) -> TimeZone:
+        """The time zone of a city or coordinates location, the zmanim of chabad.org are in its local time"""
+        if location.type == LocationType.CITY:
+            return location.city.time_zone or TimeZones.JERUSALEM.value
+        if location.type == LocationType.ZIP_CODE:
+            return zip_codes.time_zone(location.zip_code)
+        return location.coordinates.time_zone
+
+    @classmethod
+    def calendar(cls, location: Location) -> HebrewCalendar:
+        """The local Hebrew calendar with the location's rules (Israel or Diaspora)"""
+        if location.type == LocationType.ZIP_CODE:
+            return cls.calendars[
+                False
+            ]  # US ZIP codes, also without the index that knows their time zone
+        return cls.calendars[is_israel(cls.time_zone(location).name)]
+
+    @classmethod
+    def _fetch_days(
+        cls, location: Location, start_date: date, days: int, lazy: bool
+    ) -> list[ZmanimDay]:
+        if days == 1:
+            request = ZmanimRequest.trusted(location=location, date=start_date)
+        else:
+            request = ZmanimRequest.trusted(
+                location=location,
+                start_date=start_date,
+                end_date=start_date + timedelta(days=days - 1),
+            )
+
+        response = decode_response(cls.call_chabad_api(request))
+        return [cls.format_day(day, lazy) for day in response.days]
+
+    @classmethod
+    def call_chabad_api(cls, request: ZmanimRequest) -> dict:
+        return cls.chabad_api.get_zmanim(request)
 
     @classmethod
     def get_zmanim(
@@ -302,6 +535,8 @@ class ZmanimAPI:
         days: int = 1,
         city: Optional[Cities] = None,
         coordinates: Optional[Coordinates] = None,
+        zip_code: Optional[str] = None,
+        lazy: bool = False,
     ) -> list[ZmanimDay]:
         """Get zmanim for a given city and date from Chabad.org API
         The way this set up, every call will get the zmanim for a week from the given date, to acces
@@ -313,6 +548,8 @@ class ZmanimAPI:
             days (int, optional): The number of days to get zmanim for. Defaults to 1, Max is 180.
             city (Optional[Cities], optional): The city to get zmanim for. Defaults to None. If city is provided, coordinates will be ignored.
             coordinates (Optional[Coordinates], optional): The coordinates to get zmanim for. Defaults to None.
+            zip_code (Optional[str], optional): A US ZIP code, resolved to coordinates offline, or by chabad.org without a ZIP code index (see zip_codes.py). Defaults to None.
+            lazy (bool, optional): Decode each zman only when it is accessed (see LazyZmanimDay), faster when only a few zmanim are used. Defaults to False.
 
         Examples:
 
@@ -330,41 +567,43 @@ class ZmanimAPI:
                 ),
             )
 
+            3. Get zmanim for Crown Heights for 1 day using a US ZIP code
+            response = ZmanimAPI.get_zmanim(date(2021, 9, 17), zip_code="11213")
+
         Returns:
             ZmanimDay: A list of ZmanimDay object containing all the zmanim for the day. sorted by date.
         """
 
         # validate input
-        if city is None and coordinates is None:
-            raise ValueError("Must provide either a city or coordinates")
+        if city is None and coordinates is None and zip_code is None:
+            raise ValueError("Must provide either a city, coordinates or a zip code")
 
         if days < 1 or days >= 180:
-            raise ValueError("Days must be between 1 and 180")
+            raise ValueError(
+                "Days must be between 1 and 180, use iter_zmanim for longer ranges"
+            )
 
-        # set location
+        # set location, the input is already validated so the trusted constructors can be used
         if city is not None:
-            location = Location(city=city.value)
+            location = Location.for_city(city.value)
+        elif coordinates is not None:
+            location = Location.for_coordinates(coordinates)
         else:
-            location = Location(coordinates=coordinates)
+            location = zip_codes.to_location(zip_code)
 
-        # set dates
-        start_date = date
-        end_date = date + timedelta(
-            days=4 if days < 4 else days
-        )  # the minimum number of days we want is 4, because we need to check the next 3 days to get shabbat end times
-
-        request = ZmanimRequest(
-            location=location, start_date=start_date, end_date=end_date
-        )
-
-        response = cls.call_chabad_api(request)
-        zmanim_days: list[ZmanimDay] = []
-
-        for i in response["Days"]:
-            zmanim_days.append(cls.format_response({"Days": [i]}))
+        # an erev shabbat/yom tov needs the next days for the shabbat end and extra candle lighting times,
+        # the local calendar tells how many (up to 3), so other days don't fetch extra days
+        needed = max(days, cls.calendar(location).holy_days_after(date) + 1)
+        zmanim_days = cls._fetch_days(location, date, needed, lazy)
 
         if zmanim_days[0].is_erev_shabbat():
-            zmanim_days = cls.enrich_with_special_times(zmanim_days)
+            try:
+                zmanim_days = cls.enrich_with_special_times(zmanim_days)
+            except IndexError:
+                # chabad.org disagrees with the local calendar, fetch the 3 days after as before
+                zmanim_days = cls.enrich_with_special_times(
+                    cls._fetch_days(location, date, max(days, 5), lazy)
+                )
 
         # add location data to each day
         for day in zmanim_days:
@@ -372,3 +611,82 @@ class ZmanimAPI:
 
         # return only the requested number of days
         return zmanim_days[:days]
+
+    # days yielded from each request of iter_zmanim, each request also gets the next 3 days for the enrichment
+    # (178 + 3 days is the 180 days range chabad.org allows)
+    WINDOW_DAYS = 178
+    LOOKAHEAD_DAYS = 3
+
+    @classmethod
+    def iter_zmanim(
+        cls,
+        location: Location,
+        start: date,
+        end: date,
+        lazy: bool = False,
+        prefetch: bool = True,
+    ) -> Iterator[ZmanimDay]:
+        """Yield the zmanim of every day in [start, end] in order, any length of range
+
+        The range is fetched in windows of WINDOW_DAYS, the next window is fetched in the background while the
+        current one is consumed, so at most two windows are in memory. Every erev shabbat or yom tov is enriched
+        like in get_zmanim, also at the end of a window (each request includes the days after the window).
+
+        Example:
+            >>> for zmanim_day in ZmanimAPI.iter_zmanim(Location.for_city(Cities.JERUSALEM.value), date(2023, 1, 1), date(2025, 12, 31)):
+            ...     print(zmanim_day.day.date, zmanim_day.get_important_zmanim())
+
+        Args:
+            location (Location): The location, e.g. Location.for_city(Cities.JERUSALEM.value) or Location.for_coordinates(coordinates)
+            start (date): The first day.
+            end (date): The last day (included).
+            lazy (bool, optional): Decode each zman only when it is accessed, see get_zmanim. Defaults to False.
+            prefetch (bool, optional): Fetch the next window while the current one is consumed. Defaults to True.
+        """
+        if end < start:
+            raise ValueError("end must not be before start")
+
+        if location.type == LocationType.ZIP_CODE:
+            location = zip_codes.to_location(location.zip_code)
+
+        windows = []
+        window_start = start
+        while window_start <= end:
+            window_days = min(cls.WINDOW_DAYS, (end - window_start).days + 1)
+            windows.append((window_start, window_days))
+            window_start += timedelta(days=window_days)
+
+        def fetch(window: tuple[date, int]) -> list[ZmanimDay]:
+            window_start, window_days = window
+            zmanim_days = cls._fetch_days(
+                location, window_start, window_days + cls.LOOKAHEAD_DAYS, lazy
+            )
+            # in order, so each day sees the following days as they are before their own enrichment (like get_zmanim)
+            for i in range(window_days):
+                if zmanim_days[i].is_erev_shabbat():
+                    cls.enrich_with_special_times(zmanim_days[i : i + 4])
+            zmanim_days = zmanim_days[:window_days]
+            for zmanim_day in zmanim_days:
+                zmanim_day.add_location_data(location)
+            return zmanim_days
+
+        if not prefetch:
+            for window in windows:
+                yield from fetch(window)
+            return
+
+        executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="zmanim-prefetch"
+        )
+        try:
+            future = executor.submit(fetch, windows[0])
+            for next_window in windows[1:] + [None]:
+                zmanim_days = future.result()
+                if next_window is not None:
+                    future = executor.submit(fetch, next_window)
+                yield from zmanim_days
+                del zmanim_days
+        finally:
+            # the generator was closed early, don't wait for a prefetch nobody will use
+            future.cancel()
+            executor.shutdown(wait=False)